@@ -0,0 +1,56 @@
+"""add indexes
+
+Индексы под реальные запросы: фильтры и keyset-пагинация списков,
+внешние ключи и выборки в валидаторах. Индексы строятся
+CREATE INDEX CONCURRENTLY вне транзакции, поэтому миграцию можно
+накатывать на работающую базу без блокировки записи.
+
+Revision ID: d7cac5690ab5
+Revises: 9a828ef9ebb1
+Create Date: 2026-10-18 11:20:21.347409
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7cac5690ab5'
+down_revision: Union[str, None] = '9a828ef9ebb1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = (
+    ('ix_order_created_date_id', 'order', ['created_date', 'id']),
+    (
+        'ix_order_status_created_date_id', 'order',
+        ['status', 'created_date', 'id']
+    ),
+    ('ix_order_ended_date', 'order', ['ended_date']),
+    ('ix_order_customer_id_id', 'order', ['customer_id', 'id']),
+    ('ix_order_worker_id_id', 'order', ['worker_id', 'id']),
+    ('ix_order_outlet_id', 'order', ['outlet_id']),
+    ('ix_visit_created_date_id', 'visit', ['created_date', 'id']),
+    ('ix_visit_order_id', 'visit', ['order_id']),
+    ('ix_visit_customer_id_id', 'visit', ['customer_id', 'id']),
+    ('ix_visit_worker_id', 'visit', ['worker_id']),
+    ('ix_visit_outlet_id', 'visit', ['outlet_id']),
+    ('ix_customer_outlet_id', 'customer', ['outlet_id']),
+    ('ix_worker_outlet_worker_outlet', 'worker_outlet', ['worker', 'outlet']),
+)
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, postgresql_concurrently=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table, postgresql_concurrently=True)
@@ -0,0 +1,56 @@
+"""add idempotency_key
+
+Таблица ответов для повторных POST с заголовком Idempotency-Key.
+
+Revision ID: 3f1b6c2e8a47
+Revises: d7cac5690ab5
+Create Date: 2026-10-18 14:00:12.518304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1b6c2e8a47'
+down_revision: Union[str, None] = 'd7cac5690ab5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotency_key',
+        sa.Column('scope', sa.String(length=64), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column(
+            'response',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True
+        ),
+        sa.Column(
+            'created_date',
+            sa.DateTime(),
+            server_default=sa.text("TIMEZONE('utc', now())"),
+            nullable=False
+        ),
+        sa.Column('expires_date', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('scope', 'key')
+    )
+    op.create_index(
+        'ix_idempotency_key_expires_date',
+        'idempotency_key',
+        ['expires_date']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_idempotency_key_expires_date', table_name='idempotency_key'
+    )
+    op.drop_table('idempotency_key')
@@ -0,0 +1,39 @@
+"""add row version
+
+Версия строки для ETag на GET /order/{order_id} и GET /visit/{visit_id},
+увеличивается при каждом изменении через ORM.
+
+Revision ID: 8c5e2d9b41f0
+Revises: 3f1b6c2e8a47
+Create Date: 2026-10-18 15:00:41.902716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c5e2d9b41f0'
+down_revision: Union[str, None] = '3f1b6c2e8a47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table in ('order', 'visit'):
+        op.add_column(
+            table,
+            sa.Column(
+                'version',
+                sa.Integer(),
+                server_default=sa.text('1'),
+                nullable=False
+            )
+        )
+
+
+def downgrade() -> None:
+    for table in ('visit', 'order'):
+        op.drop_column(table, 'version')
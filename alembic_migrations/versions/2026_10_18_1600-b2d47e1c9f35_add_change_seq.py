@@ -0,0 +1,71 @@
+"""add change_seq
+
+Номер изменения для GET /sync/changes: общий счетчик change_seq,
+столбцы change_seq в order и visit и таблица tombstone для удалений.
+Существующие строки получают номера при добавлении столбца
+(таблицы order и visit переписываются). Индексы по change_seq
+строятся CREATE INDEX CONCURRENTLY вне транзакции, как в d7cac5690ab5.
+
+Revision ID: b2d47e1c9f35
+Revises: 8c5e2d9b41f0
+Create Date: 2026-10-18 16:00:07.314825
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d47e1c9f35'
+down_revision: Union[str, None] = '8c5e2d9b41f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NEXT_CHANGE = sa.text("nextval('change_seq')")
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence('change_seq')))
+    for table in ('order', 'visit'):
+        op.add_column(
+            table,
+            sa.Column(
+                'change_seq',
+                sa.BigInteger(),
+                server_default=NEXT_CHANGE,
+                nullable=False
+            )
+        )
+    op.create_table(
+        'tombstone',
+        sa.Column(
+            'change_seq',
+            sa.BigInteger(),
+            server_default=NEXT_CHANGE,
+            nullable=False
+        ),
+        sa.Column('entity', sa.String(length=16), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('change_seq')
+    )
+    with op.get_context().autocommit_block():
+        for table in ('order', 'visit'):
+            op.create_index(
+                f'ix_{table}_change_seq', table, ['change_seq'],
+                postgresql_concurrently=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in ('visit', 'order'):
+            op.drop_index(
+                f'ix_{table}_change_seq', table,
+                postgresql_concurrently=True
+            )
+    op.drop_table('tombstone')
+    for table in ('visit', 'order'):
+        op.drop_column(table, 'change_seq')
+    op.execute(sa.schema.DropSequence(sa.Sequence('change_seq')))
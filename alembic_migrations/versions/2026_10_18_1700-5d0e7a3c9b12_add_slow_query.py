@@ -0,0 +1,62 @@
+"""add slow_query
+
+Журнал медленных SQL-запросов с планами выполнения.
+
+Revision ID: 5d0e7a3c9b12
+Revises: b2d47e1c9f35
+Create Date: 2026-10-18 17:00:41.227519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0e7a3c9b12'
+down_revision: Union[str, None] = 'b2d47e1c9f35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'slow_query',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column(
+            'created_date',
+            sa.DateTime(),
+            server_default=sa.text("TIMEZONE('utc', now())"),
+            nullable=False
+        ),
+        sa.Column('endpoint', sa.String(length=255), nullable=True),
+        sa.Column('duration_ms', sa.Float(), nullable=False),
+        sa.Column('fingerprint', sa.String(length=16), nullable=False),
+        sa.Column('statement', sa.Text(), nullable=False),
+        sa.Column(
+            'parameters',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True
+        ),
+        sa.Column(
+            'plan',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True
+        ),
+        sa.Column('analyzed', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_slow_query_created_date', 'slow_query', ['created_date']
+    )
+    op.create_index(
+        'ix_slow_query_fingerprint', 'slow_query', ['fingerprint']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_slow_query_fingerprint', table_name='slow_query')
+    op.drop_index('ix_slow_query_created_date', table_name='slow_query')
+    op.drop_table('slow_query')
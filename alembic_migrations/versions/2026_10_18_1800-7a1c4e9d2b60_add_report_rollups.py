@@ -0,0 +1,73 @@
+"""add report rollups
+
+Сводки заказов и посещений по дням для /report/...: order_rollup,
+visit_rollup, ключи учтенных объектов rollup_source и номер
+обработанного изменения rollup_state. Сводки заполняет фоновая
+задача приложения после запуска.
+
+Revision ID: 7a1c4e9d2b60
+Revises: 5d0e7a3c9b12
+Create Date: 2026-10-18 18:00:12.604318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a1c4e9d2b60'
+down_revision: Union[str, None] = '5d0e7a3c9b12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STATUS = postgresql.ENUM(
+    'started', 'ended', 'in_process', 'awaiting', 'canceled',
+    name='status',
+    create_type=False,
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'order_rollup',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('outlet_id', sa.Integer(), nullable=False),
+        sa.Column('worker_id', sa.Integer(), nullable=False),
+        sa.Column('status', STATUS, nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'outlet_id', 'worker_id', 'status')
+    )
+    op.create_table(
+        'visit_rollup',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('outlet_id', sa.Integer(), nullable=False),
+        sa.Column('worker_id', sa.Integer(), nullable=False),
+        sa.Column('visits', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'outlet_id', 'worker_id')
+    )
+    op.create_table(
+        'rollup_source',
+        sa.Column('entity', sa.String(length=16), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('outlet_id', sa.Integer(), nullable=False),
+        sa.Column('worker_id', sa.Integer(), nullable=False),
+        sa.Column('status', STATUS, nullable=True),
+        sa.PrimaryKeyConstraint('entity', 'entity_id')
+    )
+    op.create_table(
+        'rollup_state',
+        sa.Column('name', sa.String(length=16), nullable=False),
+        sa.Column('last_seq', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('rollup_state')
+    op.drop_table('rollup_source')
+    op.drop_table('visit_rollup')
+    op.drop_table('order_rollup')
@@ -0,0 +1,65 @@
+"""idempotency_key customer
+
+Ключ Idempotency-Key уникален только в пределах заказчика: в первичный
+ключ idempotency_key добавлен customer_id. Сохраненные ответы получают
+заказчика созданного заказа или посещения, записи выполняющихся
+запросов (без ответа) удаляются.
+
+Revision ID: c41e8b7d2f95
+Revises: 7a1c4e9d2b60
+Create Date: 2026-10-18 19:00:41.226107
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e8b7d2f95'
+down_revision: Union[str, None] = '7a1c4e9d2b60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CREATED = (('POST /order/', 'order'), ('POST /visit/', 'visit'))
+
+
+def upgrade() -> None:
+    op.add_column(
+        'idempotency_key', sa.Column('customer_id', sa.Integer())
+    )
+    for scope, table in CREATED:
+        op.execute(
+            f'UPDATE idempotency_key SET customer_id = created.customer_id '
+            f'FROM "{table}" AS created '
+            f"WHERE idempotency_key.scope = '{scope}' "
+            f"AND created.id = (idempotency_key.response->>'id')::int"
+        )
+    op.execute('DELETE FROM idempotency_key WHERE customer_id IS NULL')
+    op.alter_column('idempotency_key', 'customer_id', nullable=False)
+    op.drop_constraint(
+        'idempotency_key_pkey', 'idempotency_key', type_='primary'
+    )
+    op.create_primary_key(
+        'idempotency_key_pkey', 'idempotency_key',
+        ['scope', 'customer_id', 'key']
+    )
+
+
+def downgrade() -> None:
+    # у разных заказчиков могут быть одинаковые ключи - остается
+    # самая новая запись
+    op.execute(
+        'DELETE FROM idempotency_key AS old USING idempotency_key AS new '
+        'WHERE old.scope = new.scope AND old.key = new.key '
+        'AND (old.created_date, old.customer_id) '
+        '< (new.created_date, new.customer_id)'
+    )
+    op.drop_constraint(
+        'idempotency_key_pkey', 'idempotency_key', type_='primary'
+    )
+    op.create_primary_key(
+        'idempotency_key_pkey', 'idempotency_key', ['scope', 'key']
+    )
+    op.drop_column('idempotency_key', 'customer_id')
@@ -1,6 +1,11 @@
 from starlette_admin.contrib.sqla import Admin, ModelView
 from app.core.database import async_engine
 from app.models.models import Worker, Order, Outlet, Customer, Visit
+from app.models.slow_query import SlowQuery
+
+# Версию и номер изменения заказа и посещения выдает база,
+# в формах создания и изменения их нет
+SERVER_FIELDS = ['version', 'change_seq']
 
 
 class WorkerView(ModelView):
@@ -9,7 +14,8 @@ class WorkerView(ModelView):
 
 
 class OrderView(ModelView):
-    ...
+    exclude_fields_from_create = SERVER_FIELDS
+    exclude_fields_from_edit = SERVER_FIELDS
 
 
 class CustomerView(ModelView):
@@ -22,7 +28,24 @@ class OutletView(ModelView):
 
 
 class VisitView(ModelView):
-    ...
+    exclude_fields_from_create = SERVER_FIELDS
+    exclude_fields_from_edit = SERVER_FIELDS
+
+
+class SlowQueryView(ModelView):
+    '''Журнал медленных запросов только для просмотра.'''
+    fields_default_sort = [('created_date', True)]
+    searchable_fields = ['endpoint', 'fingerprint', 'statement']
+    exclude_fields_from_list = ['parameters', 'plan']
+
+    def can_create(self, request) -> bool:
+        return False
+
+    def can_edit(self, request) -> bool:
+        return False
+
+    def can_delete(self, request) -> bool:
+        return False
 
 
 admin = Admin(async_engine, title="База данных")
@@ -30,4 +53,5 @@ admin.add_view(WorkerView(Worker))
 admin.add_view(OrderView(Order))
 admin.add_view(OutletView(Outlet))
 admin.add_view(CustomerView(Customer))
-admin.add_view(VisitView(Visit))
\ No newline at end of file
+admin.add_view(VisitView(Visit))
+admin.add_view(SlowQueryView(SlowQuery))
\ No newline at end of file
@@ -0,0 +1,57 @@
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from app.api.validators import AUTH_REQUIRED, TOKEN_CUSTOMER_MISMATCH
+from app.core.security import TokenClaims, token_signer
+
+INVALID_TOKEN = 'Токен недействителен или просрочен, получите новый.'
+
+bearer = HTTPBearer(
+    auto_error=False,
+    description=(
+        'Токен из POST /auth/login вместо customer_id и phone_number '
+        'в запросе'
+    ),
+)
+
+
+async def get_token_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)
+) -> Optional[TokenClaims]:
+    '''Данные токена из заголовка Authorization: Bearer
+    или None, если заголовка нет.'''
+    if credentials is None:
+        return None
+    claims = token_signer.read(credentials.credentials)
+    if claims is None:
+        raise HTTPException(
+            status_code=401,
+            detail=INVALID_TOKEN,
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+    return claims
+
+
+def resolve_customer_id(
+    claims: Optional[TokenClaims],
+    customer_id: Optional[int],
+    phone_number: Optional[str],
+) -> int:
+    '''id заказчика, от имени которого выполняется запрос: из токена,
+    а без токена - переданный customer_id (тогда обязателен
+    и проверяется phone_number).'''
+    if claims is not None:
+        if customer_id is not None and customer_id != claims.customer_id:
+            raise HTTPException(
+                status_code=403, detail=TOKEN_CUSTOMER_MISMATCH
+            )
+        return claims.customer_id
+    if customer_id is None or phone_number is None:
+        raise HTTPException(
+            status_code=401,
+            detail=AUTH_REQUIRED,
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+    return customer_id
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.write_validators import (
+    check_customer, check_phone_number, get_order_write_facts
+)
+from app.core.database import get_async_session
+from app.core.security import token_signer
+from app.schemas.auth import LoginRequest, Token
+
+
+router = APIRouter(
+    prefix='/auth',
+    tags=['Auth']
+)
+
+
+@router.post('/login', response_model=Token)
+async def login(
+    login_in: LoginRequest,
+    session: AsyncSession = Depends(get_async_session),
+) -> Token:
+    '''Проверяет customer_id и phone_number и выдает подписанный токен.
+    С заголовком Authorization: Bearer <токен> ручки записи заказов
+    и посещений не проверяют заказчика в базе до истечения токена.'''
+    facts = await get_order_write_facts(
+        session, customer_id=login_in.customer_id
+    )
+    check_customer(facts)
+    check_phone_number(facts, login_in.phone_number)
+    return Token(
+        access_token=token_signer.issue(
+            facts.customer_id, facts.customer_outlet_id
+        ),
+        expires_in=token_signer.ttl,
+    )
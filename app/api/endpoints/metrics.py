@@ -0,0 +1,79 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.admission import READ, WRITE, admission
+from app.core.database import async_engine
+from app.core.metrics import request_metrics
+from app.core.replicas import replicas
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Показатели пулов соединений: текущие значения и счетчики
+POOL_GAUGES = ('checked_out', 'checked_in', 'overflow')
+POOL_COUNTERS = ('checkouts', 'timeouts')
+# Показатели допуска запросов к базе
+ADMISSION_GAUGES = ('limit', 'active', 'queued')
+
+router = APIRouter(tags=['Stats'])
+
+
+def _pool_lines() -> list[str]:
+    pools = [('primary', async_engine.pool)] + [
+        (f'replica{index}', replica.engine.pool)
+        for index, replica in enumerate(replicas.replicas)
+    ]
+    metrics = [(name, pool.metrics()) for name, pool in pools]
+    lines = []
+    for gauge in POOL_GAUGES:
+        lines.append(f'# TYPE db_pool_{gauge} gauge')
+        lines.extend(
+            f'db_pool_{gauge}{{pool="{name}"}} {values[gauge]}'
+            for name, values in metrics
+        )
+    for counter in POOL_COUNTERS:
+        lines.append(f'# TYPE db_pool_{counter}_total counter')
+        lines.extend(
+            f'db_pool_{counter}_total{{pool="{name}"}} {values[counter]}'
+            for name, values in metrics
+        )
+    return lines
+
+
+def _admission_lines() -> list[str]:
+    if admission is None:
+        return []
+    metrics = admission.metrics()
+    classes = [(name, metrics[name]) for name in (READ, WRITE)]
+    lines = []
+    for gauge in ADMISSION_GAUGES:
+        lines.append(f'# TYPE admission_{gauge} gauge')
+        lines.extend(
+            f'admission_{gauge}{{class="{name}"}} {values[gauge]}'
+            for name, values in classes
+        )
+    lines.append('# TYPE admission_admitted_total counter')
+    lines.extend(
+        f'admission_admitted_total{{class="{name}"}} {values["admitted"]}'
+        for name, values in classes
+    )
+    lines.append('# TYPE admission_rejected_total counter')
+    for name, values in classes:
+        for status in (429, 503):
+            lines.append(
+                f'admission_rejected_total{{class="{name}",'
+                f'status="{status}"}} {values[f"rejected_{status}"]}'
+            )
+    return lines
+
+
+@router.get(
+    '/metrics',
+    response_class=PlainTextResponse,
+)
+async def get_metrics() -> PlainTextResponse:
+    '''Метрики в текстовом формате Prometheus: время ответа,
+    число SQL-запросов и время в базе по ручкам, состояние пулов
+    соединений и очереди допуска запросов к базе.'''
+    lines = request_metrics.render() + _pool_lines() + _admission_lines()
+    return PlainTextResponse(
+        '\n'.join(lines) + '\n', media_type=PROMETHEUS_CONTENT_TYPE
+    )
@@ -1,22 +1,43 @@
-from datetime import datetime
-from typing import Optional, Sequence
+from typing import Any, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import and_, select
+from fastapi import (
+    APIRouter, Body, Depends, Header, HTTPException, Query, Response
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.auth import get_token_claims, resolve_customer_id
+from app.api.etag import make_etag, not_modified
+from app.api.events import stream_events
+from app.api.export import ExportFormat, export_columns, stream_export
+from app.api.fast_json import json_page
+from app.api.filters import order_filters
+from app.api.idempotency import get_idempotency_key, idempotent_requests
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
 from app.api.validators import (
-    check_customer_his_own_outlet,
-    check_customer_with_number, check_order_exists,
-    check_that_customer_exist,
-    check_worker_in_outlet,
-    check_that_current_customer_with_current_order
-    )
+    EVENTS_SUBSCRIBER_REQUIRED, ORDER_DOES_NOT_EXIST, ORDER_NOT_FOUND,
+    STATUS_SELECTOR_REQUIRED, check_order_exists, check_worker_phone_number
+)
+from app.api.write_validators import (
+    check_customer, check_customer_order, check_order_found, check_outlet,
+    check_phone_number, check_status_transition, check_worker_outlet,
+    get_order_write_facts, status_transition_error, validate_orders_bulk
+)
+from app.core.admission import release_early
+from app.core.config import settings
 from app.core.database import get_async_session
-from app.crud.order import create_order, delete_order, update_order
-from app.models.models import Customer, Order, Status
+from app.core.notify import order_events
+from app.core.replicas import get_read_session
+from app.core.security import TokenClaims
+from app.crud.order import (
+    change_orders_status, create_order, create_orders, delete_order,
+    update_order
+)
+from app.models.models import Order
 from app.schemas.order import (
-    OrderCreate, OrderDB, OrderUpdate, OrderUpdateStatus
+    OrderBulkItemResult, OrderCreate, OrderCreateByPhone, OrderDB, OrderPage,
+    OrderStatusBulk, OrderStatusBulkResult, OrderUpdate, OrderUpdateStatus
 )
 
 
@@ -27,76 +48,163 @@ router = APIRouter(
 
 
 @router.post(
-    '/'
+    '/',
+    response_model=OrderDB
 )
 async def create_new_order(
     order_in: OrderCreate,
-    session: AsyncSession = Depends(get_async_session)
-) -> Order:
+    session: AsyncSession = Depends(get_async_session),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+) -> Any:
     '''Для создания заказа обязательно
     нужно передать customer_id и phone_number
-    по которым происходит проверка пользователя
+    по которым происходит проверка пользователя,
+    либо токен из POST /auth/login в заголовке Authorization.
+    Повтор запроса с тем же заголовком Idempotency-Key
+    вернет первый ответ и не создаст второй заказ.
     '''
-    customer: Customer = await check_that_customer_exist(
-        customer_id=order_in.customer_id, session=session
+    order_in.customer_id = resolve_customer_id(
+        claims, order_in.customer_id, order_in.phone_number
     )
-    await check_customer_with_number(customer, order_in.phone_number)
-    await check_customer_his_own_outlet(customer, order_in)
-    if order_in.outlet_id and order_in.worker_id:
-        await check_worker_in_outlet(
-            order_in.worker_id,
-            order_in.outlet_id,
-            session
+
+    async def create() -> Row:
+        facts = await get_order_write_facts(
+            session,
+            customer_id=order_in.customer_id,
+            worker_id=order_in.worker_id,
+            outlet_id=order_in.outlet_id,
+            claims=claims,
         )
-    new_order: Order = await create_order(order_in, session)
-    return new_order
+        check_customer(facts)
+        check_phone_number(facts, order_in.phone_number)
+        check_outlet(facts, order_in.outlet_id)
+        check_worker_outlet(facts)
+        return await create_order(
+            order_in, session, commit=idempotency_key is None
+        )
+
+    return await idempotent_requests.run(
+        session, 'POST /order/', order_in.customer_id, idempotency_key,
+        order_in, create, OrderDB
+    )
+
+
+@router.post(
+    '/bulk',
+    response_model=list[OrderBulkItemResult],
+    response_model_exclude_none=True
+)
+async def create_orders_bulk(
+    orders_in: list[OrderCreateByPhone] = Body(
+        ..., max_length=settings.BULK_MAX_SIZE
+    ),
+    session: AsyncSession = Depends(get_async_session)
+) -> list[dict]:
+    '''Создание пачки заказов одним запросом. Каждый заказ
+    проверяется так же, как при создании через POST /order/,
+    результат возвращается по каждому заказу в порядке передачи:
+    созданный заказ или код и текст ошибки.
+    '''
+    errors = await validate_orders_bulk(session, orders_in)
+    created = iter(await create_orders(
+        [order for order, error in zip(orders_in, errors) if error is None],
+        session
+    ))
+    results = []
+    for index, error in enumerate(errors):
+        if error is None:
+            results.append(
+                {'index': index, 'status_code': 200, 'order': next(created)}
+            )
+        else:
+            results.append({
+                'index': index,
+                'status_code': error.status_code,
+                'detail': error.detail,
+            })
+    return results
 
 
 @router.get(
     '/',
-    response_model=list[OrderDB],
+    response_model=OrderPage,
     response_model_exclude_none=True
 )
 async def get_all_orders(
-    session: AsyncSession = Depends(get_async_session),
-    status: Optional[Status] = None,
-    created_start: Optional[datetime] = Query(
-        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
-    ),
-    created_end: Optional[datetime] = Query(
-        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
-    ),
-    ended_start: Optional[datetime] = Query(
-        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
-    ),
-    ended_end: Optional[datetime] = Query(
-        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
+    session: AsyncSession = Depends(get_read_session),
+    filters: list = Depends(order_filters),
+    cursor: Optional[str] = Query(
+        None, description="Значение next_cursor из предыдущей страницы"
     ),
-) -> Sequence[Order]:
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+) -> Response:
     '''Для получения списка заказов не обязательно
     нужно передать customer_id и phone_number
     по которым происходит проверка пользователя.
     Реализована фильтрация статусу и по дате создания и завершения заказа.
     Формат времени должен соответствевать данному шаблону YYYY-MM-DDTHH:MM:SS.
+    Список отдается страницами по limit заказов, отсортированных
+    по дате создания. Чтобы получить следующую страницу, передайте
+    next_cursor из ответа в параметр cursor с теми же фильтрами.
     '''
-    query = select(Order)
-    if status:
-        query = query.where(Order.status == status)
-    if created_start and created_end:
-        query = query.where(and_(
-            Order.created_date >= created_start,
-            Order.created_date <= created_end
-            )
-        )
+    query = select(*export_columns(Order, OrderDB)).where(*filters)
+    query = paginate(query, Order, cursor, limit)
+    result = await session.execute(query)
+    return json_page(result.all(), limit)
 
-    if ended_start and ended_end:
-        query = query.where(and_(
-            Order.ended_date >= ended_start,
-            Order.ended_date <= ended_end
-            )
-        )
-    db_objs = await session.execute(query)
-    return db_objs.scalars().all()
+
+@router.get(
+    '/export',
+    response_class=StreamingResponse,
+)
+async def export_orders(
+    session: AsyncSession = Depends(get_read_session),
+    filters: list = Depends(order_filters),
+    format: ExportFormat = ExportFormat.ndjson,
+) -> StreamingResponse:
+    '''Выгрузка всех заказов в формате ndjson или csv.
+    Принимает те же фильтры, что и получение списка заказов,
+    данные отдаются потоком без постраничной разбивки.
+    '''
+    query = (
+        select(*export_columns(Order, OrderDB))
+        .where(*filters)
+        .order_by(Order.created_date, Order.id)
+    )
+    return stream_export(session, query, OrderDB, format, 'orders')
+
+
+@router.get(
+    '/events',
+    response_class=StreamingResponse,
+)
+async def stream_order_events(
+    phone_number: str,
+    customer_id: Optional[int] = Query(None, gt=0),
+    worker_id: Optional[int] = Query(None, gt=0),
+    session: AsyncSession = Depends(get_read_session),
+) -> StreamingResponse:
+    '''Поток событий (Server-Sent Events) по заказам заказчика
+    customer_id или работника worker_id: created, updated, deleted
+    с id, status, customer_id и worker_id заказа. Событие resync
+    значит, что часть событий пропущена, и изменения нужно
+    догрузить через GET /sync/changes.
+    '''
+    if (customer_id is None) == (worker_id is None):
+        raise HTTPException(status_code=400, detail=EVENTS_SUBSCRIBER_REQUIRED)
+    if customer_id is not None:
+        facts = await get_order_write_facts(session, customer_id=customer_id)
+        check_customer(facts)
+        check_phone_number(facts, phone_number)
+        keys = [('customer', customer_id)]
+    else:
+        await check_worker_phone_number(worker_id, phone_number, session)
+        keys = [('worker', worker_id)]
+    # соединение с базой и место в допуске освобождаются до начала потока
+    await session.close()
+    release_early(session)
+    return stream_events(order_events, keys)
 
 
 @router.get(
@@ -106,13 +214,23 @@ async def get_all_orders(
 )
 async def get_order(
     order_id: int,
-    session: AsyncSession = Depends(get_async_session)
-) -> Order:
+    response: Response,
+    session: AsyncSession = Depends(get_read_session),
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
     '''Для получения списка заказов
     не обязательно нужно передать customer_id и phone_number
-    по которым происходит проверка пользователя
+    по которым происходит проверка пользователя.
+    Ответ содержит ETag, с заголовком If-None-Match, совпадающим
+    с текущим ETag, вернется 304 без тела.
     '''
+    unchanged = await not_modified(
+        session, Order, order_id, if_none_match, ORDER_DOES_NOT_EXIST
+    )
+    if unchanged is not None:
+        return unchanged
     order: Order = await check_order_exists(order_id, session)
+    response.headers['ETag'] = make_etag(order.version)
     return order
 
 
@@ -124,33 +242,31 @@ async def partially_update_order(
     order_id: int,
     order_in: OrderUpdate,
     session: AsyncSession = Depends(get_async_session),
-) -> Order:
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+) -> Row:
     '''Для редактирования заказа обязательно
     нужно передать customer_id и phone_number
-    по которым происходит проверка пользователя'''
+    по которым происходит проверка пользователя,
+    либо токен из POST /auth/login в заголовке Authorization'''
 
-    order: Order = await get_order_by_id(order_id, session)
-    customer: Customer = await check_that_customer_exist(
-        customer_id=order_in.customer_id, session=session
+    order_in.customer_id = resolve_customer_id(
+        claims, order_in.customer_id, order_in.phone_number
     )
-    await check_customer_with_number(customer, order_in.phone_number)
-    await check_that_current_customer_with_current_order(
-        order_id, customer, session
+    facts = await get_order_write_facts(
+        session,
+        customer_id=order_in.customer_id,
+        order_id=order_id,
+        worker_id=order_in.worker_id,
+        outlet_id=order_in.outlet_id,
+        claims=claims,
     )
-    await check_customer_his_own_outlet(customer, order_in)
-    if order_in.outlet_id and order_in.worker_id:
-        await check_worker_in_outlet(
-            order_in.worker_id, order_in.outlet_id, session
-        )
-    elif order_in.outlet_id:
-        await check_worker_in_outlet(
-            order.worker_id, order_in.outlet_id, session
-        )
-    elif order_in.worker_id:
-        await check_worker_in_outlet(
-            order_in.worker_id, order.outlet_id, session
-        )
-    new_order: Order = await update_order(order, order_in, session)
+    order: Order = check_order_found(facts)
+    check_customer(facts)
+    check_phone_number(facts, order_in.phone_number)
+    check_customer_order(facts)
+    check_outlet(facts, order_in.outlet_id)
+    check_worker_outlet(facts)
+    new_order: Row = await update_order(order, order_in, session)
     return new_order
 
 
@@ -163,21 +279,107 @@ async def update_order_status(
     order_id: int,
     order_status: OrderUpdateStatus,
     session: AsyncSession = Depends(get_async_session),
-) -> Order:
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+) -> Row:
     '''Для редактирования статуса в заказе обязательно
     нужно передать customer_id и phone_number
-    по которым происходит проверка пользователя'''
+    по которым происходит проверка пользователя,
+    либо токен из POST /auth/login в заголовке Authorization'''
 
-    order: Order = await get_order_by_id(order_id, session)
-    customer: Customer = await check_that_customer_exist(
-        customer_id=order_status.customer_id, session=session
+    order_status.customer_id = resolve_customer_id(
+        claims, order_status.customer_id, order_status.phone_number
     )
-    await check_that_current_customer_with_current_order(
-        order.id, customer, session
+    facts = await get_order_write_facts(
+        session,
+        customer_id=order_status.customer_id,
+        order_id=order_id,
+        claims=claims,
     )
-    await check_customer_with_number(customer, order_status.phone_number)
-    new_order: Order = await update_order(order, order_status, session)
-    return new_order
+    check_order_found(facts)
+    check_customer(facts)
+    check_customer_order(facts)
+    check_phone_number(facts, order_status.phone_number)
+    check_status_transition(facts, order_status.status)
+    # переход проверяется еще раз в UPDATE: статус мог измениться
+    # после чтения фактов
+    rows = await change_orders_status(
+        session, facts.customer_id, order_status.status, [order_id], []
+    )
+    if not rows:
+        raise HTTPException(status_code=404, detail=ORDER_NOT_FOUND)
+    row = rows[0]
+    if row.id is None:
+        raise HTTPException(
+            status_code=422,
+            detail=status_transition_error(
+                row.old_status, order_status.status
+            ),
+        )
+    return row
+
+
+@router.put(
+    '/change-status',
+    response_model=OrderStatusBulkResult,
+    tags=['Change status']
+)
+async def update_orders_status(
+    bulk_in: OrderStatusBulk,
+    session: AsyncSession = Depends(get_async_session),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+) -> dict:
+    '''Перевод заказов заказчика в статус status одним запросом.
+    Заказы выбираются по списку order_ids и (или) по торговой точке,
+    работнику и промежутку дат создания. Проверка пользователя
+    такая же, как при смене статуса одного заказа.
+    Переводятся только заказы, для которых переход разрешен,
+    остальные возвращаются в rejected с причиной.
+    '''
+    if not bulk_in.order_ids and not any((
+        bulk_in.outlet_id, bulk_in.worker_id,
+        bulk_in.created_start, bulk_in.created_end,
+    )):
+        raise HTTPException(status_code=422, detail=STATUS_SELECTOR_REQUIRED)
+    facts = await get_order_write_facts(
+        session,
+        customer_id=resolve_customer_id(
+            claims, bulk_in.customer_id, bulk_in.phone_number
+        ),
+        claims=claims,
+    )
+    check_customer(facts)
+    check_phone_number(facts, bulk_in.phone_number)
+    filters = []
+    if bulk_in.outlet_id:
+        filters.append(Order.outlet_id == bulk_in.outlet_id)
+    if bulk_in.worker_id:
+        filters.append(Order.worker_id == bulk_in.worker_id)
+    if bulk_in.created_start:
+        filters.append(Order.created_date >= bulk_in.created_start)
+    if bulk_in.created_end:
+        filters.append(Order.created_date <= bulk_in.created_end)
+    rows = await change_orders_status(
+        session, facts.customer_id, bulk_in.status, bulk_in.order_ids, filters
+    )
+    updated, rejected = [], []
+    for row in rows:
+        if row.id is not None:
+            updated.append(row)
+        else:
+            rejected.append({
+                'id': row.target_id,
+                'status': row.old_status,
+                'detail': status_transition_error(
+                    row.old_status, bulk_in.status
+                ),
+            })
+    found = {row.target_id for row in rows}
+    rejected.extend(
+        {'id': order_id, 'detail': ORDER_NOT_FOUND}
+        for order_id in dict.fromkeys(bulk_in.order_ids or ())
+        if order_id not in found
+    )
+    return {'updated': updated, 'rejected': rejected}
 
 
 @router.delete(
@@ -188,39 +390,28 @@ async def update_order_status(
 )
 async def delete_order_by_id(
     order_id: int,
-    customer_id: int,
-    phone_number: str,
-    session: AsyncSession = Depends(get_async_session)
-) -> Order:
+    customer_id: Optional[int] = None,
+    phone_number: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+) -> Row:
     '''Для удаления заказе обязательно
     нужно передать customer_id и phone_number
-    по которым происходит проверка пользователя'''
+    по которым происходит проверка пользователя,
+    либо токен из POST /auth/login в заголовке Authorization'''
 
-    db_order: Order = await get_order_by_id(
-        order_id, session
-    )
-    customer: Customer = await check_that_customer_exist(
-        customer_id=customer_id, session=session
-    )
-    await check_customer_with_number(customer, phone_number)
-    await check_that_current_customer_with_current_order(
-       order_id, customer, session
+    facts = await get_order_write_facts(
+        session,
+        customer_id=resolve_customer_id(claims, customer_id, phone_number),
+        order_id=order_id,
+        claims=claims,
     )
+    db_order: Order = check_order_found(facts)
+    check_customer(facts)
+    check_phone_number(facts, phone_number)
+    check_customer_order(facts)
 
-    order: Order = await delete_order(
+    order: Row = await delete_order(
         db_order, session
     )
     return order
-
-
-async def get_order_by_id(
-        order_id: int,
-        session: AsyncSession,
-) -> Order:
-    db_order = await session.get(Order, order_id)
-    if db_order is None:
-        raise HTTPException(
-            status_code=404,
-            detail='Заказ не найден.'
-        )
-    return db_order
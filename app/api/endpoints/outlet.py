@@ -1,11 +1,11 @@
 from typing import Sequence
 from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from sqlalchemy import or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_async_session
+from app.core.replicas import get_read_session
+from app.crud.membership import worker_outlet_ids_select
 from app.models.models import Customer, Outlet, Worker
-from app.models.worker_outlet import worker_outlet
 from app.schemas.outlet import OutletDB
 
 
@@ -20,18 +20,22 @@ router = APIRouter(
     response_model=list[OutletDB])
 async def get_outlets(
     phone_number: str,
-    session: AsyncSession = Depends(get_async_session)
+    session: AsyncSession = Depends(get_read_session)
 ) -> Sequence[Outlet]:
+    '''Торговые точки работника или заказчика с данным номером телефона.'''
+    worker_ids = select(Worker.id).where(Worker.phone_number == phone_number)
+    customer_outlets = select(Customer.outlet_id).where(
+        Customer.phone_number == phone_number
+    )
     stmt = (
-            select(Outlet).
-            join(Outlet.customers).
-            join(worker_outlet).
-            join(Worker).where(
-                        Worker.phone_number == phone_number or
-                        Customer.phone_number == phone_number
-                    )
-            )
+        select(Outlet)
+        .where(or_(
+            Outlet.id.in_(worker_outlet_ids_select(worker_ids)),
+            Outlet.id.in_(customer_outlets),
+        ))
+        .order_by(Outlet.id)
+    )
 
     result = await session.execute(stmt)
-    outlets = result.scalars().unique().all()
+    outlets = result.scalars().all()
     return outlets
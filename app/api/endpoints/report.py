@@ -0,0 +1,58 @@
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.replicas import get_read_session
+from app.crud.report import get_orders_report, get_visits_report
+from app.schemas.report import OrderReportRow, VisitReportRow
+
+
+router = APIRouter(
+    prefix='/report',
+    tags=['Report']
+)
+
+
+async def report_filters(
+    day_start: Optional[date] = Query(
+        None, description="Шаблон даты YYYY-MM-DD"
+    ),
+    day_end: Optional[date] = Query(
+        None, description="Шаблон даты YYYY-MM-DD"
+    ),
+    outlet_id: Optional[int] = Query(None, gt=0),
+    worker_id: Optional[int] = Query(None, gt=0),
+) -> dict:
+    return {
+        'day_start': day_start,
+        'day_end': day_end,
+        'outlet_id': outlet_id,
+        'worker_id': worker_id,
+    }
+
+
+@router.get('/orders', response_model=list[OrderReportRow])
+async def report_orders(
+    filters: dict = Depends(report_filters),
+    session: AsyncSession = Depends(get_read_session),
+) -> list:
+    '''Число заказов по дням создания, торговым точкам и статусам.
+    Считается по сводке order_rollup, которую фоновая задача
+    догоняет до изменений заказов раз в REPORT_REFRESH_INTERVAL
+    секунд. outlet_id = null - заказы без торговой точки.
+    '''
+    return await get_orders_report(session, **filters)
+
+
+@router.get('/visits', response_model=list[VisitReportRow])
+async def report_visits(
+    filters: dict = Depends(report_filters),
+    session: AsyncSession = Depends(get_read_session),
+) -> list:
+    '''Число посещений по дням создания и работникам.
+    Считается по сводке visit_rollup, как GET /report/orders.
+    worker_id = null - посещения без работника.
+    '''
+    return await get_visits_report(session, **filters)
@@ -0,0 +1,51 @@
+from fastapi import APIRouter
+
+from app.core.admission import admission
+from app.core.database import async_engine
+from app.core.replicas import replicas
+from app.crud import group_commit
+from app.crud.customer_cache import customer_identity_cache
+
+
+router = APIRouter(
+    prefix='/stats',
+    tags=['Stats'],
+)
+
+
+@router.get('/customer-cache')
+async def get_customer_cache_stats() -> dict:
+    '''Попадания и промахи кэша заказчиков.'''
+    return customer_identity_cache.stats()
+
+
+@router.get('/db-pool')
+async def get_db_pool_stats() -> dict:
+    '''Пулы соединений основной базы и реплик: занятые и свободные
+    соединения, соединения сверх pool_size, среднее и максимальное
+    ожидание соединения и отказы по таймауту с запуска процесса.'''
+    return {
+        'primary': async_engine.pool.metrics(),
+        'replicas': [
+            replica.engine.pool.metrics() for replica in replicas.replicas
+        ],
+    }
+
+
+@router.get('/admission')
+async def get_admission_stats() -> dict:
+    '''Допуск запросов к базе по классам чтения и записи: лимит,
+    занятые места, длина очереди, допущенные и отклоненные запросы
+    (429 - очередь заказчика, 503 - перегрузка).'''
+    if admission is None:
+        return {}
+    return admission.metrics()
+
+
+@router.get('/visit-group-commit')
+async def get_visit_group_commit_stats() -> dict:
+    '''Групповой коммит посещений: записанные пакеты и строки,
+    средний размер пакета и посещения, ждущие записи.'''
+    if group_commit.visit_group_commit is None:
+        return {}
+    return group_commit.visit_group_commit.stats()
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.pagination import MAX_PAGE_SIZE
+from app.core.database import get_async_session
+from app.crud.changes import get_changes
+from app.schemas.sync import Changes
+
+# Размер порции изменений по умолчанию
+DEFAULT_CHANGES_LIMIT = 200
+
+router = APIRouter(
+    prefix='/sync',
+    tags=['Sync'],
+)
+
+
+@router.get(
+    '/changes',
+    response_model=Changes,
+)
+async def get_sync_changes(
+    since: int = Query(
+        0, ge=0, description='Значение next_since из предыдущего ответа'
+    ),
+    limit: int = Query(DEFAULT_CHANGES_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_async_session),
+) -> dict:
+    '''Заказы и посещения, созданные или измененные после since,
+    и id удаленных (deleted). Первый запрос делается с since=0,
+    дальше передается next_since из ответа. Пока has_more=true,
+    можно сразу запрашивать следующую порцию.
+    '''
+    return await get_changes(session, since, limit)
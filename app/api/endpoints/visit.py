@@ -1,20 +1,37 @@
-from datetime import datetime
-from typing import Optional, Sequence
+from typing import Any, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import and_, select
+from fastapi import APIRouter, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.auth import get_token_claims, resolve_customer_id
+from app.api.etag import make_etag, not_modified
+from app.api.export import ExportFormat, export_columns, stream_export
+from app.api.fast_json import json_page
+from app.api.filters import visit_filters
+from app.api.idempotency import get_idempotency_key, idempotent_requests
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
 from app.api.validators import (
-    check_customer_his_own_outlet_and_ended_date_not_expired,
-    check_customer_with_number,
-    check_that_current_customer_with_current_visit, check_that_customer_exist,
-    check_that_order_not_have_visit, check_visit_exists,
-    check_worker_in_order)
+    SYNC_REJECTED_BY_DB, VISIT_DOES_NOT_EXIST, check_visit_exists
+)
+from app.api.write_validators import (
+    check_customer, check_customer_visit, check_order_not_expired,
+    check_order_not_have_visit, check_outlet, check_phone_number,
+    check_visit_found, check_worker_order, get_visit_write_facts,
+    validate_visits_sync
+)
 from app.core.database import get_async_session
-from app.crud.visit import create_visit, delete_visit, update_visit
-from app.models.models import Customer, Visit
-from app.schemas.visit import VisitCreate, VisitDB, VisitUpdate
+from app.core.replicas import get_read_session
+from app.core.security import TokenClaims
+from app.crud.visit import (
+    create_visit, delete_visit, sync_visits, update_visit
+)
+from app.models.models import Visit
+from app.schemas.visit import (
+    VisitCreate, VisitDB, VisitPage, VisitSync, VisitSyncItemResult,
+    VisitUpdate
+)
 
 
 router = APIRouter(
@@ -23,61 +40,131 @@ router = APIRouter(
 )
 
 
-@router.post('/')
+@router.post('/', response_model=VisitDB)
 async def create_new_visit(
     visit_in: VisitCreate,
-    session: AsyncSession = Depends(get_async_session)
-) -> Visit:
+    session: AsyncSession = Depends(get_async_session),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+) -> Any:
     '''Для создания посещения обязательно
     нужно передать customer_id и phone_number
-    по которым происходит проверка пользователя
+    по которым происходит проверка пользователя,
+    либо токен из POST /auth/login в заголовке Authorization.
+    Повтор запроса с тем же заголовком Idempotency-Key
+    вернет первый ответ и не создаст второе посещение.
     '''
-    await check_that_order_not_have_visit(session, visit_in)
-    customer: Customer = await check_that_customer_exist(
-        customer_id=visit_in.customer_id, session=session
+    visit_in.customer_id = resolve_customer_id(
+        claims, visit_in.customer_id, visit_in.phone_number
     )
-    await check_customer_with_number(customer, visit_in.phone_number)
-    await check_customer_his_own_outlet_and_ended_date_not_expired(
-        session, customer, visit_in
-    )
-    if visit_in.outlet_id and visit_in.worker_id:
-        await check_worker_in_order(
-            visit_in.worker_id,
-            visit_in.outlet_id,
-            session
+
+    async def create() -> Row:
+        facts = await get_visit_write_facts(
+            session,
+            customer_id=visit_in.customer_id,
+            order_id=visit_in.order_id,
+            worker_id=visit_in.worker_id,
+            claims=claims,
+        )
+        check_order_not_have_visit(facts)
+        check_customer(facts)
+        check_phone_number(facts, visit_in.phone_number)
+        check_outlet(facts, visit_in.outlet_id)
+        check_order_not_expired(facts)
+        check_worker_order(facts)
+        return await create_visit(
+            visit_in, session, commit=idempotency_key is None
         )
-    new_visit: Visit = await create_visit(visit_in, session)
 
-    return new_visit
+    return await idempotent_requests.run(
+        session, 'POST /visit/', visit_in.customer_id, idempotency_key,
+        visit_in, create, VisitDB
+    )
+
+
+@router.post(
+    '/sync',
+    response_model=list[VisitSyncItemResult],
+    response_model_exclude_none=True
+)
+async def sync_device_visits(
+    sync_in: VisitSync,
+    session: AsyncSession = Depends(get_async_session)
+) -> list[dict]:
+    '''Отправка накопленных на устройстве посещений одним запросом.
+    Элементы (op=create или op=update) проверяются по порядку так же,
+    как в POST /visit/ и PATCH /visit/{visit_id}, и записываются одной
+    транзакцией. Для каждого элемента возвращается id посещения
+    или код и текст ошибки.
+    '''
+    errors, changes = await validate_visits_sync(session, sync_in.items)
+    ids = iter(await sync_visits(changes, session))
+    results = []
+    for index, error in enumerate(errors):
+        visit_id = next(ids) if error is None else None
+        if error is None and visit_id is None:
+            results.append({
+                'index': index,
+                'status_code': 409,
+                'detail': SYNC_REJECTED_BY_DB,
+            })
+        elif error is None:
+            results.append(
+                {'index': index, 'status_code': 200, 'id': visit_id}
+            )
+        else:
+            results.append({
+                'index': index,
+                'status_code': error.status_code,
+                'detail': error.detail,
+            })
+    return results
 
 
 @router.get(
     '/',
-    response_model=list[VisitDB],
+    response_model=VisitPage,
     response_model_exclude_none=True,
 )
 async def get_all_visits(
-    session: AsyncSession = Depends(get_async_session),
-    created_start: Optional[datetime] = Query(
-        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
+    session: AsyncSession = Depends(get_read_session),
+    filters: list = Depends(visit_filters),
+    cursor: Optional[str] = Query(
+        None, description="Значение next_cursor из предыдущей страницы"
     ),
-    created_end: Optional[datetime] = Query(
-        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
-    ),
-) -> Sequence[Visit]:
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+) -> Response:
     '''Для получения конкретного посещения не обязательно
     передать customer_id и phone_number
-    по которым происходит проверка пользователя
+    по которым происходит проверка пользователя.
+    Список отдается страницами по limit посещений, следующую страницу
+    можно получить, передав next_cursor из ответа в параметр cursor.
     '''
-    query = select(Visit)
-    if created_start and created_end:
-        query = query.where(and_(
-            Visit.created_date >= created_start,
-            Visit.created_date <= created_end
-            )
-        )
-    db_visits = await session.execute(query)
-    return db_visits.scalars().all()
+    query = select(*export_columns(Visit, VisitDB)).where(*filters)
+    query = paginate(query, Visit, cursor, limit)
+    result = await session.execute(query)
+    return json_page(result.all(), limit)
+
+
+@router.get(
+    '/export',
+    response_class=StreamingResponse,
+)
+async def export_visits(
+    session: AsyncSession = Depends(get_read_session),
+    filters: list = Depends(visit_filters),
+    format: ExportFormat = ExportFormat.ndjson,
+) -> StreamingResponse:
+    '''Выгрузка всех посещений в формате ndjson или csv.
+    Принимает те же фильтры, что и получение списка посещений,
+    данные отдаются потоком без постраничной разбивки.
+    '''
+    query = (
+        select(*export_columns(Visit, VisitDB))
+        .where(*filters)
+        .order_by(Visit.created_date, Visit.id)
+    )
+    return stream_export(session, query, VisitDB, format, 'visits')
 
 
 @router.get(
@@ -87,13 +174,23 @@ async def get_all_visits(
 )
 async def get_visit(
     visit_id: int,
-    session: AsyncSession = Depends(get_async_session)
-) -> Visit:
+    response: Response,
+    session: AsyncSession = Depends(get_read_session),
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
     '''Для получения конкретного посещения не обязательно
     передать customer_id и phone_number
-    по которым происходит проверка пользователя
+    по которым происходит проверка пользователя.
+    Ответ содержит ETag, с заголовком If-None-Match, совпадающим
+    с текущим ETag, вернется 304 без тела.
     '''
+    unchanged = await not_modified(
+        session, Visit, visit_id, if_none_match, VISIT_DOES_NOT_EXIST
+    )
+    if unchanged is not None:
+        return unchanged
     visit: Visit = await check_visit_exists(visit_id, session)
+    response.headers['ETag'] = make_etag(visit.version)
     return visit
 
 
@@ -105,34 +202,31 @@ async def partially_update_(
     visit_id: int,
     visit_in: VisitUpdate,
     session: AsyncSession = Depends(get_async_session),
-) -> Visit:
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+) -> Row:
     '''Для создания посещения обязательно
     нужно передать customer_id и phone_number
-    по которым происходит проверка пользователя
+    по которым происходит проверка пользователя,
+    либо токен из POST /auth/login в заголовке Authorization
     '''
-    visit: Visit = await get_visit_by_id(visit_id, session)
-    customer: Customer = await check_that_customer_exist(
-        customer_id=visit_in.customer_id, session=session
-    )
-    await check_customer_with_number(customer, visit_in.phone_number)
-    await check_that_current_customer_with_current_visit(
-        visit_id, customer, session
+    visit_in.customer_id = resolve_customer_id(
+        claims, visit_in.customer_id, visit_in.phone_number
     )
-    await check_customer_his_own_outlet_and_ended_date_not_expired(
-        visit_in, customer, session
+    facts = await get_visit_write_facts(
+        session,
+        customer_id=visit_in.customer_id,
+        visit_id=visit_id,
+        order_id=visit_in.order_id,
+        worker_id=visit_in.worker_id,
+        claims=claims,
     )
-    if visit_in.order_id and visit_in.worker_id:
-        await check_worker_in_order(
-            visit_in.worker_id, visit_in.order_id, session
-        )
-    elif visit_in.order_id:
-        await check_worker_in_order(
-            visit.worker_id, visit_in.order_id, session
-        )
-    elif visit_in.worker_id:
-        await check_worker_in_order(
-            visit_in.worker_id, visit.order_id, session
-        )
+    visit: Visit = check_visit_found(facts)
+    check_customer(facts)
+    check_phone_number(facts, visit_in.phone_number)
+    check_customer_visit(facts)
+    check_outlet(facts, visit_in.outlet_id)
+    check_order_not_expired(facts)
+    check_worker_order(facts)
     new_visit = await update_visit(visit, visit_in, session)
     return new_visit
 
@@ -144,39 +238,28 @@ async def partially_update_(
 )
 async def delete_visit_by_id(
     visit_id: int,
-    customer_id: int,
-    phone_number: str,
-    session: AsyncSession = Depends(get_async_session)
-) -> Visit:
+    customer_id: Optional[int] = None,
+    phone_number: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+) -> Row:
     '''Для создания посещения обязательно
     нужно передать customer_id и phone_number
-    по которым происходит проверка пользователя
+    по которым происходит проверка пользователя,
+    либо токен из POST /auth/login в заголовке Authorization
     '''
-    db_visit: Visit = await get_visit_by_id(
-        visit_id, session
-    )
-    customer = await check_that_customer_exist(
-        customer_id=customer_id, session=session
-    )
-    await check_customer_with_number(customer, phone_number)
-    await check_that_current_customer_with_current_visit(
-       visit_id, customer, session
+    facts = await get_visit_write_facts(
+        session,
+        customer_id=resolve_customer_id(claims, customer_id, phone_number),
+        visit_id=visit_id,
+        claims=claims,
     )
+    db_visit: Visit = check_visit_found(facts)
+    check_customer(facts)
+    check_phone_number(facts, phone_number)
+    check_customer_visit(facts)
 
     visit = await delete_visit(
         db_visit, session
     )
     return visit
-
-
-async def get_visit_by_id(
-        visit_id: int,
-        session: AsyncSession,
-) -> Visit:
-    db_visit: Visit | None = await session.get(Visit, visit_id)
-    if db_visit is None:
-        raise HTTPException(
-            status_code=404,
-            detail='Посещение не найдено.'
-        )
-    return db_visit
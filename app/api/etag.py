@@ -0,0 +1,42 @@
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def make_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    '''Сравнение по If-None-Match: список через запятую,
+    слабые теги (W/) сравниваются как сильные.'''
+    if not if_none_match:
+        return False
+    tags = {
+        tag.strip().removeprefix('W/') for tag in if_none_match.split(',')
+    }
+    return '*' in tags or etag in tags
+
+
+async def not_modified(
+    session: AsyncSession,
+    model,
+    obj_id: int,
+    if_none_match: Optional[str],
+    not_found_detail: str,
+) -> Optional[Response]:
+    '''Ответ 304, если версия объекта совпадает с If-None-Match.
+    Читает из базы только столбец version, без загрузки объекта.'''
+    if not if_none_match:
+        return None
+    version = await session.scalar(
+        select(model.version).where(model.id == obj_id)
+    )
+    if version is None:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    etag = make_etag(version)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    return None
@@ -0,0 +1,40 @@
+import asyncio
+import json
+from typing import AsyncIterator, Hashable, Sequence
+
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.notify import NotifyHub
+
+
+async def _sse_events(
+    hub: NotifyHub, keys: Sequence[Hashable]
+) -> AsyncIterator[str]:
+    queue = hub.subscribe(keys)
+    try:
+        yield ': connected\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), settings.EVENTS_HEARTBEAT
+                )
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        hub.unsubscribe(queue, keys)
+
+
+def stream_events(
+    hub: NotifyHub, keys: Sequence[Hashable]
+) -> StreamingResponse:
+    '''Server-Sent Events из очереди подписчика. Пустые сообщения
+    раз в EVENTS_HEARTBEAT секунд не дают прокси закрыть соединение
+    и помогают заметить отключение клиента.'''
+    return StreamingResponse(
+        _sse_events(hub, keys),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
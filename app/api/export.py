@@ -0,0 +1,105 @@
+import asyncio
+import csv
+import enum
+import io
+from typing import AsyncIterator
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.admission import release_early
+from app.core.config import settings
+
+# Сколько строк за раз забираем из серверного курсора
+# и отправляем клиенту одним куском.
+EXPORT_FETCH_SIZE = 1000
+EXPORTS_BUSY = (
+    'Слишком много одновременных выгрузок, повторите запрос позже.'
+)
+# Выгрузки, которые сейчас отдаются клиентам
+export_slots = asyncio.Semaphore(settings.EXPORT_MAX_CONCURRENT)
+
+
+class ExportFormat(str, enum.Enum):
+    ndjson = 'ndjson'
+    csv = 'csv'
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: 'application/x-ndjson',
+    ExportFormat.csv: 'text/csv; charset=utf-8',
+}
+
+
+def export_columns(model, schema: type[BaseModel]) -> list:
+    '''Колонки модели, которые попадают в схему ответа.'''
+    return [getattr(model, field) for field in schema.model_fields]
+
+
+async def _iter_rows(
+    session: AsyncSession,
+    query: Select,
+    schema: type[BaseModel],
+    export_format: ExportFormat,
+) -> AsyncIterator[str]:
+    async with export_slots:
+        fields = list(schema.model_fields)
+        if export_format == ExportFormat.csv:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            yield buffer.getvalue()
+        result = await session.stream(
+            query.execution_options(yield_per=EXPORT_FETCH_SIZE)
+        )
+        async for rows in result.partitions():
+            if export_format == ExportFormat.ndjson:
+                yield ''.join(
+                    schema.model_validate(row).model_dump_json() + '\n'
+                    for row in rows
+                )
+            else:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in rows:
+                    data = schema.model_validate(row).model_dump(
+                        mode='json'
+                    )
+                    writer.writerow(data[field] for field in fields)
+                yield buffer.getvalue()
+
+
+def stream_export(
+    session: AsyncSession,
+    query: Select,
+    schema: type[BaseModel],
+    export_format: ExportFormat,
+    filename: str,
+) -> StreamingResponse:
+    '''Выгрузка через серверный курсор: строки читаются пачками
+    по EXPORT_FETCH_SIZE и сразу уходят клиенту, поэтому память
+    не растет вместе с размером выгрузки.
+
+    Место в допуске к базе освобождается до начала потока, чтобы
+    долгая выгрузка не занимала его у коротких чтений; одновременно
+    идет не больше EXPORT_MAX_CONCURRENT выгрузок, следующая сразу
+    получает 503.'''
+    if export_slots.locked():
+        raise HTTPException(
+            status_code=503,
+            detail=EXPORTS_BUSY,
+            headers={'Retry-After': '1'},
+        )
+    release_early(session)
+    return StreamingResponse(
+        _iter_rows(session, query, schema, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename="{filename}.{export_format.value}"'
+            )
+        },
+    )
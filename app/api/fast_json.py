@@ -0,0 +1,47 @@
+import json
+from datetime import datetime
+from typing import Any, Sequence
+
+from fastapi import Response
+
+from app.api.pagination import make_page
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def dumps(content: Any) -> bytes:
+    '''JSON в том же виде, что у JSONResponse FastAPI: без пробелов
+    и без экранирования не-ASCII символов. Если установлен orjson,
+    кодирует он, иначе стандартный json.'''
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(',', ':'),
+        default=_default,
+    ).encode('utf-8')
+
+
+def json_page(
+    rows: Sequence, limit: int, exclude_none: bool = True
+) -> Response:
+    '''Страница списка из строк select(*export_columns(...)) сразу
+    в байты JSON: без объектов ORM и без проверки каждой строки
+    схемой ответа. Результат совпадает побайтно с ответом через
+    response_model.'''
+    page = make_page(rows, limit)
+    page['items'] = [row._asdict() for row in page['items']]
+    if exclude_none and page['next_cursor'] is None:
+        del page['next_cursor']
+    return Response(content=dumps(page), media_type='application/json')
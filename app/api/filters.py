@@ -0,0 +1,61 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Query
+from sqlalchemy import and_
+
+from app.models.models import Order, Status, Visit
+
+
+async def order_filters(
+    status: Optional[Status] = None,
+    created_start: Optional[datetime] = Query(
+        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
+    ),
+    created_end: Optional[datetime] = Query(
+        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
+    ),
+    ended_start: Optional[datetime] = Query(
+        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
+    ),
+    ended_end: Optional[datetime] = Query(
+        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
+    ),
+) -> list:
+    '''Условия фильтрации заказов по статусу
+    и по промежуткам дат создания и завершения.'''
+    filters = []
+    if status:
+        filters.append(Order.status == status)
+    if created_start and created_end:
+        filters.append(and_(
+            Order.created_date >= created_start,
+            Order.created_date <= created_end
+            )
+        )
+    if ended_start and ended_end:
+        filters.append(and_(
+            Order.ended_date >= ended_start,
+            Order.ended_date <= ended_end
+            )
+        )
+    return filters
+
+
+async def visit_filters(
+    created_start: Optional[datetime] = Query(
+        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
+    ),
+    created_end: Optional[datetime] = Query(
+        None, description="Шаблон времени YYYY-MM-DDTHH:MM:SS"
+    ),
+) -> list:
+    '''Условия фильтрации посещений по промежутку дат создания.'''
+    filters = []
+    if created_start and created_end:
+        filters.append(and_(
+            Visit.created_date >= created_start,
+            Visit.created_date <= created_end
+            )
+        )
+    return filters
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Optional, Type
+
+from fastapi import Header, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import delete, func, null, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.idempotency import IdempotencyKey
+
+KEY_REUSED = (
+    'Idempotency-Key уже использован для запроса с другим телом.'
+)
+KEY_IN_PROGRESS = (
+    'Запрос с таким Idempotency-Key еще выполняется, повторите позже.'
+)
+# Раз в сколько захватов ключа удалять просроченные записи
+PURGE_EVERY = 1000
+# Повтор ждет запрос из другого процесса, перечитывая запись ключа:
+# первая пауза в секундах, дальше она удваивается до предела
+WAIT_DELAY = 0.05
+WAIT_MAX_DELAY = 1
+
+
+async def get_idempotency_key(
+    idempotency_key: Optional[str] = Header(
+        None,
+        max_length=255,
+        description=(
+            'Повтор запроса с тем же ключом вернет сохраненный ответ '
+            'без повторного создания объекта'
+        ),
+    )
+) -> Optional[str]:
+    return idempotency_key
+
+
+def _utcnow():
+    return func.timezone('utc', func.now())
+
+
+class IdempotentRequests:
+    '''Выполнение POST с заголовком Idempotency-Key не более одного раза.
+
+    Ключ действует в пределах заказчика: одинаковые ключи разных
+    заказчиков не пересекаются. Ключ захватывается строкой
+    в idempotency_key до выполнения запроса, после успешного
+    выполнения туда же записывается ответ, и повторы
+    отвечают из этой таблицы, не трогая заказы и посещения. Ответ
+    коммитится одной транзакцией с созданным объектом.
+    Одновременные повторы ждут первый запрос: в одном процессе -
+    на блокировке, в разных - перечитывая запись ключа. Если первый
+    запрос не завершился за lock_timeout, его ключ захватывается
+    заново, повтор получает 409, только если не дождался и этого.
+    Ошибки не сохраняются: после исправления данных запрос можно
+    повторить с тем же ключом.'''
+
+    def __init__(self, ttl: float, lock_timeout: float) -> None:
+        self.ttl = timedelta(seconds=ttl)
+        self.lock_timeout = timedelta(seconds=lock_timeout)
+        self._locks: dict[tuple[str, int, str], list] = {}
+        self._claims = 0
+
+    @asynccontextmanager
+    async def _coalesce(self, ident: tuple[str, int, str]):
+        entry = self._locks.setdefault(ident, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[ident]
+
+    @staticmethod
+    def _where(ident: tuple[str, int, str]) -> tuple:
+        scope, customer_id, key = ident
+        return (
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.customer_id == customer_id,
+            IdempotencyKey.key == key,
+        )
+
+    async def _claim(
+        self,
+        session: AsyncSession,
+        ident: tuple[str, int, str],
+        request_hash: str,
+    ) -> Optional[IdempotencyKey]:
+        '''None, если ключ захвачен этим запросом, иначе
+        существующая запись. Просроченная запись захватывается заново,
+        запись выполняющегося запроса с тем же телом ждем
+        до lock_timeout.'''
+        scope, customer_id, key = ident
+        deadline = time.monotonic() + self.lock_timeout.total_seconds()
+        delay = WAIT_DELAY
+        while True:
+            stmt = insert(IdempotencyKey).values(
+                scope=scope,
+                customer_id=customer_id,
+                key=key,
+                request_hash=request_hash,
+                expires_date=_utcnow() + self.lock_timeout,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[
+                    IdempotencyKey.scope,
+                    IdempotencyKey.customer_id,
+                    IdempotencyKey.key,
+                ],
+                set_={
+                    'request_hash': stmt.excluded.request_hash,
+                    'status_code': null(),
+                    'response': null(),
+                    'created_date': _utcnow(),
+                    'expires_date': stmt.excluded.expires_date,
+                },
+                where=IdempotencyKey.expires_date < _utcnow(),
+            ).returning(IdempotencyKey.key)
+            claimed = (await session.execute(stmt)).scalar()
+            if claimed is not None:
+                await session.commit()
+                return None
+            record = await session.scalar(
+                select(IdempotencyKey)
+                .where(*self._where(ident))
+                .execution_options(populate_existing=True)
+            )
+            # запись могли удалить между запросами - пробуем еще раз
+            if record is None:
+                continue
+            remaining = deadline - time.monotonic()
+            if (
+                record.response is not None
+                or record.request_hash != request_hash
+                or remaining <= 0
+            ):
+                return record
+            # соединение не держим, пока ждем
+            await session.commit()
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, WAIT_MAX_DELAY)
+
+    async def _release(
+        self, session: AsyncSession, ident: tuple[str, int, str]
+    ) -> None:
+        await session.execute(
+            delete(IdempotencyKey).where(*self._where(ident))
+        )
+        await session.commit()
+
+    async def _complete(
+        self,
+        session: AsyncSession,
+        ident: tuple[str, int, str],
+        body: Any,
+    ) -> None:
+        stmt = (
+            update(IdempotencyKey)
+            .where(*self._where(ident))
+            .values(
+                status_code=200,
+                response=body,
+                expires_date=_utcnow() + self.ttl,
+            )
+        )
+        await session.execute(stmt)
+        self._claims += 1
+        if self._claims % PURGE_EVERY == 0:
+            await session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.expires_date < _utcnow())
+            )
+        await session.commit()
+
+    async def run(
+        self,
+        session: AsyncSession,
+        scope: str,
+        customer_id: int,
+        key: Optional[str],
+        request: BaseModel,
+        create: Callable[[], Awaitable[Any]],
+        response_model: Type[BaseModel],
+    ) -> Any:
+        '''Выполняет create() один раз для (scope, customer_id, key).
+        Без ключа просто вызывает create(). С ключом create()
+        не должен коммитить сессию: созданный объект коммитится
+        вместе с сохраненным ответом.'''
+        if key is None:
+            return await create()
+        request_hash = hashlib.sha256(
+            request.model_dump_json().encode()
+        ).hexdigest()
+        ident = (scope, customer_id, key)
+        async with self._coalesce(ident):
+            record = await self._claim(session, ident, request_hash)
+            if record is not None:
+                return self._replay(record, request_hash)
+            try:
+                obj = await create()
+                body = jsonable_encoder(response_model.model_validate(obj))
+                await self._complete(session, ident, body)
+            except BaseException:
+                await session.rollback()
+                await self._release(session, ident)
+                raise
+            return body
+
+    @staticmethod
+    def _replay(record: IdempotencyKey, request_hash: str) -> JSONResponse:
+        if record.request_hash != request_hash:
+            raise HTTPException(status_code=422, detail=KEY_REUSED)
+        if record.response is None:
+            raise HTTPException(status_code=409, detail=KEY_IN_PROGRESS)
+        return JSONResponse(
+            content=record.response,
+            status_code=record.status_code,
+            headers={'Idempotent-Replayed': 'true'},
+        )
+
+
+idempotent_requests = IdempotentRequests(
+    ttl=settings.IDEMPOTENCY_KEY_TTL,
+    lock_timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT,
+)
@@ -0,0 +1,54 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import Select, tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(created_date: datetime, obj_id: int) -> str:
+    '''Непрозрачный курсор: позиция последней записи страницы
+    в порядке сортировки (created_date, id).'''
+    raw = json.dumps([created_date.isoformat(), obj_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_date, obj_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_date), int(obj_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=400,
+            detail='Некорректный курсор(cursor).'
+        )
+
+
+def paginate(
+    query: Select, model, cursor: Optional[str], limit: int
+) -> Select:
+    '''Keyset-пагинация: вместо OFFSET продолжаем с позиции курсора,
+    поэтому стоимость страницы не зависит от размера таблицы.
+    Запрашиваем на одну запись больше, чтобы понять, есть ли следующая.
+    '''
+    if cursor:
+        query = query.where(
+            tuple_(model.created_date, model.id) > decode_cursor(cursor)
+        )
+    return query.order_by(model.created_date, model.id).limit(limit + 1)
+
+
+def make_page(objs: Sequence, limit: int) -> dict:
+    if len(objs) <= limit:
+        return {'items': objs, 'next_cursor': None}
+    last = objs[limit - 1]
+    return {
+        'items': objs[:limit],
+        'next_cursor': encode_cursor(last.created_date, last.id),
+    }
@@ -1,10 +1,20 @@
 from fastapi import APIRouter
 
+from app.api.endpoints.auth import router as auth_router
+from app.api.endpoints.metrics import router as metrics_router
 from app.api.endpoints.order import router as order_router
 from app.api.endpoints.outlet import router as outlet_router
+from app.api.endpoints.report import router as report_router
+from app.api.endpoints.stats import router as stats_router
+from app.api.endpoints.sync import router as sync_router
 from app.api.endpoints.visit import router as visit_router
 
 main_router = APIRouter()
 main_router.include_router(order_router)
 main_router.include_router(visit_router)
 main_router.include_router(outlet_router)
+main_router.include_router(stats_router)
+main_router.include_router(sync_router)
+main_router.include_router(metrics_router)
+main_router.include_router(auth_router)
+main_router.include_router(report_router)
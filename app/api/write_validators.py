@@ -0,0 +1,484 @@
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, exists, func, literal, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.validators import (
+    CUSTOMER_NOT_FOUND, CUSTOMER_NOT_IN_ORDER, CUSTOMER_NOT_IN_OUTLET,
+    CUSTOMER_NOT_IN_VISIT, ORDER_EXPIRED, ORDER_HAS_VISIT, ORDER_NOT_FOUND,
+    STATUS_NOT_CHANGED, STATUS_TRANSITION_NOT_ALLOWED, VISIT_NOT_FOUND,
+    WORKER_NOT_IN_ORDER, WORKER_NOT_IN_OUTLET, WRONG_PHONE_NUMBER
+)
+from app.core.config import settings
+from app.core.security import TokenClaims
+from app.crud.customer_cache import CustomerIdentity, customer_identity_cache
+from app.crud.membership import (
+    Membership, worker_in_outlet, worker_order_clauses,
+    worker_outlet_clauses, worker_outlets_map
+)
+from app.models.models import (
+    STATUS_TRANSITIONS, Customer, Order, Outlet, Status, Visit
+)
+from app.schemas.order import OrderCreate
+from app.schemas.visit import VisitCreate, VisitUpdate
+
+# Все факты, нужные для проверки одной записи, собираются одним запросом:
+# к строке-заглушке через LEFT JOIN ... ON true присоединяются заказчик
+# и изменяемый объект, а проверки привязок считаются подзапросами EXISTS.
+# Сами правила проверяются в python, тексты ошибок
+# из app/api/validators.py. Заказчик берется из токена
+# (app/api/auth.py) или из customer_identity_cache, если он там есть.
+
+
+def _param(value: Optional[int]):
+    return literal(value, Integer)
+
+
+def _base_stmt():
+    one = select(literal(1).label('one')).subquery('one')
+    return select(one.c.one).select_from(one)
+
+
+def _with_customer(stmt, customer_id: int):
+    customer = (
+        select(
+            Customer.id.label('id'),
+            Customer.phone_number.label('phone_number'),
+            Customer.outlet_id.label('outlet_id'),
+        )
+        .join(Outlet)
+        .where(Customer.id == customer_id)
+        .subquery('customer')
+    )
+    return stmt.add_columns(
+        customer.c.id.label('customer_id'),
+        customer.c.phone_number.label('customer_phone_number'),
+        customer.c.outlet_id.label('customer_outlet_id'),
+    ).outerjoin(customer, true())
+
+
+async def _collect_facts(
+    session: AsyncSession,
+    customer_id: int,
+    stmt,
+    claims: Optional[TokenClaims] = None,
+) -> SimpleNamespace:
+    '''Выполняет запрос фактов. Если заказчик есть в кэше или пришел
+    в токене, его часть в запрос не добавляется, а когда кроме
+    заказчика ничего не нужно - запрос не выполняется вовсе.'''
+    if claims is not None:
+        facts = {}
+        if len(stmt.selected_columns) > 1:
+            facts = dict((await session.execute(stmt)).one()._mapping)
+        return SimpleNamespace(
+            **facts,
+            customer_id=claims.customer_id,
+            customer_phone_number=None,
+            customer_outlet_id=claims.outlet_id,
+            by_token=True,
+        )
+    identity = await customer_identity_cache.get(customer_id)
+    if identity is None:
+        stmt = _with_customer(stmt, customer_id)
+    elif len(stmt.selected_columns) == 1:
+        return _facts_from_identity({}, customer_id, identity)
+    result = await session.execute(stmt)
+    facts = dict(result.one()._mapping)
+    if identity is not None:
+        return _facts_from_identity(facts, customer_id, identity)
+    if facts['customer_id'] is not None:
+        await customer_identity_cache.set(customer_id, CustomerIdentity(
+            facts['customer_phone_number'], facts['customer_outlet_id']
+        ))
+    return SimpleNamespace(**facts)
+
+
+def _facts_from_identity(
+    facts: dict, customer_id: int, identity: CustomerIdentity
+) -> SimpleNamespace:
+    return SimpleNamespace(
+        **facts,
+        customer_id=customer_id,
+        customer_phone_number=identity.phone_number,
+        customer_outlet_id=identity.outlet_id,
+    )
+
+
+def _worker_in_outlet_columns(worker_id, outlet_id) -> tuple:
+    has_any, is_member = worker_outlet_clauses(worker_id, outlet_id)
+    return (
+        has_any.label('worker_has_outlets'),
+        is_member.label('worker_in_outlet'),
+    )
+
+
+def _worker_in_order_columns(worker_id, order_id) -> tuple:
+    has_any, is_member = worker_order_clauses(worker_id, order_id)
+    return (
+        has_any.label('worker_has_orders'),
+        is_member.label('worker_in_order'),
+    )
+
+
+async def get_order_write_facts(
+    session: AsyncSession,
+    customer_id: int,
+    order_id: Optional[int] = None,
+    worker_id: Optional[int] = None,
+    outlet_id: Optional[int] = None,
+    claims: Optional[TokenClaims] = None,
+) -> SimpleNamespace:
+    '''Заказчик, изменяемый заказ (если передан order_id)
+    и привязка работника к торговой точке за один запрос.
+    Для существующего заказа не переданные worker_id и outlet_id
+    берутся из самого заказа. При MEMBERSHIP_INDEX привязка
+    работника берется из worker_outlet_index, а не из запроса.'''
+    stmt = _base_stmt()
+    if order_id is not None:
+        stmt = stmt.add_columns(Order).outerjoin(
+            Order, Order.id == order_id
+        )
+        check_membership = bool(worker_id or outlet_id)
+        if check_membership and not settings.MEMBERSHIP_INDEX:
+            stmt = stmt.add_columns(*_worker_in_outlet_columns(
+                func.coalesce(_param(worker_id), Order.worker_id),
+                func.coalesce(_param(outlet_id), Order.outlet_id),
+            ))
+    else:
+        check_membership = bool(worker_id and outlet_id)
+        if check_membership and not settings.MEMBERSHIP_INDEX:
+            stmt = stmt.add_columns(*_worker_in_outlet_columns(
+                _param(worker_id), _param(outlet_id)
+            ))
+    facts = await _collect_facts(session, customer_id, stmt, claims)
+    if check_membership and settings.MEMBERSHIP_INDEX:
+        order = getattr(facts, 'Order', None)
+        if order is not None:
+            worker_id = worker_id or order.worker_id
+            outlet_id = outlet_id or order.outlet_id
+        membership = Membership(False, False)
+        if worker_id:
+            membership = await worker_in_outlet(session, worker_id, outlet_id)
+        facts.worker_has_outlets, facts.worker_in_outlet = membership
+    return facts
+
+
+async def get_visit_write_facts(
+    session: AsyncSession,
+    customer_id: int,
+    visit_id: Optional[int] = None,
+    order_id: Optional[int] = None,
+    worker_id: Optional[int] = None,
+    claims: Optional[TokenClaims] = None,
+) -> SimpleNamespace:
+    '''Заказчик, изменяемое посещение (если передан visit_id),
+    состояние заказа и привязка работника к заказу за один запрос.
+    Для существующего посещения не переданные worker_id и order_id
+    берутся из самого посещения.'''
+    stmt = _base_stmt()
+    if order_id is not None:
+        visit_order = Order.__table__.alias('visit_order')
+        order_visit = Visit.__table__.alias('order_visit')
+        stmt = stmt.add_columns(
+            select(visit_order.c.ended_date)
+            .where(visit_order.c.id == order_id)
+            .scalar_subquery()
+            .label('order_ended_date'),
+            exists().where(order_visit.c.order_id == order_id)
+            .label('order_has_visit'),
+        )
+    if visit_id is not None:
+        stmt = stmt.add_columns(Visit).outerjoin(
+            Visit, Visit.id == visit_id
+        )
+        if worker_id or order_id:
+            stmt = stmt.add_columns(*_worker_in_order_columns(
+                func.coalesce(_param(worker_id), Visit.worker_id),
+                func.coalesce(_param(order_id), Visit.order_id),
+            ))
+    elif worker_id and order_id:
+        stmt = stmt.add_columns(
+            *_worker_in_order_columns(_param(worker_id), _param(order_id))
+        )
+    return await _collect_facts(session, customer_id, stmt, claims)
+
+
+async def validate_orders_bulk(
+    session: AsyncSession, orders_in: Sequence[OrderCreate]
+) -> list[Optional[HTTPException]]:
+    '''Проверки POST /order/ для пачки заказов: все заказчики
+    читаются одним запросом, все привязки работников - другим.
+    Возвращает ошибку или None для каждого заказа по порядку.'''
+    result = await session.execute(
+        select(Customer.id, Customer.phone_number, Customer.outlet_id)
+        .join(Outlet)
+        .where(Customer.id.in_({order.customer_id for order in orders_in}))
+    )
+    customers = {row.id: row for row in result}
+    worker_outlets = await worker_outlets_map(session, {
+        order.worker_id for order in orders_in
+        if order.worker_id and order.outlet_id
+    })
+    errors: list[Optional[HTTPException]] = []
+    for order_in in orders_in:
+        customer = customers.get(order_in.customer_id)
+        facts = SimpleNamespace(
+            customer_id=customer and customer.id,
+            customer_phone_number=customer and customer.phone_number,
+            customer_outlet_id=customer and customer.outlet_id,
+        )
+        if order_in.worker_id and order_in.outlet_id:
+            outlets = worker_outlets.get(order_in.worker_id, ())
+            facts.worker_has_outlets = bool(outlets)
+            facts.worker_in_outlet = order_in.outlet_id in outlets
+        try:
+            check_customer(facts)
+            check_phone_number(facts, order_in.phone_number)
+            check_outlet(facts, order_in.outlet_id)
+            check_worker_outlet(facts)
+        except HTTPException as error:
+            errors.append(error)
+        else:
+            errors.append(None)
+    return errors
+
+
+class VisitSyncSnapshot:
+    '''Состояние базы для пакета посещений с одного устройства,
+    прочитанное один раз. Факты для каждого элемента пакета берутся
+    из снимка, а принятые элементы сразу меняют снимок, поэтому
+    следующие элементы проверяются с их учетом.'''
+
+    def __init__(
+        self,
+        customers: dict,
+        visits: dict[int, Visit],
+        orders: dict,
+        workers_with_orders: set[int],
+    ) -> None:
+        self.customers = customers
+        self.visits = visits
+        self.orders = orders
+        self.workers_with_orders = workers_with_orders
+
+    @classmethod
+    async def load(cls, session: AsyncSession, items) -> 'VisitSyncSnapshot':
+        result = await session.execute(
+            select(Customer.id, Customer.phone_number, Customer.outlet_id)
+            .join(Outlet)
+            .where(Customer.id.in_({item.visit.customer_id for item in items}))
+        )
+        customers = {row.id: row for row in result}
+        visit_ids = {item.visit_id for item in items if item.op == 'update'}
+        visits = {}
+        if visit_ids:
+            result = await session.execute(
+                select(Visit).where(Visit.id.in_(visit_ids))
+            )
+            visits = {visit.id: visit for visit in result.scalars()}
+        payloads = [item.visit for item in items] + list(visits.values())
+        order_ids = {obj.order_id for obj in payloads if obj.order_id}
+        orders = {}
+        if order_ids:
+            result = await session.execute(
+                select(
+                    Order.id, Order.ended_date, Order.worker_id,
+                    exists().where(Visit.order_id == Order.id)
+                    .label('has_visit'),
+                )
+                .where(Order.id.in_(order_ids))
+            )
+            orders = {
+                row.id: SimpleNamespace(**row._mapping) for row in result
+            }
+        worker_ids = {obj.worker_id for obj in payloads if obj.worker_id}
+        workers_with_orders = set()
+        if worker_ids:
+            result = await session.execute(
+                select(Order.worker_id)
+                .where(Order.worker_id.in_(worker_ids))
+                .distinct()
+            )
+            workers_with_orders = set(result.scalars())
+        return cls(customers, visits, orders, workers_with_orders)
+
+    def _facts(self, visit_in) -> SimpleNamespace:
+        customer = self.customers.get(visit_in.customer_id)
+        facts = SimpleNamespace(
+            customer_id=customer and customer.id,
+            customer_phone_number=customer and customer.phone_number,
+            customer_outlet_id=customer and customer.outlet_id,
+        )
+        if visit_in.order_id is not None:
+            order = self.orders.get(visit_in.order_id)
+            facts.order_ended_date = order and order.ended_date
+            facts.order_has_visit = bool(order and order.has_visit)
+        return facts
+
+    def _add_worker_order(self, facts, worker_id, order_id) -> None:
+        order = self.orders.get(order_id)
+        facts.worker_has_orders = worker_id in self.workers_with_orders
+        facts.worker_in_order = bool(
+            worker_id and order and order.worker_id == worker_id
+        )
+
+    def create_facts(self, visit_in: VisitCreate) -> SimpleNamespace:
+        facts = self._facts(visit_in)
+        if visit_in.worker_id and visit_in.order_id:
+            self._add_worker_order(
+                facts, visit_in.worker_id, visit_in.order_id
+            )
+        return facts
+
+    def update_facts(
+        self, visit_id: int, visit_in: VisitUpdate
+    ) -> SimpleNamespace:
+        facts = self._facts(visit_in)
+        facts.Visit = self.visits.get(visit_id)
+        if facts.Visit is not None and (
+            visit_in.worker_id or visit_in.order_id
+        ):
+            self._add_worker_order(
+                facts,
+                visit_in.worker_id or facts.Visit.worker_id,
+                visit_in.order_id or facts.Visit.order_id,
+            )
+        return facts
+
+
+async def validate_visits_sync(
+    session: AsyncSession, items
+) -> tuple[list[Optional[HTTPException]], list[tuple[Optional[Visit], dict]]]:
+    '''Проверки POST /visit/ и PATCH /visit/{visit_id} для пакета
+    с устройства в порядке элементов. Возвращает ошибку или None
+    для каждого элемента и список принятых изменений: (посещение или
+    None для нового, данные для записи).'''
+    snapshot = await VisitSyncSnapshot.load(session, items)
+    errors: list[Optional[HTTPException]] = []
+    changes: list[tuple[Optional[Visit], dict]] = []
+    for item in items:
+        visit_in = item.visit
+        try:
+            if item.op == 'create':
+                facts = snapshot.create_facts(visit_in)
+                check_order_not_have_visit(facts)
+                check_customer(facts)
+                check_phone_number(facts, visit_in.phone_number)
+                check_outlet(facts, visit_in.outlet_id)
+                check_order_not_expired(facts)
+                check_worker_order(facts)
+                if visit_in.order_id in snapshot.orders:
+                    snapshot.orders[visit_in.order_id].has_visit = True
+                visit = None
+                data = visit_in.model_dump(exclude={'phone_number'})
+            else:
+                facts = snapshot.update_facts(item.visit_id, visit_in)
+                visit = check_visit_found(facts)
+                check_customer(facts)
+                check_phone_number(facts, visit_in.phone_number)
+                check_customer_visit(facts)
+                check_outlet(facts, visit_in.outlet_id)
+                check_order_not_expired(facts)
+                check_worker_order(facts)
+                data = visit_in.model_dump(
+                    exclude_unset=True, exclude={'phone_number'}
+                )
+                for field, value in data.items():
+                    setattr(visit, field, value)
+        except HTTPException as error:
+            errors.append(error)
+        else:
+            errors.append(None)
+            changes.append((visit, data))
+    return errors, changes
+
+
+def check_customer(facts: SimpleNamespace) -> None:
+    if facts.customer_id is None:
+        raise HTTPException(status_code=404, detail=CUSTOMER_NOT_FOUND)
+
+
+def check_phone_number(
+    facts: SimpleNamespace, phone_number: Optional[str]
+) -> None:
+    if getattr(facts, 'by_token', False):
+        return
+    if facts.customer_phone_number != phone_number:
+        raise HTTPException(status_code=403, detail=WRONG_PHONE_NUMBER)
+
+
+def check_outlet(facts: SimpleNamespace, outlet_id: Optional[int]) -> None:
+    if outlet_id and facts.customer_outlet_id != outlet_id:
+        raise HTTPException(status_code=400, detail=CUSTOMER_NOT_IN_OUTLET)
+
+
+def check_worker_outlet(facts: SimpleNamespace) -> None:
+    if not hasattr(facts, 'worker_in_outlet'):
+        return
+    if facts.worker_has_outlets and not facts.worker_in_outlet:
+        raise HTTPException(status_code=404, detail=WORKER_NOT_IN_OUTLET)
+
+
+def check_worker_order(facts: SimpleNamespace) -> None:
+    if not hasattr(facts, 'worker_in_order'):
+        return
+    if facts.worker_has_orders and not facts.worker_in_order:
+        raise HTTPException(status_code=404, detail=WORKER_NOT_IN_ORDER)
+
+
+def check_order_found(facts: SimpleNamespace) -> Order:
+    if facts.Order is None:
+        raise HTTPException(status_code=404, detail=ORDER_NOT_FOUND)
+    return facts.Order
+
+
+def check_visit_found(facts: SimpleNamespace) -> Visit:
+    if facts.Visit is None:
+        raise HTTPException(status_code=404, detail=VISIT_NOT_FOUND)
+    return facts.Visit
+
+
+def check_customer_order(facts: SimpleNamespace) -> None:
+    if facts.Order.customer_id != facts.customer_id:
+        raise HTTPException(status_code=404, detail=CUSTOMER_NOT_IN_ORDER)
+
+
+def check_customer_visit(facts: SimpleNamespace) -> None:
+    if facts.Visit.customer_id != facts.customer_id:
+        raise HTTPException(status_code=404, detail=CUSTOMER_NOT_IN_VISIT)
+
+
+def check_order_not_expired(facts: SimpleNamespace) -> None:
+    if not hasattr(facts, 'order_ended_date'):
+        return
+    if facts.order_ended_date is None:
+        raise HTTPException(status_code=404, detail=ORDER_NOT_FOUND)
+    # даты в базе хранятся в UTC без часового пояса
+    if facts.order_ended_date < datetime.utcnow():
+        raise HTTPException(status_code=422, detail=ORDER_EXPIRED)
+
+
+def check_order_not_have_visit(facts: SimpleNamespace) -> None:
+    if getattr(facts, 'order_has_visit', False):
+        raise HTTPException(status_code=404, detail=ORDER_HAS_VISIT)
+
+
+def status_transition_error(current: Status, target: Status) -> Optional[str]:
+    '''Почему заказ нельзя перевести из current в target
+    или None, если переход разрешен.'''
+    if current == target:
+        return STATUS_NOT_CHANGED.format(target=target.value)
+    if target not in STATUS_TRANSITIONS[current]:
+        return STATUS_TRANSITION_NOT_ALLOWED.format(
+            current=current.value, target=target.value
+        )
+    return None
+
+
+def check_status_transition(facts: SimpleNamespace, target: Status) -> None:
+    detail = status_transition_error(facts.Order.status, target)
+    if detail is not None:
+        raise HTTPException(status_code=422, detail=detail)
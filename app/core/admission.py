@@ -0,0 +1,230 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
+from app.core.security import token_signer
+
+READ = 'read'
+WRITE = 'write'
+OVERLOADED = 'Сервис перегружен, повторите запрос позже.'
+CUSTOMER_QUEUE_FULL = (
+    'Слишком много одновременных запросов от заказчика, '
+    'повторите запрос позже.'
+)
+# Начальная оценка времени, на которое запрос занимает место, в секундах
+INITIAL_HOLD = 0.05
+
+
+class AdmissionControl:
+    '''Допуск запросов к базе перед выдачей сессии.
+
+    Одновременно работает не больше capacity запросов (по умолчанию
+    pool_size + max_overflow основного пула), чтения занимают
+    не больше capacity - write_reserve мест. Остальные ждут в очередях
+    по заказчикам, места раздаются по кругу между заказчиками: сначала
+    записям, потом чтениям. Если ожидаемое ожидание больше бюджета
+    класса, запрос сразу получает 503 с Retry-After; чтения получают 503
+    и тогда, когда в очереди есть записи. Заказчику, у которого
+    в очереди уже customer_queue запросов, отвечается 429.'''
+
+    def __init__(
+        self,
+        capacity: int,
+        write_reserve: int,
+        read_budget: float,
+        write_budget: float,
+        customer_queue: int,
+    ) -> None:
+        self.capacity = capacity
+        self.limits = {WRITE: capacity, READ: max(capacity - write_reserve, 1)}
+        self.budgets = {READ: read_budget, WRITE: write_budget}
+        self.customer_queue = customer_queue
+        self.hold = INITIAL_HOLD
+        self.active = {READ: 0, WRITE: 0}
+        self.queued = {READ: 0, WRITE: 0}
+        self.admitted = {READ: 0, WRITE: 0}
+        self.rejected = {
+            (kind, status): 0
+            for kind in (READ, WRITE) for status in (429, 503)
+        }
+        self._queues: dict[str, OrderedDict[str, deque]] = {
+            READ: OrderedDict(), WRITE: OrderedDict()
+        }
+
+    def _has_room(self, kind: str) -> bool:
+        return (
+            self.active[READ] + self.active[WRITE] < self.capacity
+            and self.active[kind] < self.limits[kind]
+        )
+
+    def _expected_wait(self, kind: str) -> float:
+        ahead = self.queued[WRITE]
+        if kind == READ:
+            ahead += self.queued[READ]
+        return self.hold * (ahead + 1) / self.limits[kind]
+
+    def _reject(self, kind: str, status: int, detail: str, wait: float):
+        self.rejected[kind, status] += 1
+        raise HTTPException(
+            status_code=status,
+            detail=detail,
+            headers={'Retry-After': str(max(math.ceil(wait), 1))},
+        )
+
+    async def acquire(self, kind: str, key: str) -> None:
+        queue_free = not self.queued[WRITE] and (
+            kind == WRITE or not self.queued[READ]
+        )
+        if queue_free and self._has_room(kind):
+            self.active[kind] += 1
+            self.admitted[kind] += 1
+            return
+        wait = self._expected_wait(kind)
+        if kind == READ and self.queued[WRITE]:
+            self._reject(kind, 503, OVERLOADED, wait)
+        if wait > self.budgets[kind]:
+            self._reject(kind, 503, OVERLOADED, wait)
+        queue = self._queues[kind].get(key)
+        if queue is not None and len(queue) >= self.customer_queue:
+            self._reject(kind, 429, CUSTOMER_QUEUE_FULL, wait)
+        if queue is None:
+            queue = self._queues[kind][key] = deque()
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self.queued[kind] += 1
+        timer = asyncio.get_running_loop().call_later(
+            self.budgets[kind], self._expire, kind, key, waiter
+        )
+        try:
+            admitted = await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                # место выдано, но не использовано: оценку hold
+                # не трогаем
+                self._free(kind)
+            else:
+                self._remove(kind, key, waiter)
+            raise
+        finally:
+            timer.cancel()
+        if not admitted:
+            self._reject(kind, 503, OVERLOADED, self._expected_wait(kind))
+        self.admitted[kind] += 1
+
+    def _remove(self, kind: str, key: str, waiter: asyncio.Future) -> None:
+        queue = self._queues[kind].get(key)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self.queued[kind] -= 1
+        if not queue:
+            del self._queues[kind][key]
+
+    def _expire(self, kind: str, key: str, waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            self._remove(kind, key, waiter)
+            waiter.set_result(False)
+
+    def release(self, kind: str, held: float) -> None:
+        '''Освобождает место; held - сколько секунд оно было занято.'''
+        self.hold += 0.1 * (held - self.hold)
+        self._free(kind)
+
+    def _free(self, kind: str) -> None:
+        self.active[kind] -= 1
+        for waiting in (WRITE, READ):
+            queues = self._queues[waiting]
+            while queues and self._has_room(waiting):
+                key, queue = next(iter(queues.items()))
+                waiter = queue.popleft()
+                self.queued[waiting] -= 1
+                if queue:
+                    queues.move_to_end(key)
+                else:
+                    del queues[key]
+                # запрос отменен (клиент отключился), но еще не успел
+                # убрать себя из очереди: место ему не выдается
+                if waiter.done():
+                    continue
+                self.active[waiting] += 1
+                waiter.set_result(True)
+
+    @asynccontextmanager
+    async def slot(self, kind: str, key: str):
+        '''Место на время блока. Блок получает функцию, которая
+        освобождает место раньше, например перед долгим потоком
+        событий без обращений к базе.'''
+        await self.acquire(kind, key)
+        started = time.perf_counter()
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.release(kind, time.perf_counter() - started)
+
+        try:
+            yield release
+        finally:
+            release()
+
+    def metrics(self) -> dict:
+        return {
+            kind: {
+                'limit': self.limits[kind],
+                'active': self.active[kind],
+                'queued': self.queued[kind],
+                'admitted': self.admitted[kind],
+                'rejected_429': self.rejected[kind, 429],
+                'rejected_503': self.rejected[kind, 503],
+            }
+            for kind in (READ, WRITE)
+        } | {'hold_avg_ms': self.hold * 1000}
+
+
+def request_key(request: Request) -> str:
+    '''Чья очередь: заказчик из проверенного токена, иначе адрес
+    клиента. customer_id из запроса не используется - его может
+    подставить кто угодно.'''
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() == 'bearer':
+        claims = token_signer.read(token)
+        if claims is not None:
+            return f'customer:{claims.customer_id}'
+    return f'client:{request.client.host if request.client else None}'
+
+
+@asynccontextmanager
+async def admit(request: Request, kind: str):
+    '''Место для запроса, если допуск включен (ADMISSION_CONTROL).'''
+    if admission is None:
+        yield lambda: None
+        return
+    async with admission.slot(kind, request_key(request)) as release:
+        yield release
+
+
+def release_early(session) -> None:
+    '''Освобождает место запроса, выдавшего сессию, до конца ответа.'''
+    session.info.pop('admission_release', lambda: None)()
+
+
+admission: Optional[AdmissionControl] = None
+if settings.ADMISSION_CONTROL:
+    admission = AdmissionControl(
+        capacity=(
+            settings.ADMISSION_CAPACITY
+            or settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+        ),
+        write_reserve=settings.ADMISSION_WRITE_RESERVE,
+        read_budget=settings.ADMISSION_READ_BUDGET,
+        write_budget=settings.ADMISSION_WRITE_BUDGET,
+        customer_queue=settings.ADMISSION_CUSTOMER_QUEUE,
+    )
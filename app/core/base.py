@@ -1,2 +1,7 @@
 from app.core.database import Base
+from app.models.idempotency import IdempotencyKey
 from app.models.models import Customer, Order, Outlet, Visit, Worker
+from app.models.report import (
+    OrderRollup, RollupSource, RollupState, VisitRollup
+)
+from app.models.slow_query import SlowQuery
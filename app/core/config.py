@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -12,6 +14,94 @@ class Settings(BaseSettings):
     DB_NAME_TEST: str
     DB_USER_TEST: str
     DB_PASS_TEST: str
+    # Подключение к базе: логирование SQL, размер пула и соединения
+    # сверх него, ожидание свободного соединения и пересоздание
+    # соединений старше DB_POOL_RECYCLE секунд. DB_POOL_PRE_PING
+    # проверяет соединение перед выдачей (лишний запрос на каждый
+    # захват). DB_STATEMENT_CACHE_SIZE - кэш подготовленных запросов
+    # asyncpg на соединение, 0 для pgbouncer в режиме транзакций.
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = False
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    DB_EXPIRE_ON_COMMIT: bool = False
+    # Журнал медленных SQL-запросов: порог в мс (0 выключает),
+    # файл с ротацией по размеру, запись значений параметров
+    # (по умолчанию пишутся только их типы) и доля медленных SELECT,
+    # для которых план снимается с EXPLAIN ANALYZE
+    SLOW_QUERY_THRESHOLD_MS: float = 500
+    SLOW_QUERY_LOG_FILE: str = 'slow_queries.log'
+    SLOW_QUERY_LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS: int = 5
+    SLOW_QUERY_LOG_PARAMS: bool = False
+    SLOW_QUERY_ANALYZE_SAMPLE: float = 0
+    SLOW_QUERY_QUEUE_SIZE: int = 100
+    # Допуск запросов к базе: всего мест (по умолчанию
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW), сколько из них недоступно чтениям,
+    # допустимое ожидание места в секундах для чтений и записей
+    # и очередь одного заказчика. Сверх этого - 503 или 429.
+    ADMISSION_CONTROL: bool = True
+    ADMISSION_CAPACITY: Optional[int] = None
+    ADMISSION_WRITE_RESERVE: int = 5
+    ADMISSION_READ_BUDGET: float = 0.5
+    ADMISSION_WRITE_BUDGET: float = 2
+    ADMISSION_CUSTOMER_QUEUE: int = 10
+    # Групповой коммит POST /visit/: посещения из разных запросов
+    # пишутся одним INSERT и коммитом - не больше VISIT_GROUP_COMMIT_ROWS
+    # строк, первое посещение ждет пакет не дольше
+    # VISIT_GROUP_COMMIT_DELAY_MS
+    VISIT_GROUP_COMMIT: bool = False
+    VISIT_GROUP_COMMIT_ROWS: int = 100
+    VISIT_GROUP_COMMIT_DELAY_MS: float = 2
+    # Сводки для /report/...: фоновая задача обновляет их раз
+    # в REPORT_REFRESH_INTERVAL секунд, по REPORT_REFRESH_BATCH
+    # номеров изменений за транзакцию
+    REPORT_REFRESH_INTERVAL: float = 5
+    REPORT_REFRESH_BATCH: int = 10000
+    # Подпись токенов POST /auth/login и их срок действия в секундах.
+    # Без ключа приложение не запускается, а с DEBUG=true токены
+    # подписываются случайным ключом процесса.
+    DEBUG: bool = False
+    AUTH_SECRET_KEY: Optional[str] = None
+    AUTH_TOKEN_TTL: int = 86400
+    # Кэш привязок работник -> торговые точки в памяти процесса
+    MEMBERSHIP_INDEX: bool = False
+    MEMBERSHIP_INDEX_TTL: int = 300
+    # Кэш заказчиков для проверки по номеру телефона,
+    # CUSTOMER_CACHE_SIZE=0 выключает кэш. С Redis запись в памяти
+    # процесса живет CUSTOMER_CACHE_LOCAL_TTL секунд перед Redis.
+    CUSTOMER_CACHE_SIZE: int = 10000
+    CUSTOMER_CACHE_TTL: int = 60
+    CUSTOMER_CACHE_REDIS_URL: Optional[str] = None
+    CUSTOMER_CACHE_LOCAL_TTL: float = 5
+    # Сколько объектов можно передать в одном пакетном запросе
+    BULK_MAX_SIZE: int = 10000
+    # Сколько выгрузок /export идет одновременно. Выгрузка держит
+    # соединение с базой до конца потока, но места в допуске
+    # не занимает: ее чтение допускается только до начала потока.
+    EXPORT_MAX_CONCURRENT: int = 2
+    # Сколько секунд хранится ответ на запрос с Idempotency-Key
+    # и сколько секунд ключ считается занятым выполняющимся запросом
+    IDEMPOTENCY_KEY_TTL: int = 86400
+    IDEMPOTENCY_LOCK_TIMEOUT: int = 30
+    # Поток событий заказов GET /order/events: размер очереди
+    # на подписчика, пауза перед переподключением LISTEN и интервал
+    # пустых сообщений, поддерживающих соединение
+    EVENTS_QUEUE_SIZE: int = 100
+    EVENTS_RECONNECT_DELAY: float = 1
+    EVENTS_HEARTBEAT: float = 15
+    # Реплики для ручек чтения, JSON-список строк подключения
+    # postgresql+asyncpg://...; реплика, отстающая больше
+    # DB_REPLICA_MAX_LAG секунд, пропускается, отставание проверяется
+    # в фоне раз в DB_REPLICA_CHECK_INTERVAL секунд. После своей записи
+    # клиент DB_REPLICA_STICKY_SECONDS секунд читает из основной базы.
+    DB_REPLICA_URLS: list[str] = []
+    DB_REPLICA_MAX_LAG: float = 5
+    DB_REPLICA_CHECK_INTERVAL: float = 1
+    DB_REPLICA_STICKY_SECONDS: int = 10
 
     @property
     def database_url_asyncpg(self):
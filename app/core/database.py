@@ -1,8 +1,11 @@
+from fastapi import Request
 from sqlalchemy import create_engine, MetaData
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
+from app.core.admission import WRITE, admit
 from app.core.config import settings
+from app.core.pool import MeteredQueuePool
 
 
 class Base(DeclarativeBase):
@@ -10,24 +13,49 @@ class Base(DeclarativeBase):
 
 metadata = MetaData()
 
+# Общие настройки пула для основной базы и реплик
+POOL_OPTIONS = dict(
+    echo=settings.DB_ECHO,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+
+
+def make_async_engine(url: str):
+    return create_async_engine(
+        url=url,
+        poolclass=MeteredQueuePool,
+        connect_args={
+            'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE
+        },
+        **POOL_OPTIONS,
+    )
+
+
+def make_async_session(engine) -> async_sessionmaker:
+    return async_sessionmaker(
+        engine, expire_on_commit=settings.DB_EXPIRE_ON_COMMIT
+    )
+
 
 sync_engine = create_engine(
     url=settings.database_url_psycopg,
-    echo=True,
-    pool_size=5,
-    max_overflow=10
+    **POOL_OPTIONS,
 )
 
-async_engine = create_async_engine(
-    url=settings.database_url_asyncpg,
-    echo=True
-)
+async_engine = make_async_engine(settings.database_url_asyncpg)
 
-async_session = async_sessionmaker(async_engine)
+async_session = make_async_session(async_engine)
 sync_session = sessionmaker(sync_engine)
 
 
-# Генератор для получения сессии
-async def get_async_session():
-    async with async_session() as session:
-        yield session
+# Генератор для получения сессии, запрос сначала проходит допуск
+# (app/core/admission.py)
+async def get_async_session(request: Request):
+    async with admit(request, WRITE) as release:
+        async with async_session() as session:
+            session.info['admission_release'] = release
+            yield session
@@ -0,0 +1,204 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Границы корзин гистограмм в секундах
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# Метка route для запросов вне ручек API (админка, 404)
+UNMATCHED_ROUTE = 'other'
+
+# [число SQL-запросов, время в базе, начало текущего SQL-запроса]
+# текущего HTTP-запроса
+_request_db: ContextVar[Optional[list]] = ContextVar(
+    'request_db', default=None
+)
+# ASGI scope текущего HTTP-запроса
+_request_scope: ContextVar[Optional[dict]] = ContextVar(
+    'request_scope', default=None
+)
+
+
+def route_label(scope: dict) -> str:
+    route = scope.get('route')
+    return route.path if route is not None else UNMATCHED_ROUTE
+
+
+def current_endpoint() -> Optional[str]:
+    '''Метод и шаблон пути обрабатываемого HTTP-запроса.'''
+    scope = _request_scope.get()
+    if scope is None:
+        return None
+    return f"{scope['method']} {route_label(scope)}"
+
+
+class Histogram:
+    '''Гистограмма в формате Prometheus: счетчики по корзинам,
+    сумма и количество наблюдений для каждого набора меток.'''
+
+    def __init__(self, name: str, doc: str, buckets: tuple) -> None:
+        self.name = name
+        self.doc = doc
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names: tuple) -> list[str]:
+        lines = [
+            f'# HELP {self.name} {self.doc}',
+            f'# TYPE {self.name} histogram',
+        ]
+        for labels, series in self._series.items():
+            common = ','.join(
+                f'{name}="{value}"'
+                for name, value in zip(label_names, labels)
+            )
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{common},le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            lines.append(
+                f'{self.name}_bucket{{{common},le="+Inf"}} {series[-1]}'
+            )
+            lines.append(f'{self.name}_sum{{{common}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{common}}} {series[-1]}')
+        return lines
+
+
+class RequestMetrics:
+    '''Время ответа, число SQL-запросов и время в базе по ручкам.
+
+    Ручка определяется шаблоном пути (/order/{order_id}), поэтому
+    число рядов метрик не растет с числом разных id.'''
+
+    label_names = ('method', 'route', 'status')
+
+    def __init__(self) -> None:
+        self.latency = Histogram(
+            'http_request_duration_seconds',
+            'Время обработки запроса.',
+            LATENCY_BUCKETS,
+        )
+        self.db_time = Histogram(
+            'http_request_db_seconds',
+            'Время выполнения SQL-запросов за один HTTP-запрос.',
+            LATENCY_BUCKETS,
+        )
+        self.statements: dict[tuple, int] = {}
+
+    def observe(
+        self, labels: tuple, elapsed: float, statements: int, db_time: float
+    ) -> None:
+        self.latency.observe(labels, elapsed)
+        self.db_time.observe(labels, db_time)
+        self.statements[labels] = self.statements.get(labels, 0) + statements
+
+    def render(self) -> list[str]:
+        lines = self.latency.render(self.label_names)
+        lines += self.db_time.render(self.label_names)
+        lines += [
+            '# HELP http_request_db_statements_total '
+            'SQL-запросы, выполненные при обработке HTTP-запросов.',
+            '# TYPE http_request_db_statements_total counter',
+        ]
+        for labels, count in self.statements.items():
+            common = ','.join(
+                f'{name}="{value}"'
+                for name, value in zip(self.label_names, labels)
+            )
+            lines.append(
+                f'http_request_db_statements_total{{{common}}} {count}'
+            )
+        return lines
+
+
+def _before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+) -> None:
+    request_db = _request_db.get()
+    if request_db is not None:
+        request_db[2] = time.perf_counter()
+
+
+def _after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+) -> None:
+    request_db = _request_db.get()
+    if request_db is not None:
+        request_db[0] += 1
+        request_db[1] += time.perf_counter() - request_db[2]
+
+
+def track_engine(engine: AsyncEngine) -> None:
+    '''Учитывать SQL-запросы движка в метриках HTTP-запросов.'''
+    event.listen(
+        engine.sync_engine, 'before_cursor_execute', _before_cursor_execute
+    )
+    event.listen(
+        engine.sync_engine, 'after_cursor_execute', _after_cursor_execute
+    )
+
+
+def untrack_engine(engine: AsyncEngine) -> None:
+    event.remove(
+        engine.sync_engine, 'before_cursor_execute', _before_cursor_execute
+    )
+    event.remove(
+        engine.sync_engine, 'after_cursor_execute', _after_cursor_execute
+    )
+
+
+class RequestMetricsMiddleware:
+    '''ASGI-прослойка, записывающая метрики каждого HTTP-запроса.'''
+
+    def __init__(self, app, metrics: RequestMetrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        request_db = [0, 0.0, 0.0]
+        token = _request_db.set(request_db)
+        scope_token = _request_scope.set(scope)
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db.reset(token)
+            _request_scope.reset(scope_token)
+            self.metrics.observe(
+                (scope['method'], route_label(scope), status),
+                elapsed,
+                request_db[0],
+                request_db[1],
+            )
+
+
+request_metrics = RequestMetrics()
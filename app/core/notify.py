@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import json
+import logging
+from typing import Hashable, Iterable, Optional
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Канал NOTIFY с событиями заказов
+ORDER_EVENTS_CHANNEL = 'order_events'
+
+# Событие, после которого клиенту нужно догрузить пропущенное
+# через GET /sync/changes: переподключение LISTEN или переполнение очереди
+RESYNC_EVENT = {'event': 'resync'}
+
+
+class NotifyHub:
+    '''Одно LISTEN-соединение asyncpg на процесс приложения.
+
+    Подписчик получает очередь событий по набору ключей,
+    ключи события берутся функцией keys_of из его содержимого.
+    Соединение открывается при первой подписке, закрывается после
+    ухода последнего подписчика и переподключается при обрыве,
+    подписчикам в этом случае отправляется RESYNC_EVENT.'''
+
+    def __init__(
+        self,
+        dsn: str,
+        channel: str,
+        keys_of,
+        queue_size: int,
+        reconnect_delay: float,
+    ) -> None:
+        self.dsn = dsn
+        self.channel = channel
+        self.keys_of = keys_of
+        self.queue_size = queue_size
+        self.reconnect_delay = reconnect_delay
+        self._subscribers: dict[Hashable, set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Optional[asyncpg.Connection] = None
+
+    def subscribe(self, keys: Iterable[Hashable]) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        for key in keys:
+            self._subscribers.setdefault(key, set()).add(queue)
+        if self._task is None or self._task.done():
+            # задача не наследует контекст запроса, в котором создана
+            self._task = contextvars.Context().run(
+                asyncio.get_running_loop().create_task, self._listen()
+            )
+        return queue
+
+    def unsubscribe(
+        self, queue: asyncio.Queue, keys: Iterable[Hashable]
+    ) -> None:
+        for key in keys:
+            queues = self._subscribers.get(key)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[key]
+        if not self._subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(set().union(*self._subscribers.values()))
+
+    @property
+    def connected(self) -> bool:
+        '''Открыто ли LISTEN-соединение.'''
+        return self._conn is not None
+
+    async def _listen(self) -> None:
+        reconnected = False
+        while True:
+            try:
+                conn = await asyncpg.connect(self.dsn)
+            except (OSError, asyncpg.PostgresError):
+                logger.warning('LISTEN %s: нет соединения', self.channel)
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda _: closed.set())
+            try:
+                await conn.add_listener(self.channel, self._dispatch)
+                self._conn = conn
+                if reconnected:
+                    self._broadcast(RESYNC_EVENT)
+                await closed.wait()
+            finally:
+                self._conn = None
+                if not conn.is_closed():
+                    await conn.close()
+            logger.warning('LISTEN %s: соединение потеряно', self.channel)
+            reconnected = True
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _dispatch(self, conn, pid, channel, payload: str) -> None:
+        event = json.loads(payload)
+        queues = set()
+        for key in self.keys_of(event):
+            queues |= self._subscribers.get(key, set())
+        for queue in queues:
+            self._put(queue, event)
+
+    def _broadcast(self, event: dict) -> None:
+        for queue in set().union(*self._subscribers.values()):
+            self._put(queue, event)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event: dict) -> None:
+        '''Медленный клиент не держит память процесса: при переполнении
+        его очередь очищается и он получает RESYNC_EVENT.'''
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC_EVENT)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _order_event_keys(event: dict) -> list[tuple[str, int]]:
+    return [
+        ('customer', event.get('customer_id')),
+        ('worker', event.get('worker_id')),
+    ]
+
+
+order_events = NotifyHub(
+    dsn=make_url(settings.database_url_asyncpg)
+    .set(drivername='postgresql')
+    .render_as_string(hide_password=False),
+    channel=ORDER_EVENTS_CHANNEL,
+    keys_of=_order_event_keys,
+    queue_size=settings.EVENTS_QUEUE_SIZE,
+    reconnect_delay=settings.EVENTS_RECONNECT_DELAY,
+)
@@ -0,0 +1,46 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    '''Пул соединений, который считает ожидание свободного соединения
+    и отказы по pool_timeout. В ожидание входит и открытие нового
+    соединения сверх pool_size.'''
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def metrics(self) -> dict:
+        return {
+            'pool_size': self.size(),
+            'max_overflow': self._max_overflow,
+            'checked_in': self.checkedin(),
+            'checked_out': self.checkedout(),
+            'overflow': max(self.overflow(), 0),
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'wait_avg_ms': (
+                self.wait_total / self.checkouts * 1000
+                if self.checkouts else 0.0
+            ),
+            'wait_max_ms': self.wait_max * 1000,
+        }
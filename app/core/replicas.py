@@ -0,0 +1,167 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.datastructures import MutableHeaders
+
+from app.core.admission import READ, admit
+from app.core.config import settings
+from app.core.database import (
+    async_session, make_async_engine, make_async_session
+)
+
+logger = logging.getLogger(__name__)
+
+# Cookie, с которым чтения клиента идут в основную базу:
+# выставляется ответом на успешный запрос записи
+READ_YOUR_WRITES_COOKIE = 'db_primary'
+READ_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+# Отставание реплики в секундах. Реплика без входящих изменений
+# (принятый WAL уже применен) не отстает, сколько бы ни простаивала.
+REPLICA_LAG = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() '
+    'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class Replica:
+
+    def __init__(self, url: str) -> None:
+        self.engine = make_async_engine(url)
+        self.session = make_async_session(self.engine)
+        self.lag: Optional[float] = None
+        self.checked = -float('inf')
+
+
+class ReplicaRouter:
+    '''Выбор реплики для запросов на чтение по кругу.
+
+    Отставание реплик раз в check_interval секунд проверяет фоновая
+    задача, запросы пользуются последним результатом и не ждут
+    проверки. Реплика, которая отстает больше max_lag, недоступна
+    или давно не проверялась, пропускается; если подходящих нет,
+    чтение идет в основную базу.'''
+
+    def __init__(
+        self, urls: list[str], max_lag: float, check_interval: float
+    ) -> None:
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._turn = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        '''Запускает фоновую проверку отставания, если она еще не идет.'''
+        if self.replicas and (self._task is None or self._task.done()):
+            # задача не наследует контекст запроса, в котором создана
+            self._task = contextvars.Context().run(
+                asyncio.get_running_loop().create_task, self._watch()
+            )
+
+    async def choose(self) -> Optional[async_sessionmaker]:
+        self.start()
+        for _ in self.replicas:
+            replica = self.replicas[next(self._turn) % len(self.replicas)]
+            if self._fresh(replica):
+                return replica.session
+        return None
+
+    def _fresh(self, replica: Replica) -> bool:
+        # проверка раз в check_interval и не дольше check_interval:
+        # результат старше трех интервалов значит, что проверка застряла
+        return (
+            replica.lag is not None
+            and replica.lag <= self.max_lag
+            and time.monotonic() - replica.checked <= 3 * self.check_interval
+        )
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.gather(
+                *(self._check(replica) for replica in self.replicas)
+            )
+            await asyncio.sleep(self.check_interval)
+
+    async def _check(self, replica: Replica) -> None:
+        try:
+            replica.lag = await asyncio.wait_for(
+                self._lag(replica), self.check_interval
+            )
+        except (OSError, SQLAlchemyError, asyncio.TimeoutError):
+            logger.warning('Реплика %s недоступна', replica.engine.url)
+            replica.lag = None
+        replica.checked = time.monotonic()
+
+    @staticmethod
+    async def _lag(replica: Replica) -> Optional[float]:
+        async with replica.engine.connect() as conn:
+            return await conn.scalar(REPLICA_LAG)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+class ReadYourWritesMiddleware:
+    '''Выставляет READ_YOUR_WRITES_COOKIE на sticky секунд после
+    успешного запроса записи, чтобы клиент сразу видел свои
+    изменения, не дожидаясь реплик.'''
+
+    def __init__(self, app, sticky: int) -> None:
+        self.app = app
+        self.cookie = (
+            f'{READ_YOUR_WRITES_COOKIE}=1; Max-Age={sticky}; Path=/; '
+            f'HttpOnly; SameSite=lax'
+        )
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or scope['method'] in READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message) -> None:
+            if (
+                message['type'] == 'http.response.start'
+                and message['status'] < 400
+            ):
+                MutableHeaders(scope=message).append(
+                    'set-cookie', self.cookie
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+replicas = ReplicaRouter(
+    urls=settings.DB_REPLICA_URLS,
+    max_lag=settings.DB_REPLICA_MAX_LAG,
+    check_interval=settings.DB_REPLICA_CHECK_INTERVAL,
+)
+
+
+# Генератор сессии для ручек, которые только читают
+async def get_read_session(request: Request):
+    async with admit(request, READ) as release:
+        session_maker = None
+        if READ_YOUR_WRITES_COOKIE not in request.cookies:
+            session_maker = await replicas.choose()
+        async with (session_maker or async_session)() as session:
+            session.info['admission_release'] = release
+            yield session
@@ -0,0 +1,89 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from typing import NamedTuple, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenClaims(NamedTuple):
+    customer_id: int
+    outlet_id: int
+    expires: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+class TokenSigner:
+    '''Токен заказчика: base64url(JSON с customer_id, outlet_id и сроком)
+    и HMAC-SHA256 от него через точку. Проверяется без обращения
+    к базе, поэтому действует до истечения срока.'''
+
+    def __init__(self, secret_key: str, ttl: int) -> None:
+        self.key = secret_key.encode()
+        self.ttl = ttl
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(
+            hmac.new(self.key, payload.encode(), hashlib.sha256).digest()
+        )
+
+    def issue(self, customer_id: int, outlet_id: int) -> str:
+        payload = _b64encode(json.dumps(
+            {
+                'customer_id': customer_id,
+                'outlet_id': outlet_id,
+                'exp': int(time.time()) + self.ttl,
+            },
+            separators=(',', ':'),
+        ).encode())
+        return f'{payload}.{self._sign(payload)}'
+
+    def read(self, token: str) -> Optional[TokenClaims]:
+        '''Данные токена или None для поддельного и просроченного.'''
+        payload, _, signature = token.partition('.')
+        if not hmac.compare_digest(
+            signature.encode(), self._sign(payload).encode()
+        ):
+            return None
+        try:
+            data = json.loads(_b64decode(payload))
+            claims = TokenClaims(
+                data['customer_id'], data['outlet_id'], data['exp']
+            )
+        except (ValueError, KeyError, TypeError):
+            return None
+        if claims.expires < time.time():
+            return None
+        return claims
+
+
+def _secret_key() -> str:
+    if settings.AUTH_SECRET_KEY:
+        return settings.AUTH_SECRET_KEY
+    if not settings.DEBUG:
+        raise RuntimeError(
+            'AUTH_SECRET_KEY не задан: токен, подписанный случайным ключом '
+            'одного процесса, не примут другие. Задайте ключ '
+            '(или DEBUG=true для разработки)'
+        )
+    logger.warning(
+        'AUTH_SECRET_KEY не задан: токены подписываются случайным ключом '
+        'и действуют только в этом процессе до перезапуска'
+    )
+    return secrets.token_urlsafe(32)
+
+
+token_signer = TokenSigner(_secret_key(), settings.AUTH_TOKEN_TTL)
@@ -0,0 +1,247 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.core.metrics import current_endpoint
+from app.models.slow_query import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w$])-?\d+(?:\.\d+)?\b')
+_PARAMETER = re.compile(r'\$\d+')
+_SPACES = re.compile(r'\s+')
+_VALUE_LISTS = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+# Что EXPLAIN ANALYZE выполнил бы с последствиями вне откатываемой
+# транзакции или с ожиданием чужих блокировок
+_SIDE_EFFECTS = re.compile(
+    r'\b(?:pg_(?:try_)?advisory\w*|nextval|setval|pg_notify|pg_sleep\w*'
+    r'|lo_\w+|dblink\w*)\s*\('
+    r'|\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE)\b'
+    r'|\bFOR\s+KEY\s+SHARE\b',
+    re.IGNORECASE,
+)
+_FROM = re.compile(r'\bFROM\b', re.IGNORECASE)
+
+
+def normalize(statement: str) -> str:
+    '''Запрос без значений: строки, числа и параметры заменены на ?,
+    списки значений IN (...) свернуты в (...).'''
+    statement = _STRING.sub('?', statement)
+    statement = _PARAMETER.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _VALUE_LISTS.sub('(...)', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def analyzable(statement: str) -> bool:
+    '''Можно ли выполнить запрос ради EXPLAIN ANALYZE: обычный SELECT
+    из таблиц без блокировок строк и функций с побочными эффектами.'''
+    return (
+        statement.lstrip()[:6].upper() == 'SELECT'
+        and _FROM.search(statement) is not None
+        and _SIDE_EFFECTS.search(statement) is None
+    )
+
+
+def _redact(parameters) -> list:
+    return [f'<{type(value).__name__}>' for value in parameters]
+
+
+class SlowQueryLog:
+    '''Журнал SQL-запросов дольше порога.
+
+    События движка только замеряют время и ставят медленный запрос
+    в очередь, план (EXPLAIN, для доли читающих SELECT - EXPLAIN
+    ANALYZE в откатываемой транзакции только для чтения) снимается фоновой задачей на отдельном
+    соединении, мимо событий движка. Запись попадает в файл с ротацией
+    и в таблицу slow_query основной базы (план запроса к реплике
+    снимается на реплике). При переполнении очереди запрос пишется
+    в файл без плана.'''
+
+    def __init__(
+        self,
+        threshold_ms: float,
+        log_file: str,
+        max_bytes: int,
+        backups: int,
+        log_params: bool,
+        analyze_sample: float,
+        queue_size: int,
+    ) -> None:
+        self.threshold = threshold_ms / 1000
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.log_params = log_params
+        self.analyze_sample = analyze_sample
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._engines: dict = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._file_logger: Optional[logging.Logger] = None
+
+    def watch(self, engine: AsyncEngine) -> None:
+        if self.threshold <= 0:
+            return
+        self._engines[engine.sync_engine] = engine
+        event.listen(
+            engine.sync_engine, 'before_cursor_execute', self._before
+        )
+        event.listen(engine.sync_engine, 'after_cursor_execute', self._after)
+
+    @staticmethod
+    def _before(
+        conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        conn.info['slow_query_started'] = time.perf_counter()
+
+    def _after(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        elapsed = time.perf_counter() - conn.info['slow_query_started']
+        if elapsed < self.threshold:
+            return
+        if not conn.get_execution_options().get('slow_query_log', True):
+            return
+        normalized = normalize(statement)
+        record = {
+            'endpoint': current_endpoint(),
+            'duration_ms': round(elapsed * 1000, 3),
+            'fingerprint': fingerprint(normalized),
+            'statement': normalized,
+            'parameters': None,
+            'plan': None,
+            'analyzed': False,
+        }
+        if not executemany:
+            record['parameters'] = (
+                json.loads(json.dumps(list(parameters), default=str))
+                if self.log_params else _redact(parameters)
+            )
+        self._enqueue(
+            record,
+            self._engines[conn.engine],
+            None if executemany else (statement, tuple(parameters)),
+        )
+
+    def _enqueue(self, record: dict, engine, query: Optional[tuple]):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+        if self._task is None or self._task.done():
+            # задача не наследует контекст запроса, в котором создана
+            self._task = contextvars.Context().run(
+                asyncio.get_running_loop().create_task, self._work()
+            )
+        try:
+            self._queue.put_nowait((record, engine, query))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self._write_file(record)
+
+    async def _work(self) -> None:
+        while True:
+            record, engine, query = await self._queue.get()
+            try:
+                if query is not None:
+                    await self._explain(record, engine, *query)
+                self._write_file(record)
+                await self._write_table(record)
+            except Exception:
+                logger.exception('Не удалось записать медленный запрос')
+
+    async def _explain(
+        self, record: dict, engine, statement: str, parameters: tuple
+    ) -> None:
+        analyze = (
+            analyzable(statement) and random.random() < self.analyze_sample
+        )
+        options = 'FORMAT JSON'
+        if analyze:
+            options = 'ANALYZE, BUFFERS, ' + options
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            driver = raw.driver_connection
+            transaction = driver.transaction(readonly=True)
+            await transaction.start()
+            try:
+                plan = await driver.fetchval(
+                    f'EXPLAIN ({options}) {statement}', *parameters
+                )
+            except asyncpg.PostgresError as error:
+                record['plan_error'] = str(error)
+                return
+            finally:
+                await transaction.rollback()
+        # соединения движка уже декодируют json
+        record['plan'] = json.loads(plan) if isinstance(plan, str) else plan
+        record['analyzed'] = analyze
+
+    def _write_file(self, record: dict) -> None:
+        if self._file_logger is None:
+            handler = RotatingFileHandler(
+                self.log_file,
+                maxBytes=self.max_bytes,
+                backupCount=self.backups,
+                encoding='utf-8',
+            )
+            self._file_logger = logging.getLogger(f'{__name__}.file')
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(handler)
+        self._file_logger.info(
+            json.dumps(
+                {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), **record},
+                ensure_ascii=False,
+                default=str,
+            )
+        )
+
+    @staticmethod
+    async def _write_table(record: dict) -> None:
+        values = {
+            key: value for key, value in record.items()
+            if key != 'plan_error'
+        }
+        async with async_engine.connect() as conn:
+            conn = await conn.execution_options(slow_query_log=False)
+            await conn.execute(insert(SlowQuery).values(**values))
+            await conn.commit()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+    log_file=settings.SLOW_QUERY_LOG_FILE,
+    max_bytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+    backups=settings.SLOW_QUERY_LOG_BACKUPS,
+    log_params=settings.SLOW_QUERY_LOG_PARAMS,
+    analyze_sample=settings.SLOW_QUERY_ANALYZE_SAMPLE,
+    queue_size=settings.SLOW_QUERY_QUEUE_SIZE,
+)
@@ -0,0 +1,209 @@
+from sqlalchemy import (
+    CTE, Integer, Select, bindparam, case, cast, column, delete, event, func,
+    insert, literal, select, table, text, update
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+
+from app.models.models import Order, Tombstone, Visit, change_sequence
+
+# Пишущая транзакция до получения первого номера изменения берет
+# разделяемую advisory-блокировку с двумя ключами: старшими и младшими
+# 32 битами последнего выданного номера, все ее номера будут больше.
+# Чтение изменений ничего не блокирует, а ищет в pg_locks наименьший
+# такой номер у незавершенных транзакций. Блокировки с двумя ключами
+# в приложении больше ни для чего не используются.
+CHANGE_ENTITIES = {Order: 'order', Visit: 'visit'}
+
+change_seq_state = table(
+    'change_seq', column('last_value'), column('is_called')
+)
+
+
+def _issued_seq() -> Select:
+    '''Последний выданный номер изменения, 0 - если номеров не было.'''
+    return select(case(
+        (change_seq_state.c.is_called, change_seq_state.c.last_value),
+        else_=0,
+    ).label('seq'))
+
+
+async def lock_changes(session: AsyncSession) -> None:
+    '''Для записей в обход ORM (INSERT пачкой): объявить транзакцию
+    пишущей до того, как строки получат номер изменения.'''
+    if not session.info.get('changes_locked'):
+        await session.execute(_changes_lock())
+        session.info['changes_locked'] = True
+
+
+def _changes_lock():
+    '''Разделяемая блокировка на последний выданный номер изменения.
+    Внутри запроса записи вычисляется раньше, чем строки получат
+    номер изменения.'''
+    issued = _issued_seq().subquery('issued')
+    return select(
+        func.pg_advisory_xact_lock_shared(
+            cast(issued.c.seq.op('>>')(32), Integer),
+            cast(issued.c.seq.op('<<')(32).op('>>')(32), Integer),
+        ).label('locked')
+    ).select_from(issued)
+
+
+def insert_changed(model, values: dict) -> Select:
+    '''INSERT ... RETURNING одним запросом вместе с блокировкой
+    счетчика изменений. Номер изменения берется из значения
+    по умолчанию столбца change_seq.'''
+    table = model.__table__
+    source = select(*(
+        bindparam(key, value, type_=table.c[key].type)
+        for key, value in values.items()
+    )).select_from(_changes_lock().subquery('changes_lock'))
+    changed = (
+        insert(table)
+        .from_select(list(values), source)
+        .returning(*table.c)
+        .cte(f'{table.name}_changed')
+    )
+    return select(changed)
+
+
+def update_changed(model, obj_id: int, values: dict) -> Select:
+    '''UPDATE ... RETURNING одним запросом: кроме values
+    увеличивает version и выдает новый номер изменения.'''
+    return select(
+        update_changed_cte(model, model.__table__.c.id == obj_id, values)
+    )
+
+
+def update_changed_cte(model, whereclause, values: dict) -> CTE:
+    '''CTE с UPDATE ... RETURNING из update_changed для всех строк,
+    подходящих под whereclause.'''
+    table = model.__table__
+    return (
+        update(table)
+        .where(
+            whereclause,
+            _changes_lock().scalar_subquery().is_not(None),
+        )
+        .values(
+            **values,
+            version=table.c.version + 1,
+            change_seq=change_sequence.next_value(),
+        )
+        .returning(*table.c)
+        .cte(f'{table.name}_changed')
+    )
+
+
+def delete_changed(model, obj_id: int) -> Select:
+    '''DELETE ... RETURNING одним запросом вместе с записью
+    в tombstone. У заказа вместе с ним удаляется посещение,
+    как при каскадном удалении через ORM.'''
+    table = model.__table__
+    changed = (
+        delete(table)
+        .where(
+            table.c.id == obj_id,
+            _changes_lock().scalar_subquery().is_not(None),
+        )
+        .returning(*table.c)
+        .cte(f'{table.name}_changed')
+    )
+    gone = select(literal(CHANGE_ENTITIES[model]), changed.c.id)
+    if model is Order:
+        visits = (
+            delete(Visit)
+            .where(Visit.order_id == obj_id)
+            .returning(Visit.id)
+            .cte('visit_changed')
+        )
+        gone = gone.union_all(
+            select(literal(CHANGE_ENTITIES[Visit]), visits.c.id)
+        )
+    tombstones = insert(Tombstone).from_select(
+        ['entity', 'entity_id'], gone
+    ).cte('tombstones')
+    return select(changed).add_cte(tombstones)
+
+
+async def changes_watermark(session: AsyncSession) -> int:
+    '''Номер, до которого все изменения уже закоммичены.
+
+    Сначала читается последний выданный номер, затем блокировки
+    незавершенных пишущих транзакций. Транзакция, получившая номер
+    не больше прочитанного, к этому времени либо завершена, либо уже
+    держит блокировку с меньшим номером. Чтение не ждет записи.'''
+    issued = await session.scalar(_issued_seq())
+    writing = await session.scalar(text(
+        'SELECT min((classid::bigint << 32) | objid::bigint) FROM pg_locks '
+        "WHERE locktype = 'advisory' AND objsubid = 2 AND granted "
+        'AND database = (SELECT oid FROM pg_database '
+        'WHERE datname = current_database())'
+    ))
+    return issued if writing is None else min(issued, writing)
+
+
+async def get_changes(
+    session: AsyncSession, since: int, limit: int
+) -> dict:
+    '''Заказы, посещения и удаления с номером изменения больше since,
+    не больше limit штук в порядке изменений.'''
+    watermark = await changes_watermark(session)
+    changed = []
+    for model in (Order, Visit, Tombstone):
+        result = await session.scalars(
+            select(model)
+            .where(model.change_seq > since, model.change_seq <= watermark)
+            .order_by(model.change_seq)
+            .limit(limit + 1)
+        )
+        changed.extend(result)
+    changed.sort(key=lambda obj: obj.change_seq)
+    has_more = len(changed) > limit
+    changed = changed[:limit]
+    return {
+        'orders': [obj for obj in changed if isinstance(obj, Order)],
+        'visits': [obj for obj in changed if isinstance(obj, Visit)],
+        'deleted': [obj for obj in changed if isinstance(obj, Tombstone)],
+        'next_since': (
+            changed[-1].change_seq if has_more else max(since, watermark)
+        ),
+        'has_more': has_more,
+    }
+
+
+@event.listens_for(Session, 'before_flush')
+def _lock_changes_before_flush(session, flush_context, instances) -> None:
+    if session.info.get('changes_locked'):
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if type(obj) in CHANGE_ENTITIES:
+            session.execute(_changes_lock())
+            session.info['changes_locked'] = True
+            return
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _forget_changes_lock(session, transaction) -> None:
+    session.info.pop('changes_locked', None)
+
+
+@event.listens_for(Order, 'before_update')
+@event.listens_for(Visit, 'before_update')
+def _next_change_seq(mapper, connection, target) -> None:
+    session = object_session(target)
+    if session is not None and session.is_modified(
+        target, include_collections=False
+    ):
+        target.change_seq = change_sequence.next_value()
+
+
+@event.listens_for(Order, 'after_delete')
+@event.listens_for(Visit, 'after_delete')
+def _add_tombstone(mapper, connection, target) -> None:
+    connection.execute(
+        insert(Tombstone).values(
+            entity=CHANGE_ENTITIES[type(target)], entity_id=target.id
+        )
+    )
+
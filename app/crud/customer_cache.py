@@ -0,0 +1,260 @@
+import asyncio
+import contextvars
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import MissingGreenlet
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+
+from app.core.config import settings
+from app.models.models import Customer
+
+logger = logging.getLogger(__name__)
+
+# Канал Redis, по которому процессы сообщают об измененных заказчиках
+INVALIDATE_CHANNEL = 'customer_identity_invalidate'
+
+
+class CustomerIdentity(NamedTuple):
+    phone_number: str
+    outlet_id: int
+
+
+class CustomerIdentityCache:
+    '''customer_id -> (phone_number, outlet_id) для проверки
+    заказчика на ручках записи.
+
+    Первый уровень - LRU в памяти процесса с TTL, второй
+    (необязательный) - Redis, общий для всех процессов приложения.
+    С Redis запись в памяти живет local_ttl секунд, а изменение
+    заказчика, кроме удаления ключа в Redis, рассылается всем процессам
+    через Redis pub/sub. Память процесса используется, только пока
+    он подписан на рассылку. Кэшируются только существующие
+    заказчики: отсутствие заказчика всегда проверяется в базе.'''
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        redis_url: Optional[str] = None,
+        local_ttl: Optional[float] = None,
+        reconnect_delay: float = 1,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis_url = redis_url
+        self.local_ttl = ttl if local_ttl is None else min(local_ttl, ttl)
+        self.reconnect_delay = reconnect_delay
+        self._redis = None
+        self._local: OrderedDict[int, tuple[float, CustomerIdentity]] = (
+            OrderedDict()
+        )
+        self._subscribed = False
+        self._task: Optional[asyncio.Task] = None
+        self._pending: set[asyncio.Task] = set()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    @property
+    def local_enabled(self) -> bool:
+        return self.enabled and (not self.redis_url or self._subscribed)
+
+    def _get_redis(self):
+        if self.redis_url and self._redis is None:
+            import aioredis
+            self._redis = aioredis.from_url(self.redis_url)
+        if self._redis is not None and (
+            self._task is None or self._task.done()
+        ):
+            # задача не наследует контекст запроса, в котором создана
+            self._task = contextvars.Context().run(
+                asyncio.get_running_loop().create_task, self._listen()
+            )
+        return self._redis
+
+    @staticmethod
+    def _redis_key(customer_id: int) -> str:
+        return f'customer_identity:{customer_id}'
+
+    async def get(self, customer_id: int) -> Optional[CustomerIdentity]:
+        if not self.enabled:
+            return None
+        redis = self._get_redis()
+        entry = self._local.get(customer_id) if self.local_enabled else None
+        if entry is not None:
+            expires, identity = entry
+            if expires > time.monotonic():
+                self._local.move_to_end(customer_id)
+                self.hits += 1
+                return identity
+            del self._local[customer_id]
+        if redis is not None:
+            raw = await redis.get(self._redis_key(customer_id))
+            if raw is not None:
+                identity = CustomerIdentity(*json.loads(raw))
+                self._set_local(customer_id, identity)
+                self.redis_hits += 1
+                return identity
+        self.misses += 1
+        return None
+
+    async def set(self, customer_id: int, identity: CustomerIdentity) -> None:
+        if not self.enabled:
+            return
+        self._set_local(customer_id, identity)
+        redis = self._get_redis()
+        if redis is not None:
+            await redis.set(
+                self._redis_key(customer_id),
+                json.dumps(identity),
+                ex=int(self.ttl),
+            )
+
+    def _set_local(self, customer_id: int, identity: CustomerIdentity):
+        if not self.local_enabled:
+            return
+        self._local[customer_id] = (
+            time.monotonic() + self.local_ttl, identity
+        )
+        self._local.move_to_end(customer_id)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    def drop_local(self, *customer_ids: int) -> None:
+        for customer_id in customer_ids:
+            self._local.pop(customer_id, None)
+
+    async def invalidate(self, *customer_ids: int) -> None:
+        '''Сбрасывает записи в памяти этого процесса, в Redis
+        и в памяти остальных процессов.'''
+        self.drop_local(*customer_ids)
+        redis = self._get_redis()
+        if redis is not None and customer_ids:
+            await redis.delete(
+                *(self._redis_key(pk) for pk in customer_ids)
+            )
+            await redis.publish(
+                INVALIDATE_CHANNEL, json.dumps(list(customer_ids))
+            )
+
+    def invalidate_later(self, *customer_ids: int) -> None:
+        '''invalidate() для синхронного кода: память процесса
+        сбрасывается сразу, Redis - задачей в работающем цикле событий.
+        Без цикла событий записи в Redis истекают по ttl.'''
+        self.drop_local(*customer_ids)
+        if not self.redis_url:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning(
+                'Кэш заказчиков в Redis не сброшен вне цикла событий: %s',
+                customer_ids,
+            )
+            return
+        task = loop.create_task(self.invalidate(*customer_ids))
+        self._pending.add(task)
+        task.add_done_callback(self._invalidated)
+
+    def _invalidated(self, task: asyncio.Task) -> None:
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                'Не удалось сбросить кэш заказчиков в Redis',
+                exc_info=task.exception(),
+            )
+
+    async def _listen(self) -> None:
+        '''Подписка на сброс записей другими процессами. Пока подписки
+        нет, память процесса не используется и очищается.'''
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                self._local.clear()
+                self._subscribed = True
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.drop_local(*json.loads(message['data']))
+            except Exception:
+                logger.warning('Кэш заказчиков: подписка на Redis потеряна')
+            finally:
+                self._subscribed = False
+                self._local.clear()
+                await pubsub.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            'size': len(self._local),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'hit_ratio': (
+                (self.hits + self.redis_hits) / lookups if lookups else 0.0
+            ),
+        }
+
+
+customer_identity_cache = CustomerIdentityCache(
+    maxsize=settings.CUSTOMER_CACHE_SIZE,
+    ttl=settings.CUSTOMER_CACHE_TTL,
+    redis_url=settings.CUSTOMER_CACHE_REDIS_URL,
+    local_ttl=settings.CUSTOMER_CACHE_LOCAL_TTL,
+)
+
+
+# Изменения заказчиков через сессии приложения и админку
+# сбрасывают кэш после коммита. В асинхронной сессии событие выполняется
+# внутри ее greenlet, и commit() дожидается сброса в Redis; синхронные
+# сессии (sync_session, fill_database.py) сбрасывают его фоном.
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_customers(session, flush_context) -> None:
+    changed = session.info.setdefault('changed_customers', set())
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, Customer) and obj.id is not None:
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_customers(session) -> None:
+    changed = session.info.pop('changed_customers', None)
+    if not changed:
+        return
+    if not customer_identity_cache.redis_url:
+        customer_identity_cache.drop_local(*changed)
+        return
+    try:
+        await_only(customer_identity_cache.invalidate(*changed))
+    except MissingGreenlet:
+        customer_identity_cache.invalidate_later(*changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_customers(session) -> None:
+    session.info.pop('changed_customers', None)
@@ -0,0 +1,161 @@
+import asyncio
+import contextvars
+import logging
+from typing import Optional
+
+from sqlalchemy import Row, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.crud.changes import insert_changed, lock_changes
+from app.models.models import Visit
+
+logger = logging.getLogger(__name__)
+
+
+class VisitGroupCommit:
+    '''Групповой коммит новых посещений.
+
+    Проверенные посещения из разных запросов копятся в буфере,
+    одна фоновая задача записывает их многострочным INSERT
+    и одним коммитом: через max_delay секунд после первого посещения
+    в пустом буфере или сразу, как наберется max_rows. Посещения,
+    пришедшие во время записи, уходят следующим пакетом без ожидания.
+    Запрос получает свою строку только после коммита пакета.
+    Если база отвергает пакет, посещения пишутся по одному
+    в SAVEPOINT, и ошибку получают только запросы сломанных строк.'''
+
+    def __init__(
+        self,
+        max_rows: int,
+        max_delay: float,
+        session_maker: async_sessionmaker = async_session,
+    ) -> None:
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.session_maker = session_maker
+        self.batches = 0
+        self.rows = 0
+        self._pending: list[tuple[dict, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+
+    async def create(self, values: dict) -> Row:
+        '''Строка посещения после коммита пакета, в котором оно
+        записано.'''
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+        if self._task is None or self._task.done():
+            # задача не наследует контекст запроса, в котором создана:
+            # пакеты не попадают в метрики и журнал этого запроса
+            self._task = contextvars.Context().run(
+                asyncio.get_running_loop().create_task, self._work()
+            )
+        waiter = asyncio.get_running_loop().create_future()
+        self._pending.append((values, waiter))
+        self._wakeup.set()
+        if len(self._pending) >= self.max_rows:
+            self._full.set()
+        return await waiter
+
+    async def _work(self) -> None:
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                if len(self._pending) < self.max_rows:
+                    try:
+                        await asyncio.wait_for(
+                            self._full.wait(), self.max_delay
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+            batch = self._pending[:self.max_rows]
+            del self._pending[:self.max_rows]
+            if len(self._pending) < self.max_rows:
+                self._full.clear()
+            # отмена задачи при остановке не прерывает запись пакета
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+
+    async def _flush(self, batch: list[tuple[dict, asyncio.Future]]) -> None:
+        try:
+            results = await self._write([values for values, _ in batch])
+        except Exception as error:
+            logger.exception('Не удалось записать пакет посещений')
+            results = [error] * len(batch)
+        self.batches += 1
+        self.rows += len(batch)
+        for (_, waiter), result in zip(batch, results):
+            if waiter.done():
+                continue
+            if isinstance(result, Exception):
+                waiter.set_exception(result)
+            else:
+                waiter.set_result(result)
+
+    async def _write(self, rows: list[dict]) -> list:
+        async with self.session_maker() as session:
+            try:
+                await lock_changes(session)
+                result = await session.execute(
+                    insert(Visit).returning(
+                        *Visit.__table__.c, sort_by_parameter_order=True
+                    ),
+                    rows,
+                )
+                written = result.all()
+                await session.commit()
+                return written
+            except IntegrityError:
+                await session.rollback()
+            written = []
+            for values in rows:
+                try:
+                    async with session.begin_nested():
+                        result = await session.execute(
+                            insert_changed(Visit, values)
+                        )
+                        written.append(result.one())
+                except IntegrityError as error:
+                    written.append(error)
+            await session.commit()
+            return written
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'rows_per_batch': self.rows / self.batches if self.batches else 0,
+            'pending': len(self._pending),
+        }
+
+    async def close(self) -> None:
+        '''Останавливает фоновую задачу, дописав уже принятые
+        посещения.'''
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None:
+            await self._flushing
+        while self._pending:
+            batch = self._pending[:self.max_rows]
+            del self._pending[:self.max_rows]
+            await self._flush(batch)
+
+
+visit_group_commit: Optional[VisitGroupCommit] = None
+if settings.VISIT_GROUP_COMMIT:
+    visit_group_commit = VisitGroupCommit(
+        max_rows=settings.VISIT_GROUP_COMMIT_ROWS,
+        max_delay=settings.VISIT_GROUP_COMMIT_DELAY_MS / 1000,
+    )
@@ -0,0 +1,192 @@
+import time
+from array import array
+from bisect import bisect_left
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event, exists, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Order, Outlet, Worker
+from app.models.worker_outlet import worker_outlet
+
+
+class Membership(NamedTuple):
+    '''has_any - у работника вообще есть привязки,
+    is_member - работник привязан к проверяемому объекту.
+    Работник без привязок проверку проходит.'''
+    has_any: bool
+    is_member: bool
+
+    @property
+    def denied(self) -> bool:
+        return self.has_any and not self.is_member
+
+
+def worker_outlet_clauses(worker_id, outlet_id) -> tuple:
+    '''EXISTS-пробы по индексу ix_worker_outlet_worker_outlet.'''
+    return (
+        exists().where(worker_outlet.c.worker == worker_id),
+        exists().where(
+            worker_outlet.c.worker == worker_id,
+            worker_outlet.c.outlet == outlet_id,
+        ),
+    )
+
+
+def worker_order_clauses(worker_id, order_id) -> tuple:
+    '''EXISTS-пробы по индексу ix_order_worker_id_id.'''
+    worker_order = Order.__table__.alias('worker_order')
+    return (
+        exists().where(worker_order.c.worker_id == worker_id),
+        exists().where(
+            worker_order.c.worker_id == worker_id,
+            worker_order.c.id == order_id,
+        ),
+    )
+
+
+def worker_outlet_ids_select(worker_ids):
+    '''id торговых точек, к которым привязаны работники из worker_ids.'''
+    return select(worker_outlet.c.outlet).where(
+        worker_outlet.c.worker.in_(worker_ids)
+    )
+
+
+async def worker_outlets_map(
+    session: AsyncSession, worker_ids
+) -> dict[int, set[int]]:
+    '''Привязки сразу для многих работников одним запросом.'''
+    outlets: dict[int, set[int]] = {}
+    if not worker_ids:
+        return outlets
+    result = await session.execute(
+        select(worker_outlet.c.worker, worker_outlet.c.outlet)
+        .where(worker_outlet.c.worker.in_(worker_ids))
+    )
+    for worker_id, outlet_id in result:
+        outlets.setdefault(worker_id, set()).add(outlet_id)
+    return outlets
+
+
+class WorkerOutletIndex:
+    '''Компактный индекс worker -> отсортированный массив id точек.
+    Записи подгружаются по одному работнику при первом обращении
+    и устаревают через ttl секунд: так видны изменения привязок
+    из других процессов. Изменения через сессии этого процесса
+    (приложение и админка) применяются к загруженным записям
+    после коммита - по одной паре работник-точка, без перечитывания.'''
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._outlets: dict[int, tuple[float, array]] = {}
+
+    async def get(self, session: AsyncSession, worker_id: int) -> array:
+        entry = self._outlets.get(worker_id)
+        now = time.monotonic()
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        result = await session.execute(
+            worker_outlet_ids_select([worker_id])
+            .order_by(worker_outlet.c.outlet)
+        )
+        outlets = array('q', result.scalars())
+        self._outlets[worker_id] = (now, outlets)
+        return outlets
+
+    def add(self, worker_id: int, outlet_id: int) -> None:
+        entry = self._outlets.get(worker_id)
+        if entry is None:
+            return
+        outlets = entry[1]
+        i = bisect_left(outlets, outlet_id)
+        if i == len(outlets) or outlets[i] != outlet_id:
+            outlets.insert(i, outlet_id)
+
+    def discard(self, worker_id: int, outlet_id: int) -> None:
+        entry = self._outlets.get(worker_id)
+        if entry is None:
+            return
+        outlets = entry[1]
+        i = bisect_left(outlets, outlet_id)
+        if i < len(outlets) and outlets[i] == outlet_id:
+            del outlets[i]
+
+    def drop_worker(self, worker_id: int) -> None:
+        self._outlets.pop(worker_id, None)
+
+    def drop_outlet(self, outlet_id: int) -> None:
+        for worker_id in list(self._outlets):
+            self.discard(worker_id, outlet_id)
+
+
+def _contains(values: array, value: int) -> bool:
+    i = bisect_left(values, value)
+    return i < len(values) and values[i] == value
+
+
+worker_outlet_index = WorkerOutletIndex(ttl=settings.MEMBERSHIP_INDEX_TTL)
+
+
+async def worker_in_outlet(
+    session: AsyncSession, worker_id: int, outlet_id: Optional[int]
+) -> Membership:
+    '''Привязка работника к торговой точке: по worker_outlet_index
+    при MEMBERSHIP_INDEX, иначе EXISTS-пробами.'''
+    if settings.MEMBERSHIP_INDEX:
+        outlets = await worker_outlet_index.get(session, worker_id)
+        return Membership(
+            bool(outlets),
+            outlet_id is not None and _contains(outlets, outlet_id),
+        )
+    has_any, is_member = worker_outlet_clauses(worker_id, outlet_id)
+    result = await session.execute(select(has_any, is_member))
+    return Membership(*result.one())
+
+
+# Изменения привязок копятся в session.info при flush
+# и применяются к индексу только после коммита
+MEMBERSHIP_CHANGES = 'worker_outlet_changes'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_membership_changes(session, flush_context) -> None:
+    changes = session.info.setdefault(MEMBERSHIP_CHANGES, [])
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Worker):
+            history = inspect(obj).attrs.outlets.history
+            changes += [
+                (worker_outlet_index.add, obj.id, outlet.id)
+                for outlet in history.added
+            ]
+            changes += [
+                (worker_outlet_index.discard, obj.id, outlet.id)
+                for outlet in history.deleted
+            ]
+        elif isinstance(obj, Outlet):
+            history = inspect(obj).attrs.workers.history
+            changes += [
+                (worker_outlet_index.add, worker.id, obj.id)
+                for worker in history.added
+            ]
+            changes += [
+                (worker_outlet_index.discard, worker.id, obj.id)
+                for worker in history.deleted
+            ]
+    for obj in session.deleted:
+        if isinstance(obj, Worker):
+            changes.append((worker_outlet_index.drop_worker, obj.id))
+        elif isinstance(obj, Outlet):
+            changes.append((worker_outlet_index.drop_outlet, obj.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_membership_changes(session) -> None:
+    for change, *args in session.info.pop(MEMBERSHIP_CHANGES, ()):
+        change(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_membership_changes(session) -> None:
+    session.info.pop(MEMBERSHIP_CHANGES, None)
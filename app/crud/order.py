@@ -1,42 +1,136 @@
-from fastapi.encoders import jsonable_encoder
+from typing import Optional, Sequence
+
+from sqlalchemy import Row, case, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.models import Order
-from app.schemas.order import OrderCreate, OrderUpdate, OrderUpdateStatus
+from app.crud.changes import (
+    delete_changed, insert_changed, lock_changes, update_changed,
+    update_changed_cte
+)
+from app.crud.order_events import notify_column, notify_orders_created
+from app.models.models import STATUS_TRANSITIONS, Order, Status
+from app.schemas.order import OrderCreate, OrderUpdate
+
+# Поля, которые можно менять из схем изменения заказа
+ORDER_COLUMNS = frozenset(Order.__table__.c.keys())
 
 
 async def create_order(
         new_order: OrderCreate,
-        session: AsyncSession
-) -> Order:
+        session: AsyncSession,
+        commit: bool = True,
+) -> Row:
+    '''С commit=False заказ остается в открытой транзакции сессии,
+    коммит - за вызывающим.'''
     new_order_data = new_order.model_dump(exclude={'phone_number'})
-    db_order = Order(**new_order_data)
-    session.add(db_order)
-    await session.commit()
-    await session.refresh(db_order)
+    stmt = insert_changed(Order, new_order_data)
+    result = await session.execute(
+        stmt.add_columns(notify_column('created', stmt.selected_columns))
+    )
+    db_order = result.one()
+    if commit:
+        await session.commit()
     return db_order
 
 
+async def create_orders(
+        new_orders: Sequence[OrderCreate],
+        session: AsyncSession
+) -> Sequence[Row]:
+    '''Многострочный INSERT ... RETURNING одним коммитом,
+    строки возвращаются в порядке new_orders.'''
+    if not new_orders:
+        return []
+    await lock_changes(session)
+    result = await session.execute(
+        insert(Order).returning(
+            Order.id, Order.created_date, Order.ended_date, Order.status,
+            sort_by_parameter_order=True,
+        ),
+        [order.model_dump(exclude={'phone_number'}) for order in new_orders],
+    )
+    rows = result.all()
+    await notify_orders_created(session, [row.id for row in rows])
+    await session.commit()
+    return rows
+
+
 async def update_order(
-        db_order: Order,
-        order_in: OrderUpdate | OrderUpdateStatus,
+        db_order: Order | Row,
+        order_in: OrderUpdate,
         session: AsyncSession,
-) -> Order:
-    obj_data = jsonable_encoder(db_order)
-    update_data = order_in.model_dump(exclude_unset=True)
-    for field in obj_data:
-        if field in update_data:
-            setattr(db_order, field, update_data[field])
-    session.add(db_order)
+) -> Row:
+    update_data = order_in.model_dump(
+        exclude_unset=True, include=ORDER_COLUMNS
+    )
+    stmt = update_changed(Order, db_order.id, update_data)
+    result = await session.execute(
+        stmt.add_columns(notify_column('updated', stmt.selected_columns))
+    )
+    db_order = result.one()
     await session.commit()
-    await session.refresh(db_order)
     return db_order
 
 
+async def change_orders_status(
+        session: AsyncSession,
+        customer_id: int,
+        status: Status,
+        order_ids: Optional[Sequence[int]],
+        filters: list,
+) -> Sequence[Row]:
+    '''Переводит заказы заказчика в статус status одним запросом:
+    UPDATE затрагивает только заказы, из статуса которых переход
+    в status разрешен STATUS_TRANSITIONS. Возвращает строку
+    для каждого выбранного заказа: target_id и old_status, а для
+    измененных - еще и новые колонки заказа (у остальных id = NULL).'''
+    orders = Order.__table__
+    conditions = [orders.c.customer_id == customer_id, *filters]
+    if order_ids is not None:
+        conditions.append(orders.c.id.in_(order_ids))
+    target = (
+        select(orders.c.id, orders.c.status)
+        .where(*conditions)
+        .with_for_update()
+        .cte('target')
+    )
+    allowed = [
+        source for source, targets in STATUS_TRANSITIONS.items()
+        if status in targets
+    ]
+    changed = update_changed_cte(
+        Order,
+        orders.c.id.in_(
+            select(target.c.id).where(target.c.status.in_(allowed))
+        ),
+        {'status': status},
+    )
+    notified = notify_column('updated', changed.c)
+    result = await session.execute(
+        select(
+            target.c.id.label('target_id'),
+            target.c.status.label('old_status'),
+            *changed.c,
+            # событие только для измененных заказов
+            case((changed.c.id.is_not(None), notified.element))
+            .label(notified.name),
+        )
+        .select_from(target.outerjoin(changed, changed.c.id == target.c.id))
+        .order_by(target.c.id)
+    )
+    rows = result.all()
+    await session.commit()
+    return rows
+
+
 async def delete_order(
-        db_order: Order,
+        db_order: Order | Row,
         session: AsyncSession,
-) -> Order:
-    await session.delete(db_order)
+) -> Row:
+    stmt = delete_changed(Order, db_order.id)
+    result = await session.execute(
+        stmt.add_columns(notify_column('deleted', stmt.selected_columns))
+    )
+    db_order = result.one()
     await session.commit()
     return db_order
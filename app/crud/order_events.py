@@ -0,0 +1,72 @@
+import json
+from typing import Sequence
+
+from sqlalchemy import (
+    ColumnElement, Text, cast, event, func, literal, select
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.notify import ORDER_EVENTS_CHANNEL
+from app.models.models import Order
+
+
+def _order_payload(event_name: str, order: Order) -> str:
+    return json.dumps({
+        'event': event_name,
+        'id': order.id,
+        'status': getattr(order.status, 'value', order.status),
+        'customer_id': order.customer_id,
+        'worker_id': order.worker_id,
+    })
+
+
+def _notify(connection, payload: str) -> None:
+    '''NOTIFY в транзакции записи: подписчики получат событие
+    только после коммита, при откате оно не уйдет.'''
+    connection.execute(
+        select(func.pg_notify(ORDER_EVENTS_CHANNEL, payload))
+    )
+
+
+def notify_column(event_name: str, columns) -> ColumnElement:
+    '''pg_notify для каждой строки с колонками заказа columns
+    (таблица или CTE с RETURNING), чтобы событие ушло в том же
+    запросе, что и запись.'''
+    payload = func.json_build_object(
+        'event', literal(event_name),
+        'id', columns.id,
+        'status', columns.status,
+        'customer_id', columns.customer_id,
+        'worker_id', columns.worker_id,
+    )
+    return func.pg_notify(
+        ORDER_EVENTS_CHANNEL, cast(payload, Text)
+    ).label('notified')
+
+
+async def notify_orders_created(
+    session: AsyncSession, order_ids: Sequence[int]
+) -> None:
+    '''События для заказов, вставленных пачкой, одним запросом.'''
+    if not order_ids:
+        return
+    orders = Order.__table__
+    await session.execute(
+        select(notify_column('created', orders.c))
+        .where(orders.c.id.in_(order_ids))
+    )
+
+
+@event.listens_for(Order, 'after_insert')
+def _order_created(mapper, connection, target) -> None:
+    _notify(connection, _order_payload('created', target))
+
+
+@event.listens_for(Order, 'after_update')
+def _order_updated(mapper, connection, target) -> None:
+    _notify(connection, _order_payload('updated', target))
+
+
+@event.listens_for(Order, 'after_delete')
+def _order_deleted(mapper, connection, target) -> None:
+    _notify(connection, _order_payload('deleted', target))
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import Date, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.crud.changes import CHANGE_ENTITIES, changes_watermark
+from app.models.models import Order, Tombstone, Visit
+from app.models.report import (
+    OrderRollup, RollupSource, RollupState, VisitRollup
+)
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки обновления сводок: одновременно сводки
+# обновляет только один процесс
+ROLLUP_LOCK_KEY = 0x726f6c6c7570
+ROLLUP_STATE = 'report'
+# Сводка и счетчик в ней для каждой модели
+ROLLUPS = {Order: (OrderRollup, 'orders'), Visit: (VisitRollup, 'visits')}
+
+
+def _key_columns(model) -> list:
+    columns = [
+        cast(model.created_date, Date).label('day'),
+        func.coalesce(model.outlet_id, 0).label('outlet_id'),
+        func.coalesce(model.worker_id, 0).label('worker_id'),
+    ]
+    if model is Order:
+        columns.append(model.status)
+    return columns
+
+
+class RollupRefresher:
+    '''Обновление сводок order_rollup и visit_rollup по журналу
+    изменений (change_seq и tombstone), как GET /sync/changes.
+
+    Обработанный номер изменения хранится в rollup_state. Для каждого
+    изменившегося или удаленного объекта из ключа, в котором он был
+    учтен (rollup_source), вычитается единица, к текущему ключу
+    прибавляется. Изменения обрабатываются пачками по batch номеров,
+    каждая пачка - в своей транзакции. Сводки обновляет фоновая
+    задача раз в interval секунд, первый проход после запуска
+    досчитывает их с начала журнала. Ручки отчетов только читают.'''
+
+    def __init__(
+        self,
+        interval: float,
+        batch: int,
+        session_maker: async_sessionmaker = async_session,
+    ) -> None:
+        self.interval = interval
+        self.batch = batch
+        self.session_maker = session_maker
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        '''Запускает фоновое обновление, если оно еще не идет.'''
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._work())
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                async with self.session_maker() as session:
+                    await self.refresh(session)
+            except Exception:
+                logger.exception('Не удалось обновить сводки отчетов')
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self, session: AsyncSession) -> None:
+        '''Догоняет сводки до последнего закоммиченного изменения.'''
+        async with self._lock:
+            watermark = await changes_watermark(session)
+            await session.commit()
+            while await self._apply_batch(session, watermark):
+                pass
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _apply_batch(
+        self, session: AsyncSession, watermark: int
+    ) -> bool:
+        '''Применяет следующую пачку изменений не дальше watermark.
+        False, если сводки уже обновлены до watermark.'''
+        await session.execute(
+            select(func.pg_advisory_xact_lock(ROLLUP_LOCK_KEY))
+        )
+        since = await session.scalar(
+            select(RollupState.last_seq)
+            .where(RollupState.name == ROLLUP_STATE)
+        ) or 0
+        if since >= watermark:
+            await session.commit()
+            return False
+        upto = min(since + self.batch, watermark)
+        for model in ROLLUPS:
+            await self._apply_model(session, model, since, upto)
+        await session.execute(
+            insert(RollupState)
+            .values(name=ROLLUP_STATE, last_seq=upto)
+            .on_conflict_do_update(
+                index_elements=[RollupState.name], set_={'last_seq': upto}
+            )
+        )
+        await session.commit()
+        return upto < watermark
+
+    @staticmethod
+    async def _apply_model(
+        session: AsyncSession, model, since: int, upto: int
+    ) -> None:
+        entity = CHANGE_ENTITIES[model]
+        rollup, counter = ROLLUPS[model]
+        changed = (await session.execute(
+            select(model.id, *_key_columns(model))
+            .where(model.change_seq > since, model.change_seq <= upto)
+        )).all()
+        deleted = set((await session.scalars(
+            select(Tombstone.entity_id).where(
+                Tombstone.entity == entity,
+                Tombstone.change_seq > since,
+                Tombstone.change_seq <= upto,
+            )
+        )).all())
+        touched = deleted | {row.id for row in changed}
+        if not touched:
+            return
+        previous = (await session.execute(
+            select(
+                RollupSource.day,
+                RollupSource.outlet_id,
+                RollupSource.worker_id,
+                RollupSource.status,
+            )
+            .where(
+                RollupSource.entity == entity,
+                RollupSource.entity_id.in_(touched),
+            )
+        )).all()
+        deltas = Counter()
+        for row in previous:
+            deltas[_rollup_key(model, row)] -= 1
+        for row in changed:
+            deltas[_rollup_key(model, row)] += 1
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if deltas:
+            key_names = _rollup_key_names(model)
+            stmt = insert(rollup).values([
+                {**dict(zip(key_names, key)), counter: delta}
+                for key, delta in deltas.items()
+            ])
+            total = getattr(rollup, counter) + stmt.excluded[counter]
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=key_names, set_={counter: total}
+            ))
+            await session.execute(
+                delete(rollup).where(getattr(rollup, counter) == 0)
+            )
+        if deleted:
+            await session.execute(delete(RollupSource).where(
+                RollupSource.entity == entity,
+                RollupSource.entity_id.in_(deleted),
+            ))
+        if changed:
+            stmt = insert(RollupSource).values([
+                {
+                    'entity': entity,
+                    'entity_id': row.id,
+                    'day': row.day,
+                    'outlet_id': row.outlet_id,
+                    'worker_id': row.worker_id,
+                    'status': getattr(row, 'status', None),
+                }
+                for row in changed
+            ])
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[RollupSource.entity, RollupSource.entity_id],
+                set_={
+                    column: stmt.excluded[column]
+                    for column in ('day', 'outlet_id', 'worker_id', 'status')
+                },
+            ))
+
+
+def _rollup_key_names(model) -> list[str]:
+    names = ['day', 'outlet_id', 'worker_id']
+    if model is Order:
+        names.append('status')
+    return names
+
+
+def _rollup_key(model, row) -> tuple:
+    return tuple(getattr(row, name) for name in _rollup_key_names(model))
+
+
+async def get_orders_report(
+    session: AsyncSession,
+    day_start: Optional[date],
+    day_end: Optional[date],
+    outlet_id: Optional[int],
+    worker_id: Optional[int],
+) -> list:
+    '''Число заказов по дням, торговым точкам и статусам.'''
+    filters = _report_filters(
+        OrderRollup, day_start, day_end, outlet_id, worker_id
+    )
+    result = await session.execute(
+        select(
+            OrderRollup.day,
+            func.nullif(OrderRollup.outlet_id, 0).label('outlet_id'),
+            OrderRollup.status,
+            func.sum(OrderRollup.orders).label('orders'),
+        )
+        .where(*filters)
+        .group_by(OrderRollup.day, OrderRollup.outlet_id, OrderRollup.status)
+        .order_by(OrderRollup.day, OrderRollup.outlet_id, OrderRollup.status)
+    )
+    return result.all()
+
+
+async def get_visits_report(
+    session: AsyncSession,
+    day_start: Optional[date],
+    day_end: Optional[date],
+    outlet_id: Optional[int],
+    worker_id: Optional[int],
+) -> list:
+    '''Число посещений по дням и работникам.'''
+    filters = _report_filters(
+        VisitRollup, day_start, day_end, outlet_id, worker_id
+    )
+    result = await session.execute(
+        select(
+            VisitRollup.day,
+            func.nullif(VisitRollup.worker_id, 0).label('worker_id'),
+            func.sum(VisitRollup.visits).label('visits'),
+        )
+        .where(*filters)
+        .group_by(VisitRollup.day, VisitRollup.worker_id)
+        .order_by(VisitRollup.day, VisitRollup.worker_id)
+    )
+    return result.all()
+
+
+def _report_filters(rollup, day_start, day_end, outlet_id, worker_id):
+    filters = []
+    if day_start:
+        filters.append(rollup.day >= day_start)
+    if day_end:
+        filters.append(rollup.day <= day_end)
+    if outlet_id:
+        filters.append(rollup.outlet_id == outlet_id)
+    if worker_id:
+        filters.append(rollup.worker_id == worker_id)
+    return filters
+
+
+rollup_refresher = RollupRefresher(
+    interval=settings.REPORT_REFRESH_INTERVAL,
+    batch=settings.REPORT_REFRESH_BATCH,
+)
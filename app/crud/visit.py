@@ -1,42 +1,105 @@
-from fastapi.encoders import jsonable_encoder
+from typing import Sequence
+
+from sqlalchemy import Row, inspect
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.crud import group_commit
+from app.crud.changes import delete_changed, insert_changed, update_changed
 from app.models.models import Visit
 from app.schemas.visit import VisitCreate, VisitUpdate
 
+# Поля, которые можно менять из схемы изменения посещения
+VISIT_COLUMNS = frozenset(Visit.__table__.c.keys())
+
 
 async def create_visit(
-        new_order: VisitCreate,
-        session: AsyncSession
-) -> Visit:
-    new_order_data = new_order.model_dump(exclude={'phone_number'})
-    db_order = Visit(**new_order_data)
-    session.add(db_order)
-    await session.commit()
-    await session.refresh(db_order)
-    return db_order
+        new_visit: VisitCreate,
+        session: AsyncSession,
+        commit: bool = True,
+) -> Row:
+    '''С commit=False посещение пишется мимо группового коммита
+    и остается в открытой транзакции сессии, коммит - за вызывающим.'''
+    new_visit_data = new_visit.model_dump(exclude={'phone_number'})
+    if commit and group_commit.visit_group_commit is not None:
+        # соединение запроса не держится, пока посещение ждет пакет
+        await session.commit()
+        return await group_commit.visit_group_commit.create(new_visit_data)
+    result = await session.execute(insert_changed(Visit, new_visit_data))
+    db_visit = result.one()
+    if commit:
+        await session.commit()
+    return db_visit
 
 
 async def update_visit(
-        db_visit: Visit,
+        db_visit: Visit | Row,
         visit_in: VisitUpdate,
         session: AsyncSession,
-) -> Visit:
-    obj_data = jsonable_encoder(db_visit)
-    update_data = visit_in.model_dump(exclude_unset=True)
-    for field in obj_data:
-        if field in update_data:
-            setattr(db_visit, field, update_data[field])
-    session.add(db_visit)
+) -> Row:
+    update_data = visit_in.model_dump(
+        exclude_unset=True, include=VISIT_COLUMNS
+    )
+    result = await session.execute(
+        update_changed(Visit, db_visit.id, update_data)
+    )
+    db_visit = result.one()
     await session.commit()
-    await session.refresh(db_visit)
     return db_visit
 
 
 async def delete_visit(
-        db_visit: Visit,
+        db_visit: Visit | Row,
         session: AsyncSession,
-) -> Visit:
-    await session.delete(db_visit)
+) -> Row:
+    result = await session.execute(delete_changed(Visit, db_visit.id))
+    db_visit = result.one()
     await session.commit()
     return db_visit
+
+
+def _apply_visit_change(
+        db_visit: Visit | None,
+        data: dict,
+        session: AsyncSession,
+) -> Visit:
+    if db_visit is None:
+        db_visit = Visit(**data)
+        session.add(db_visit)
+    else:
+        for field, value in data.items():
+            setattr(db_visit, field, value)
+    return db_visit
+
+
+async def sync_visits(
+        changes: Sequence[tuple[Visit | None, dict]],
+        session: AsyncSession,
+) -> list[int | None]:
+    '''Записывает пакет новых и измененных посещений одним коммитом.
+    Если база отвергает пакет (например, несуществующий worker_id),
+    изменения повторяются по одному в SAVEPOINT, чтобы отбросить
+    только сломанные. Возвращает id посещения или None для каждого
+    изменения.'''
+    try:
+        visits = [
+            _apply_visit_change(db_visit, data, session)
+            for db_visit, data in changes
+        ]
+        await session.flush()
+        ids = [inspect(visit).identity[0] for visit in visits]
+        await session.commit()
+        return ids
+    except IntegrityError:
+        await session.rollback()
+    ids = []
+    for db_visit, data in changes:
+        try:
+            async with session.begin_nested():
+                visit = _apply_visit_change(db_visit, data, session)
+                await session.flush()
+            ids.append(inspect(visit).identity[0])
+        except IntegrityError:
+            ids.append(None)
+    await session.commit()
+    return ids
@@ -2,6 +2,17 @@ from pathlib import Path
 import uvicorn
 from fastapi import FastAPI
 from app.api.routers import main_router
+from app.core.config import settings
+from app.core.database import async_engine
+from app.core.metrics import (
+    RequestMetricsMiddleware, request_metrics, track_engine
+)
+from app.core.notify import order_events
+from app.core.replicas import ReadYourWritesMiddleware, replicas
+from app.core.slow_queries import slow_query_log
+from app.crud.customer_cache import customer_identity_cache
+from app.crud.group_commit import visit_group_commit
+from app.crud.report import rollup_refresher
 from app.admin.admin import admin
 
 BASE_DIR = Path(__file__).parent.parent
@@ -10,6 +21,26 @@ env_path = BASE_DIR / '.env'
 app = FastAPI(title='mobile_app')
 
 app.include_router(main_router)
+app.add_event_handler('shutdown', order_events.close)
+app.add_event_handler('shutdown', customer_identity_cache.close)
+app.add_event_handler('startup', replicas.start)
+app.add_event_handler('shutdown', replicas.close)
+# Сводки для /report/... обновляются в фоне, ручки отчетов их только читают
+app.add_event_handler('startup', rollup_refresher.start)
+app.add_event_handler('shutdown', rollup_refresher.close)
+if visit_group_commit is not None:
+    app.add_event_handler('shutdown', visit_group_commit.close)
+if settings.DB_REPLICA_URLS:
+    app.add_middleware(
+        ReadYourWritesMiddleware,
+        sticky=settings.DB_REPLICA_STICKY_SECONDS,
+    )
+# Время ответа, число SQL-запросов и время в базе по ручкам: /metrics
+app.add_middleware(RequestMetricsMiddleware, metrics=request_metrics)
+app.add_event_handler('shutdown', slow_query_log.close)
+for engine in (async_engine, *(r.engine for r in replicas.replicas)):
+    track_engine(engine)
+    slow_query_log.watch(engine)
 
 admin.mount_to(app)
 
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import datetime
+from typing import Optional
+
+from sqlalchemy import Index, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+from app.models.option import created_at
+
+
+class IdempotencyKey(Base):
+    '''Ответ на запрос с заголовком Idempotency-Key. Ключи разных
+    заказчиков не пересекаются. Пока запрос выполняется, response
+    пустой.'''
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (
+        Index('ix_idempotency_key_expires_date', 'expires_date'),
+    )
+
+    scope: Mapped[str] = mapped_column(String(64), primary_key=True)
+    customer_id: Mapped[int] = mapped_column(primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64))
+    status_code: Mapped[Optional[int]] = mapped_column()
+    response: Mapped[Optional[dict]] = mapped_column(JSONB)
+    created_date: Mapped[created_at]
+    expires_date: Mapped[datetime.datetime] = mapped_column()
+
+    def __repr__(self) -> str:
+        return (
+            f"IdempotencyKey(scope={self.scope!r}, "
+            f"customer_id={self.customer_id!r}, key={self.key!r})"
+        )
@@ -2,13 +2,16 @@ from __future__ import annotations
 
 import enum
 
-from sqlalchemy import ForeignKey, String
+from sqlalchemy import BigInteger, ForeignKey, Index, Sequence, String, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.database import Base
 from app.models.option import created_at, end_at, intpk
 from app.models.worker_outlet import worker_outlet
 
+# Общий счетчик изменений заказов и посещений для GET /sync/changes
+change_sequence = Sequence('change_seq', metadata=Base.metadata)
+
 
 class Status(str, enum.Enum):
     started = 'started'
@@ -18,6 +21,21 @@ class Status(str, enum.Enum):
     canceled = 'canceled'
 
 
+# Разрешенные переходы статуса заказа: из какого статуса в какие.
+# Из ended и canceled заказ уже никуда не переходит.
+STATUS_TRANSITIONS: dict[Status, frozenset[Status]] = {
+    Status.started: frozenset(
+        {Status.in_process, Status.awaiting, Status.canceled}
+    ),
+    Status.awaiting: frozenset({Status.in_process, Status.canceled}),
+    Status.in_process: frozenset(
+        {Status.awaiting, Status.ended, Status.canceled}
+    ),
+    Status.ended: frozenset(),
+    Status.canceled: frozenset(),
+}
+
+
 class Outlet(Base):
     __tablename__ = 'outlet'
 
@@ -62,6 +80,9 @@ class Worker(Base):
 
 class Customer(Base):
     __tablename__ = 'customer'
+    __table_args__ = (
+        Index('ix_customer_outlet_id', 'outlet_id'),
+    )
 
     id: Mapped[intpk]
     name: Mapped[str] = mapped_column(String(255))
@@ -83,6 +104,17 @@ class Customer(Base):
 
 class Order(Base):
     __tablename__ = 'order'
+    __table_args__ = (
+        Index('ix_order_created_date_id', 'created_date', 'id'),
+        Index(
+            'ix_order_status_created_date_id', 'status', 'created_date', 'id'
+        ),
+        Index('ix_order_ended_date', 'ended_date'),
+        Index('ix_order_customer_id_id', 'customer_id', 'id'),
+        Index('ix_order_worker_id_id', 'worker_id', 'id'),
+        Index('ix_order_outlet_id', 'outlet_id'),
+        Index('ix_order_change_seq', 'change_seq'),
+    )
 
     id: Mapped[intpk]
     created_date: Mapped[created_at]
@@ -109,6 +141,12 @@ class Order(Base):
     visit: Mapped['Visit'] = relationship(
         back_populates='order', cascade='all, delete-orphan'
     )
+    version: Mapped[int] = mapped_column(server_default=text('1'))
+    change_seq: Mapped[int] = mapped_column(
+        BigInteger, server_default=change_sequence.next_value()
+    )
+
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self) -> str:
         return (
@@ -119,6 +157,14 @@ class Order(Base):
 
 class Visit(Base):
     __tablename__ = 'visit'
+    __table_args__ = (
+        Index('ix_visit_created_date_id', 'created_date', 'id'),
+        Index('ix_visit_order_id', 'order_id'),
+        Index('ix_visit_customer_id_id', 'customer_id', 'id'),
+        Index('ix_visit_worker_id', 'worker_id'),
+        Index('ix_visit_outlet_id', 'outlet_id'),
+        Index('ix_visit_change_seq', 'change_seq'),
+    )
 
     id: Mapped[intpk]
     created_date: Mapped[created_at]
@@ -146,6 +192,28 @@ class Visit(Base):
     order: Mapped['Order'] = relationship(
         back_populates='visit'
     )
+    version: Mapped[int] = mapped_column(server_default=text('1'))
+    change_seq: Mapped[int] = mapped_column(
+        BigInteger, server_default=change_sequence.next_value()
+    )
+
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self) -> str:
         return f"Visit(id={self.id!r}, created_date={self.created_date!r}"
+
+
+class Tombstone(Base):
+    '''Удаленный заказ или посещение для GET /sync/changes.'''
+    __tablename__ = 'tombstone'
+
+    change_seq: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        server_default=change_sequence.next_value(),
+    )
+    entity: Mapped[str] = mapped_column(String(16))
+    entity_id: Mapped[int] = mapped_column()
+
+    def __repr__(self) -> str:
+        return f"Tombstone(entity={self.entity!r}, id={self.entity_id!r}"
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+from app.models.models import Status
+
+# outlet_id и worker_id = 0 в сводках - заказ или посещение
+# без торговой точки или работника
+
+
+class OrderRollup(Base):
+    '''Число заказов по дню создания, торговой точке, работнику
+    и статусу для GET /report/orders.'''
+    __tablename__ = 'order_rollup'
+
+    day: Mapped[datetime.date] = mapped_column(primary_key=True)
+    outlet_id: Mapped[int] = mapped_column(primary_key=True)
+    worker_id: Mapped[int] = mapped_column(primary_key=True)
+    status: Mapped[Status] = mapped_column(primary_key=True)
+    orders: Mapped[int] = mapped_column()
+
+    def __repr__(self) -> str:
+        return (f'OrderRollup(day={self.day!r}, '
+                f'outlet_id={self.outlet_id!r}, status={self.status!r}, '
+                f'orders={self.orders!r})')
+
+
+class VisitRollup(Base):
+    '''Число посещений по дню создания, торговой точке и работнику
+    для GET /report/visits.'''
+    __tablename__ = 'visit_rollup'
+
+    day: Mapped[datetime.date] = mapped_column(primary_key=True)
+    outlet_id: Mapped[int] = mapped_column(primary_key=True)
+    worker_id: Mapped[int] = mapped_column(primary_key=True)
+    visits: Mapped[int] = mapped_column()
+
+    def __repr__(self) -> str:
+        return (f'VisitRollup(day={self.day!r}, '
+                f'worker_id={self.worker_id!r}, visits={self.visits!r})')
+
+
+class RollupSource(Base):
+    '''Ключ сводки, в котором сейчас учтен заказ или посещение:
+    при изменении или удалении объекта из этого ключа вычитается
+    единица.'''
+    __tablename__ = 'rollup_source'
+
+    entity: Mapped[str] = mapped_column(String(16), primary_key=True)
+    entity_id: Mapped[int] = mapped_column(primary_key=True)
+    day: Mapped[datetime.date] = mapped_column()
+    outlet_id: Mapped[int] = mapped_column()
+    worker_id: Mapped[int] = mapped_column()
+    status: Mapped[Optional[Status]] = mapped_column()
+
+
+class RollupState(Base):
+    '''Номер изменения (change_seq), до которого сводки обновлены.'''
+    __tablename__ = 'rollup_state'
+
+    name: Mapped[str] = mapped_column(String(16), primary_key=True)
+    last_seq: Mapped[int] = mapped_column(BigInteger)
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy import Index, String, Text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+from app.models.option import created_at, intpk
+
+
+class SlowQuery(Base):
+    '''SQL-запрос дольше SLOW_QUERY_THRESHOLD_MS с планом выполнения.
+    statement - запрос без значений, одинаковые запросы
+    с разными значениями имеют один fingerprint.'''
+    __tablename__ = 'slow_query'
+    __table_args__ = (
+        Index('ix_slow_query_created_date', 'created_date'),
+        Index('ix_slow_query_fingerprint', 'fingerprint'),
+    )
+
+    id: Mapped[intpk]
+    created_date: Mapped[created_at]
+    endpoint: Mapped[Optional[str]] = mapped_column(String(255))
+    duration_ms: Mapped[float] = mapped_column()
+    fingerprint: Mapped[str] = mapped_column(String(16))
+    statement: Mapped[str] = mapped_column(Text)
+    parameters: Mapped[Optional[list]] = mapped_column(JSONB)
+    plan: Mapped[Optional[list]] = mapped_column(JSONB)
+    analyzed: Mapped[bool] = mapped_column(default=False)
+
+    def __repr__(self) -> str:
+        return (f'SlowQuery(id={self.id!r}, endpoint={self.endpoint!r}, '
+                f'duration_ms={self.duration_ms!r})')
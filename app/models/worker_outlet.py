@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import Column, ForeignKey, Table
+from sqlalchemy import Column, ForeignKey, Index, Table
 
 from app.core.database import Base
 
@@ -17,4 +17,5 @@ worker_outlet = Table(
         ForeignKey("worker.id", ondelete='CASCADE'),
         primary_key=True
     ),
+    Index('ix_worker_outlet_worker_outlet', 'worker', 'outlet'),
 )
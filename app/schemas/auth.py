@@ -0,0 +1,20 @@
+from pydantic import BaseModel, Field
+
+
+class LoginRequest(BaseModel):
+    customer_id: int = Field(..., gt=0)
+    phone_number: str
+
+    class Config:
+        json_schema_extra = {
+           'example': {
+               'customer_id': 1,
+               'phone_number': '89138927125'
+           }
+        }
+
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str = 'bearer'
+    expires_in: int
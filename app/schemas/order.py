@@ -3,6 +3,7 @@ from typing import Optional
 
 from pydantic import BaseModel, Field
 
+from app.core.config import settings
 from app.models.models import Status
 
 data_example_started = datetime.now() - timedelta(weeks=30)
@@ -10,11 +11,11 @@ data_example_ended = data_example_started + timedelta(weeks=1)
 
 
 class OrderCreate(BaseModel):
-    customer_id: int = Field(..., gt=0)
+    customer_id: Optional[int] = Field(None, gt=0)
     outlet_id: int = Field(None, gt=0)
     status: Status = Field('started')
     worker_id: int = Field(None, gt=0)
-    phone_number: str
+    phone_number: Optional[str] = None
 
     class Config:
         json_schema_extra = {
@@ -28,13 +29,20 @@ class OrderCreate(BaseModel):
         }
 
 
+# Пакетные ручки не принимают токен: заказчик каждого объекта
+# проверяется по customer_id и phone_number
+class OrderCreateByPhone(OrderCreate):
+    customer_id: int = Field(..., gt=0)
+    phone_number: str
+
+
 class OrderUpdate(BaseModel):
     outlet_id: int = Field(None, gt=0)
-    customer_id: int = Field(..., gt=0)
+    customer_id: Optional[int] = Field(None, gt=0)
     worker_id: int = Field(None, gt=0)
     created_date: datetime = Field(None)
     ended_date: datetime = Field(None)
-    phone_number: str
+    phone_number: Optional[str] = None
 
     class Config:
         json_schema_extra = {
@@ -52,8 +60,8 @@ class OrderUpdate(BaseModel):
 
 class OrderUpdateStatus(BaseModel):
     status: Status
-    customer_id: int = Field(..., gt=0)
-    phone_number: str
+    customer_id: Optional[int] = Field(None, gt=0)
+    phone_number: Optional[str] = None
 
     class Config:
         json_schema_extra = {
@@ -66,6 +74,32 @@ class OrderUpdateStatus(BaseModel):
         extra = 'forbid'
 
 
+class OrderStatusBulk(BaseModel):
+    status: Status
+    order_ids: Optional[list[int]] = Field(
+        None, max_length=settings.BULK_MAX_SIZE
+    )
+    outlet_id: Optional[int] = Field(None, gt=0)
+    worker_id: Optional[int] = Field(None, gt=0)
+    created_start: Optional[datetime] = None
+    created_end: Optional[datetime] = None
+    customer_id: Optional[int] = Field(None, gt=0)
+    phone_number: Optional[str] = None
+
+    class Config:
+        json_schema_extra = {
+           'example': {
+                'customer_id': 1,
+                'phone_number': '89138927125',
+                'status': 'ended',
+                'outlet_id': 1,
+                'created_start': data_example_started,
+                'created_end': data_example_ended,
+           }
+        }
+        extra = 'forbid'
+
+
 class OrderDB(BaseModel):
     id: int
     created_date: datetime
@@ -74,3 +108,26 @@ class OrderDB(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class OrderPage(BaseModel):
+    items: list[OrderDB]
+    next_cursor: Optional[str] = None
+
+
+class OrderBulkItemResult(BaseModel):
+    index: int
+    status_code: int
+    order: Optional[OrderDB] = None
+    detail: Optional[str] = None
+
+
+class OrderStatusRejected(BaseModel):
+    id: int
+    status: Optional[Status] = None
+    detail: str
+
+
+class OrderStatusBulkResult(BaseModel):
+    updated: list[OrderDB]
+    rejected: list[OrderStatusRejected]
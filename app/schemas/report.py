@@ -0,0 +1,25 @@
+from datetime import date
+from typing import Optional
+
+from pydantic import BaseModel
+
+from app.models.models import Status
+
+
+class OrderReportRow(BaseModel):
+    day: date
+    outlet_id: Optional[int] = None
+    status: Status
+    orders: int
+
+    class Config:
+        from_attributes = True
+
+
+class VisitReportRow(BaseModel):
+    day: date
+    worker_id: Optional[int] = None
+    visits: int
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,20 @@
+from pydantic import BaseModel, Field
+
+from app.schemas.order import OrderDB
+from app.schemas.visit import VisitDB
+
+
+class DeletedObject(BaseModel):
+    entity: str
+    id: int = Field(..., validation_alias='entity_id')
+
+    class Config:
+        from_attributes = True
+
+
+class Changes(BaseModel):
+    orders: list[OrderDB]
+    visits: list[VisitDB]
+    deleted: list[DeletedObject]
+    next_since: int
+    has_more: bool
@@ -1,17 +1,19 @@
 from datetime import datetime
-from typing import Optional
+from typing import Annotated, Literal, Optional, Union
 
 from pydantic import BaseModel, Field
 
+from app.core.config import settings
+
 date_example = datetime.now()
 
 
 class VisitCreate(BaseModel):
     outlet_id: int = Field(None, gt=0)
-    customer_id: int = Field(..., gt=0)
+    customer_id: Optional[int] = Field(None, gt=0)
     worker_id: int = Field(None, gt=0)
     order_id: int = Field(None, gt=0)
-    phone_number: str
+    phone_number: Optional[str] = None
 
     class Config:
         json_schema_extra = {
@@ -27,11 +29,11 @@ class VisitCreate(BaseModel):
 
 class VisitUpdate(BaseModel):
     outlet_id: Optional[int] = Field(None, gt=0)
-    customer_id: int = Field(..., gt=0)
+    customer_id: Optional[int] = Field(None, gt=0)
     worker_id: Optional[int] = Field(None, gt=0)
     order_id: Optional[int] = Field(None, gt=0)
     created_date: Optional[datetime] = Field(None)
-    phone_number: str
+    phone_number: Optional[str] = None
 
     class Config:
         json_schema_extra = {
@@ -46,9 +48,82 @@ class VisitUpdate(BaseModel):
         }
 
 
+# Пакетные ручки не принимают токен: заказчик каждого объекта
+# проверяется по customer_id и phone_number
+class VisitCreateByPhone(VisitCreate):
+    customer_id: int = Field(..., gt=0)
+    phone_number: str
+
+
+class VisitUpdateByPhone(VisitUpdate):
+    customer_id: int = Field(..., gt=0)
+    phone_number: str
+
+
 class VisitDB(BaseModel):
     id: int
     created_date: datetime
 
     class Config:
         from_attributes = True
+
+
+class VisitPage(BaseModel):
+    items: list[VisitDB]
+    next_cursor: Optional[str] = None
+
+
+class VisitSyncCreate(BaseModel):
+    op: Literal['create']
+    visit: VisitCreateByPhone
+
+
+class VisitSyncUpdate(BaseModel):
+    op: Literal['update']
+    visit_id: int = Field(..., gt=0)
+    visit: VisitUpdateByPhone
+
+
+class VisitSync(BaseModel):
+    device_id: Optional[str] = None
+    items: list[
+        Annotated[
+            Union[VisitSyncCreate, VisitSyncUpdate],
+            Field(discriminator='op')
+        ]
+    ] = Field(..., max_length=settings.BULK_MAX_SIZE)
+
+    class Config:
+        json_schema_extra = {
+           'example': {
+               'device_id': 'android-5f2c',
+               'items': [
+                   {
+                       'op': 'create',
+                       'visit': {
+                           'outlet_id': 1,
+                           'customer_id': 1,
+                           'worker_id': 1,
+                           'order_id': 1,
+                           'phone_number': '89138927125'
+                       }
+                   },
+                   {
+                       'op': 'update',
+                       'visit_id': 1,
+                       'visit': {
+                           'customer_id': 1,
+                           'phone_number': '89138927125',
+                           'created_date': date_example
+                       }
+                   },
+               ]
+           }
+        }
+
+
+class VisitSyncItemResult(BaseModel):
+    index: int
+    status_code: int
+    id: Optional[int] = None
+    detail: Optional[str] = None
@@ -0,0 +1,147 @@
+"""Всплеск запросов с допуском к базе (app/core/admission.py) и без него.
+
+Одновременно отправляются READS чтений GET /order/ и WRITES записей
+POST /order/ от CUSTOMERS заказчиков, каждое чтение со своего адреса.
+Без допуска все запросы ждут соединение в пуле, с допуском чтения
+получают 503, пока в очереди есть записи, а записи ждут места
+не дольше бюджета. Все запросы стартуют разом в одном процессе,
+поэтому и отказы ждут своей очереди в цикле событий.
+Запросы идут в ASGI-приложение напрямую, без HTTP-клиента.
+Запуск: python -m benchmarks.admission
+"""
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+
+from sqlalchemy import delete, select
+
+import app.core.admission as admission_module
+from app.core.database import async_engine, async_session
+from app.main import app
+from app.models.models import Customer, Order
+
+READS = 1500
+WRITES = 300
+CUSTOMERS = 100
+
+
+def make_scope(
+    method: str, path: str, query: str = '', client: int = 1
+) -> dict:
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [
+            (b'host', b'bench'), (b'content-type', b'application/json')
+        ],
+        'client': (f'10.0.{client // 256}.{client % 256}', 1),
+        'server': ('bench', 80),
+    }
+
+
+async def call(
+    method: str, path: str, query: str = '', body: dict = None, client=1
+):
+    '''Статус, время ответа и тело ответа.'''
+    payload = json.dumps(body).encode() if body is not None else b''
+    response = {'body': b''}
+
+    async def receive() -> dict:
+        return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+    async def send(message) -> None:
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    started = time.perf_counter()
+    await app(make_scope(method, path, query, client), receive, send)
+    return (
+        response['status'], time.perf_counter() - started, response['body']
+    )
+
+
+def percentile(values: list, share: float) -> float:
+    return sorted(values)[int(len(values) * share)] if values else 0.0
+
+
+async def spike(customers: list) -> tuple[dict, list]:
+    requests = [('GET', '/order/', 'limit=50', None)] * READS + [
+        ('POST', '/order/', '', {
+            'customer_id': customer.id,
+            'phone_number': customer.phone_number,
+        })
+        for index in range(WRITES)
+        for customer in [customers[index % len(customers)]]
+    ]
+    results = await asyncio.gather(*(
+        call(*request, client=index)
+        for index, request in enumerate(requests)
+    ))
+    created = [
+        json.loads(body)['id']
+        for (method, *_), (status, _, body) in zip(requests, results)
+        if method == 'POST' and status == 200
+    ]
+    report = {}
+    for kind in ('GET', 'POST'):
+        rows = [
+            result for request, result in zip(requests, results)
+            if request[0] == kind
+        ]
+        ok = [elapsed for status, elapsed, _ in rows if status == 200]
+        rejected = [elapsed for status, elapsed, _ in rows if status != 200]
+        report[kind] = {
+            'statuses': Counter(status for status, _, _ in rows),
+            'p50': statistics.median(ok) if ok else 0.0,
+            'p99': percentile(ok, 0.99),
+            'rejected_p99': percentile(rejected, 0.99),
+        }
+    return report, created
+
+
+async def main() -> None:
+    async_engine.echo = False
+    async with async_session() as session:
+        customers = (await session.execute(
+            select(Customer.id, Customer.phone_number).limit(CUSTOMERS)
+        )).all()
+    # прогрев пула
+    await asyncio.gather(*(call('GET', '/order/', 'limit=50')
+                           for _ in range(50)))
+    enabled = admission_module.admission
+    created = []
+    print(f'{READS} чтений и {WRITES} записей одновременно, время в мс')
+    print(f"{'допуск':<8}{'ручка':<7}{'p50':>8}{'p99':>8}"
+          f"{'p99 отказов':>13}  статусы")
+    for name, control in (('нет', None), ('есть', enabled)):
+        admission_module.admission = control
+        pool = async_engine.pool
+        timeouts = pool.timeouts
+        report, ids = await spike(customers)
+        created += ids
+        for kind, row in report.items():
+            print(f"{name:<8}{kind:<7}{row['p50'] * 1000:>8.0f}"
+                  f"{row['p99'] * 1000:>8.0f}"
+                  f"{row['rejected_p99'] * 1000:>13.0f}  "
+                  f"{dict(sorted(row['statuses'].items()))}")
+        print(f'        отказов пула по таймауту: {pool.timeouts - timeouts}')
+    admission_module.admission = enabled
+    async with async_session() as session:
+        await session.execute(delete(Order).where(Order.id.in_(created)))
+        await session.commit()
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""Запросы к базе и задержка на одну запись через функции app/crud:
+создание, изменение и удаление заказа и посещения.
+
+Запуск: python -m benchmarks.crud_writes
+"""
+import asyncio
+import time
+
+from sqlalchemy import event, select
+
+from app.core.database import async_engine, async_session
+from app.crud.order import create_order, delete_order, update_order
+from app.crud.visit import create_visit, delete_visit, update_visit
+from app.models.models import Customer
+from app.schemas.order import OrderCreate, OrderUpdateStatus
+from app.schemas.visit import VisitCreate, VisitUpdate
+
+ROUNDS = 300
+
+stats = {'statements': 0}
+
+
+@event.listens_for(async_engine.sync_engine, 'before_cursor_execute')
+def _count(conn, cursor, statement, parameters, context, executemany):
+    stats['statements'] += 1
+
+
+@event.listens_for(async_engine.sync_engine, 'commit')
+def _count_commit(conn):
+    stats['statements'] += 1
+
+
+async def main() -> None:
+    async_engine.echo = False
+    async with async_session() as session:
+        customer = (await session.execute(
+            select(Customer.id, Customer.phone_number, Customer.outlet_id)
+            .limit(1)
+        )).one()
+    order_in = OrderCreate(
+        customer_id=customer.id,
+        phone_number=customer.phone_number,
+        outlet_id=customer.outlet_id,
+    )
+    status_in = OrderUpdateStatus(
+        customer_id=customer.id,
+        phone_number=customer.phone_number,
+        status='ended',
+    )
+    visit_in = VisitCreate(
+        customer_id=customer.id,
+        phone_number=customer.phone_number,
+        outlet_id=customer.outlet_id,
+    )
+    visit_update = VisitUpdate(
+        customer_id=customer.id,
+        phone_number=customer.phone_number,
+        created_date='2024-01-01T00:00:00',
+    )
+    ops = {
+        name: [0, 0.0] for name in (
+            'create_order', 'update_order', 'delete_order',
+            'create_visit', 'update_visit', 'delete_visit',
+        )
+    }
+
+    async def measure(name, call):
+        async with async_session() as session:
+            stats['statements'] = 0
+            started = time.perf_counter()
+            result = await call(session)
+            ops[name][1] += time.perf_counter() - started
+            ops[name][0] += stats['statements']
+        return result
+
+    for _ in range(ROUNDS):
+        order = await measure(
+            'create_order', lambda s: create_order(order_in, s)
+        )
+        await measure(
+            'update_order', lambda s: update_order(order, status_in, s)
+        )
+        await measure('delete_order', lambda s: delete_order(order, s))
+        visit = await measure(
+            'create_visit', lambda s: create_visit(visit_in, s)
+        )
+        await measure(
+            'update_visit', lambda s: update_visit(visit, visit_update, s)
+        )
+        await measure('delete_visit', lambda s: delete_visit(visit, s))
+
+    print(f'{ROUNDS} повторов')
+    print(f"{'операция':<16}{'запросов':>10}{'мс':>10}")
+    for name, (statements, elapsed) in ops.items():
+        print(f'{name:<16}{statements / ROUNDS:>10.1f}'
+              f'{elapsed / ROUNDS * 1000:>10.3f}')
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""Нагрузка на базу от проверки заказчика с кэшем и без.
+
+Имитирует проверку на ручках записи: POST /order/ (только заказчик)
+и PUT /order/change-status/{order_id} (заказчик и заказ) для нескольких
+тысяч запросов от небольшого набора заказчиков.
+Запуск: python -m benchmarks.customer_cache
+"""
+import asyncio
+import time
+
+from sqlalchemy import event, select
+
+from app.api.write_validators import get_order_write_facts
+from app.core.database import async_engine, async_session
+from app.crud.customer_cache import customer_identity_cache
+from app.models.models import Order
+
+REQUESTS = 5000
+CUSTOMERS = 50
+
+stats = {'statements': 0, 'db_time': 0.0}
+
+
+@event.listens_for(async_engine.sync_engine, 'before_cursor_execute')
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+@event.listens_for(async_engine.sync_engine, 'after_cursor_execute')
+def _after(conn, cursor, statement, parameters, context, executemany):
+    stats['statements'] += 1
+    stats['db_time'] += time.perf_counter() - conn.info.pop('query_start')
+
+
+async def run(pairs, with_order: bool) -> tuple[float, float, float]:
+    stats.update(statements=0, db_time=0.0)
+    started = time.perf_counter()
+    async with async_session() as session:
+        for i in range(REQUESTS):
+            customer_id, order_id = pairs[i % len(pairs)]
+            await get_order_write_facts(
+                session,
+                customer_id=customer_id,
+                order_id=order_id if with_order else None,
+            )
+            session.expunge_all()
+    total = time.perf_counter() - started
+    return (
+        stats['statements'] / REQUESTS,
+        stats['db_time'] / REQUESTS * 1000,
+        total / REQUESTS * 1000,
+    )
+
+
+async def main() -> None:
+    async_engine.echo = False
+    async with async_session() as session:
+        result = await session.execute(
+            select(Order.customer_id, Order.id)
+            .where(Order.customer_id.is_not(None))
+            .distinct(Order.customer_id)
+            .limit(CUSTOMERS)
+        )
+        pairs = result.all()
+    print(f'{REQUESTS} запросов, {len(pairs)} заказчиков')
+    print(f"{'ручка':<28}{'кэш':<6}{'запросов/req':>14}"
+          f"{'db мс/req':>12}{'всего мс/req':>14}")
+    for name, with_order in (
+        ('POST /order/', False),
+        ('PUT /order/change-status', True),
+    ):
+        for enabled in (False, True):
+            customer_identity_cache.clear()
+            customer_identity_cache.maxsize = 10000 if enabled else 0
+            statements, db_ms, total_ms = await run(pairs, with_order)
+            print(f"{name:<28}{'да' if enabled else 'нет':<6}"
+                  f'{statements:>14.2f}{db_ms:>12.3f}{total_ms:>14.3f}')
+    print('статистика кэша:', customer_identity_cache.stats())
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
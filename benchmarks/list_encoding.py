@@ -0,0 +1,98 @@
+"""Скорость страницы списка: объекты ORM и response_model против
+выборки колонок и прямого кодирования в JSON (app/api/fast_json.py).
+
+Оба пути проходят одинаковые страницы keyset-пагинации, ответы
+сравниваются побайтно. Запуск: python -m benchmarks.list_encoding
+"""
+import asyncio
+import json
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import func, select
+
+from app.api.export import export_columns
+from app.api.fast_json import json_page, orjson
+from app.api.pagination import make_page, paginate
+from app.core.database import async_engine, async_session
+from app.models.models import Order, Visit
+from app.schemas.order import OrderDB, OrderPage
+from app.schemas.visit import VisitDB, VisitPage
+
+LIMIT = 500
+ROUNDS = 5
+
+
+async def orm_page(session, model, field, cursor) -> bytes:
+    result = await session.execute(
+        paginate(select(model), model, cursor, LIMIT)
+    )
+    content = await serialize_response(
+        field=field,
+        response_content=make_page(result.scalars().all(), LIMIT),
+        exclude_none=True,
+    )
+    session.expunge_all()
+    return JSONResponse(content).body
+
+
+async def fast_page(session, model, schema, cursor) -> bytes:
+    result = await session.execute(
+        paginate(select(*export_columns(model, schema)), model, cursor, LIMIT)
+    )
+    return json_page(result.all(), LIMIT).body
+
+
+async def walk(page) -> tuple[list[bytes], float]:
+    '''Все страницы таблицы, время только на ручку (без курсора).'''
+    bodies = []
+    cursor = None
+    elapsed = 0.0
+    async with async_session() as session:
+        while True:
+            started = time.perf_counter()
+            body = await page(session, cursor)
+            elapsed += time.perf_counter() - started
+            bodies.append(body)
+            cursor = json.loads(body).get('next_cursor')
+            if cursor is None:
+                return bodies, elapsed
+
+
+async def main() -> None:
+    async_engine.echo = False
+    print(f"кодировщик: {'orjson' if orjson else 'json'}, страница {LIMIT}")
+    print(f"{'список':<10}{'путь':<8}{'строк/с':>12}{'мс/страница':>14}")
+    for model, schema, page_schema in (
+        (Order, OrderDB, OrderPage),
+        (Visit, VisitDB, VisitPage),
+    ):
+        async with async_session() as session:
+            rows = await session.scalar(select(func.count(model.id)))
+        field = create_response_field(name='response', type_=page_schema)
+        paths = {
+            'orm': lambda session, cursor: orm_page(
+                session, model, field, cursor
+            ),
+            'fast': lambda session, cursor: fast_page(
+                session, model, schema, cursor
+            ),
+        }
+        bodies = {}
+        for name, page in paths.items():
+            best = None
+            for _ in range(ROUNDS):
+                bodies[name], elapsed = await walk(page)
+                best = elapsed if best is None else min(best, elapsed)
+            print(f'{model.__tablename__:<10}{name:<8}'
+                  f'{rows / best:>12.0f}'
+                  f'{best / len(bodies[name]) * 1000:>14.2f}')
+        assert bodies['orm'] == bodies['fast'], 'ответы отличаются'
+    print('ответы совпадают побайтно')
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
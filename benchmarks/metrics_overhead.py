@@ -0,0 +1,187 @@
+"""Цена метрик запросов (app/core/metrics.py) и журнала медленных
+запросов (app/core/slow_queries.py), которые включены всегда.
+
+Сначала отдельно замеряется сама прослойка RequestMetricsMiddleware
+на пустом ASGI-приложении и события движка на один SQL-запрос,
+из них считается доля во времени ответа реальных ручек. Затем те же
+ручки вызываются с метриками и без них вперемешку: разница должна
+оставаться в пределах шума базы.
+Запросы идут в ASGI-приложение напрямую, без HTTP-клиента.
+Запуск: python -m benchmarks.metrics_overhead
+"""
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import select
+from starlette.routing import Match
+
+from app.core.database import async_engine, async_session
+from app.core.metrics import (
+    RequestMetrics, RequestMetricsMiddleware, _request_db, request_metrics,
+    track_engine, untrack_engine
+)
+from app.main import app
+from app.models.models import Order, Worker
+
+REPEATS = 1000
+MICRO_REPEATS = 100000
+# Допустимая доля метрик во времени ответа
+BUDGET = 0.02
+
+
+def make_scope(path: str, query: str = '') -> dict:
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'bench')],
+        'client': ('127.0.0.1', 1),
+        'server': ('bench', 80),
+    }
+
+
+async def receive() -> dict:
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+async def send(message) -> None:
+    if message['type'] == 'http.response.start':
+        assert message['status'] == 200, message
+
+
+async def empty_app(scope, receive, send) -> None:
+    await send(
+        {'type': 'http.response.start', 'status': 200, 'headers': []}
+    )
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def middleware_cost() -> float:
+    '''Секунды прослойки на один запрос сверх пустого приложения.'''
+    scope = make_scope('/')
+    wrapped = RequestMetricsMiddleware(empty_app, RequestMetrics())
+    best = {}
+    for asgi in (empty_app, wrapped) * 3:
+        started = time.perf_counter()
+        for _ in range(MICRO_REPEATS):
+            await asgi(scope, receive, send)
+        elapsed = (time.perf_counter() - started) / MICRO_REPEATS
+        best[asgi] = min(best.get(asgi, elapsed), elapsed)
+    return best[wrapped] - best[empty_app]
+
+
+async def statement_cost() -> float:
+    '''Секунды всех событий движка (метрики и журнал медленных
+    запросов) на один SQL-запрос внутри HTTP-запроса.'''
+    dispatch = async_engine.sync_engine.dispatch
+    token = _request_db.set([0, 0.0, 0.0])
+    try:
+        async with async_engine.connect() as conn:
+            args = (conn.sync_connection, None, 'SELECT 1', (), None, False)
+            started = time.perf_counter()
+            for _ in range(MICRO_REPEATS):
+                dispatch.before_cursor_execute(*args)
+                dispatch.after_cursor_execute(*args)
+            return (time.perf_counter() - started) / MICRO_REPEATS
+    finally:
+        _request_db.reset(token)
+
+
+def build_stack(with_metrics: bool):
+    middleware = app.user_middleware
+    if not with_metrics:
+        app.user_middleware = [
+            item for item in middleware
+            if item.cls is not RequestMetricsMiddleware
+        ]
+    try:
+        return app.build_middleware_stack()
+    finally:
+        app.user_middleware = middleware
+
+
+def route_of(request: tuple) -> str:
+    scope = make_scope(*request)
+    return next(
+        route.path for route in app.routes
+        if route.matches(scope)[0] == Match.FULL
+    )
+
+
+async def main() -> None:
+    async_engine.echo = False
+    async with async_session() as session:
+        order_id = await session.scalar(select(Order.id).limit(1))
+        phone_number = await session.scalar(
+            select(Worker.phone_number).limit(1)
+        )
+    requests = [
+        (f'/order/{order_id}', ''),
+        ('/order/', 'limit=50'),
+        ('/visit/', 'limit=50'),
+        ('/outlet/', f'phone_number={phone_number}'),
+    ]
+    stacks = {False: build_stack(False), True: build_stack(True)}
+    for asgi in stacks.values():
+        for request in requests:
+            await asgi(make_scope(*request), receive, send)
+
+    # режимы чередуются в случайном порядке на каждом запросе, чтобы
+    # шум базы одинаково попадал в оба; события включаются вне замера
+    timings = {(request, mode): [] for request in requests for mode in stacks}
+    request_metrics.statements.clear()
+    untrack_engine(async_engine)
+    for _ in range(REPEATS):
+        for request in requests:
+            modes = list(stacks)
+            random.shuffle(modes)
+            for with_metrics in modes:
+                if with_metrics:
+                    track_engine(async_engine)
+                started = time.perf_counter()
+                await stacks[with_metrics](make_scope(*request), receive, send)
+                timings[request, with_metrics].append(
+                    time.perf_counter() - started
+                )
+                if with_metrics:
+                    untrack_engine(async_engine)
+
+    per_request = await middleware_cost()
+    track_engine(async_engine)
+    per_statement = await statement_cost()
+    statements = {
+        labels[1]: count / REPEATS
+        for labels, count in request_metrics.statements.items()
+    }
+
+    print(f'прослойка: {per_request * 1e6:.1f} мкс на запрос, '
+          f'события движка: {per_statement * 1e6:.2f} мкс на SQL-запрос')
+    print(f'{REPEATS} повторов каждой ручки, медианы в мкс')
+    print(f"{'ручка':<20}{'без':>9}{'с метриками':>13}{'разница':>10}"
+          f"{'SQL':>5}{'цена метрик':>13}")
+    worst = 0.0
+    for request in requests:
+        off = statistics.median(timings[request, False])
+        on = statistics.median(timings[request, True])
+        route = route_of(request)
+        cost = per_request + statements[route] * per_statement
+        worst = max(worst, cost / off)
+        print(f'{route:<20}{off * 1e6:>9.1f}{on * 1e6:>13.1f}'
+              f'{(on - off) / off * 100:>+9.2f}%{statements[route]:>5.0f}'
+              f'{cost / off * 100:>12.2f}%')
+    print(f'цена метрик не больше {worst * 100:.2f}% времени ответа '
+          f'(допустимо {BUDGET * 100:.0f}%)')
+    assert worst < BUDGET, 'метрики дороже допустимого'
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,239 @@
+"""Запросы списка заказов к обычной и секционированной по месяцам таблице.
+
+В схемах bench_plain и bench_partitioned создаются копии таблицы order
+с теми же индексами (в секционированной - первичный ключ
+(id, created_date) и месячные секции), в обе загружаются одни и те же
+ROWS заказов за MONTHS месяцев. Запросы строятся так же, как в ручках
+GET /order/ и GET /order/export (order_filters, paginate), таблица
+выбирается через search_path. Считается медиана времени запроса
+и число просканированных таблиц по плану, размеры индексов
+и удаление самого старого месяца. Схемы удаляются в конце.
+Таблицы приложения не секционированы: поиск заказа и посещения по id
+(все ручки одного объекта) и страница по курсору без конца промежутка
+с секциями медленнее, см. вывод.
+Запуск: python -m benchmarks.partitioning
+"""
+import asyncio
+import re
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import func, select, text
+
+from app.api.export import export_columns
+from app.api.filters import order_filters
+from app.api.pagination import encode_cursor, paginate
+from app.core.database import async_engine
+from app.models.models import Order, Status
+from app.schemas.order import OrderDB
+
+ROWS = 3_000_000
+MONTHS = 36
+FIRST_MONTH = datetime(2023, 1, 1)
+ROUNDS = 20
+SCHEMAS = ('bench_plain', 'bench_partitioned')
+
+
+def month_start(moment: datetime, shift: int = 0) -> datetime:
+    '''Начало месяца moment, сдвинутого на shift месяцев.'''
+    months = moment.year * 12 + moment.month - 1 + shift
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+async def create_tables(conn) -> None:
+    plain, partitioned = SCHEMAS
+    for schema in SCHEMAS:
+        await conn.execute(text(f'DROP SCHEMA IF EXISTS {schema} CASCADE'))
+        await conn.execute(text(f'CREATE SCHEMA {schema}'))
+    await conn.execute(text(
+        f'CREATE TABLE {plain}."order" '
+        f'(LIKE public."order" INCLUDING DEFAULTS)'
+    ))
+    await conn.execute(text(
+        f'CREATE TABLE {partitioned}."order" '
+        f'(LIKE public."order" INCLUDING DEFAULTS) '
+        f'PARTITION BY RANGE (created_date)'
+    ))
+    await conn.execute(text(
+        f'CREATE TABLE {partitioned}.order_default '
+        f'PARTITION OF {partitioned}."order" DEFAULT'
+    ))
+    for shift in range(MONTHS):
+        month = month_start(FIRST_MONTH, shift)
+        end = month_start(month, 1)
+        await conn.execute(text(
+            f'CREATE TABLE {partitioned}.order_p{month:%Y_%m} '
+            f'PARTITION OF {partitioned}."order" '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+
+
+async def seed(conn) -> None:
+    plain, partitioned = SCHEMAS
+    end = month_start(FIRST_MONTH, MONTHS)
+    statuses = ', '.join(f"'{status.value}'" for status in Status)
+    await conn.execute(text(
+        f'INSERT INTO {plain}."order" (id, created_date, ended_date, '
+        f'outlet_id, customer_id, status, worker_id, version, change_seq) '
+        f"SELECT n, created, created + INTERVAL '1 week', "
+        f'1 + n % 100, 1 + n % 1000, '
+        f'(ARRAY[{statuses}]::status[])[1 + n % 5], 1 + n % 50, 1, n '
+        f"FROM (SELECT n, TIMESTAMP '{FIRST_MONTH:%Y-%m-%d}' + random() * "
+        f"(TIMESTAMP '{end:%Y-%m-%d}' - TIMESTAMP '{FIRST_MONTH:%Y-%m-%d}' "
+        f"- INTERVAL '1 second') AS created "
+        f'FROM generate_series(1, {ROWS}) AS n) AS seed'
+    ))
+    await conn.execute(text(
+        f'INSERT INTO {partitioned}."order" SELECT * FROM {plain}."order"'
+    ))
+    await conn.execute(text(
+        f'ALTER TABLE {plain}."order" ADD PRIMARY KEY (id)'
+    ))
+    await conn.execute(text(
+        f'ALTER TABLE {partitioned}."order" '
+        f'ADD PRIMARY KEY (id, created_date)'
+    ))
+    for schema in SCHEMAS:
+        for index in Order.__table__.indexes:
+            columns = ', '.join(column.name for column in index.columns)
+            await conn.execute(text(
+                f'CREATE INDEX {index.name} ON {schema}."order" ({columns})'
+            ))
+
+
+async def make_queries() -> dict:
+    month = month_start(FIRST_MONTH, MONTHS // 2)
+    created = {
+        'created_start': month,
+        'created_end': month_start(month, 1),
+    }
+    no_filters = dict.fromkeys(
+        ('status', 'created_start', 'created_end', 'ended_start',
+         'ended_end')
+    )
+    month_filters = await order_filters(**{**no_filters, **created})
+    status_filters = await order_filters(
+        **{**no_filters, **created, 'status': Status.ended}
+    )
+    ended_filters = await order_filters(**{
+        **no_filters,
+        'ended_start': month,
+        'ended_end': month_start(month, 1),
+    })
+    columns = export_columns(Order, OrderDB)
+    cursor = encode_cursor(month, 0)
+    return {
+        'страница за месяц': paginate(
+            select(*columns).where(*month_filters), Order, None, 50
+        ),
+        'страница по статусу': paginate(
+            select(*columns).where(*status_filters), Order, None, 50
+        ),
+        'страница по курсору': paginate(
+            select(*columns), Order, cursor, 50
+        ),
+        'число за месяц': select(func.count()).where(*month_filters),
+        'выгрузка месяца': (
+            select(*columns)
+            .where(*month_filters)
+            .order_by(Order.created_date, Order.id)
+        ),
+        'по дате завершения': paginate(
+            select(*columns).where(*ended_filters), Order, None, 50
+        ),
+        'заказ по id': select(*columns).where(Order.id == ROWS // 2),
+    }
+
+
+async def measure(conn, schema: str, query) -> tuple[float, int]:
+    '''Медиана времени запроса и число таблиц в его плане.'''
+    await conn.execute(text(f'SET search_path TO {schema}, public'))
+    sql = query.compile(
+        dialect=async_engine.dialect, compile_kwargs={'literal_binds': True}
+    )
+    plan = '\n'.join(
+        (await conn.execute(text(f'EXPLAIN {sql}'))).scalars()
+    )
+    scanned = len(re.findall(r' on "?order', plan))
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        (await conn.execute(query)).all()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), scanned
+
+
+async def index_sizes(conn, schema: str) -> tuple[int, int]:
+    '''Суммарный размер индексов таблицы и самый большой индекс.'''
+    sizes = (await conn.execute(text(
+        'SELECT pg_relation_size(i.indexrelid) FROM pg_index i '
+        'JOIN pg_class c ON c.oid = i.indrelid '
+        'JOIN pg_namespace n ON n.oid = c.relnamespace '
+        'WHERE n.nspname = :schema AND c.relkind = \'r\''
+    ), {'schema': schema})).scalars().all()
+    return sum(sizes), max(sizes)
+
+
+async def drop_oldest_month(conn) -> dict:
+    plain, partitioned = SCHEMAS
+    end = month_start(FIRST_MONTH, 1)
+    timings = {}
+    started = time.perf_counter()
+    await conn.execute(text(
+        f'DELETE FROM {plain}."order" '
+        f"WHERE created_date < '{end:%Y-%m-%d}'"
+    ))
+    timings[plain] = time.perf_counter() - started
+    started = time.perf_counter()
+    await conn.execute(text(
+        f'ALTER TABLE {partitioned}."order" '
+        f'DETACH PARTITION {partitioned}.order_p{FIRST_MONTH:%Y_%m}'
+    ))
+    await conn.execute(text(
+        f'DROP TABLE {partitioned}.order_p{FIRST_MONTH:%Y_%m}'
+    ))
+    timings[partitioned] = time.perf_counter() - started
+    return timings
+
+
+async def main() -> None:
+    async_engine.echo = False
+    print(f'{ROWS} заказов за {MONTHS} месяцев, загрузка...')
+    started = time.perf_counter()
+    async with async_engine.begin() as conn:
+        await create_tables(conn)
+        await seed(conn)
+    async with async_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+        for schema in SCHEMAS:
+            await conn.execute(text(f'VACUUM ANALYZE {schema}."order"'))
+    print(f'загружено за {time.perf_counter() - started:.0f} с')
+    queries = await make_queries()
+    print(f"{'запрос':<22}{'обычная, мс':>13}{'секции, мс':>12}"
+          f"{'таблиц':>10}")
+    async with async_engine.connect() as conn:
+        for name, query in queries.items():
+            plain, plain_scanned = await measure(conn, SCHEMAS[0], query)
+            parted, parted_scanned = await measure(conn, SCHEMAS[1], query)
+            print(f'{name:<22}{plain * 1000:>13.2f}{parted * 1000:>12.2f}'
+                  f'{plain_scanned:>5} / {parted_scanned:<4}')
+        await conn.execute(text('SET search_path TO public'))
+        for schema in SCHEMAS:
+            total, largest = await index_sizes(conn, schema)
+            print(f'индексы {schema}: всего {total / 2**20:.0f} МБ, '
+                  f'самый большой {largest / 2**20:.1f} МБ')
+        await conn.commit()
+        timings = await drop_oldest_month(conn)
+        await conn.commit()
+        for schema, elapsed in timings.items():
+            print(f'удаление старейшего месяца, {schema}: '
+                  f'{elapsed * 1000:.0f} мс')
+        for schema in SCHEMAS:
+            await conn.execute(text(f'DROP SCHEMA {schema} CASCADE'))
+        await conn.commit()
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""POST /visit/ с групповым коммитом (app/crud/group_commit.py) и без него.
+
+CONCURRENCY клиентов без пауз создают всего VISITS посещений,
+считаются созданные посещения и коммиты в секунду и время ответа.
+Запросы идут в ASGI-приложение напрямую, без HTTP-клиента.
+Запуск: python -m benchmarks.visit_group_commit
+"""
+import asyncio
+import json
+import statistics
+import time
+
+from sqlalchemy import delete, event, select
+
+from app.core.config import settings
+from app.core.database import async_engine, async_session
+from app.crud import group_commit
+from app.crud.group_commit import VisitGroupCommit
+from app.main import app
+from app.models.models import Customer, Visit
+
+VISITS = 3000
+CONCURRENCY = 50
+
+stats = {'commits': 0}
+
+
+@event.listens_for(async_engine.sync_engine, 'commit')
+def _count_commit(conn):
+    stats['commits'] += 1
+
+
+def make_scope(path: str) -> dict:
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [
+            (b'host', b'bench'), (b'content-type', b'application/json')
+        ],
+        'client': ('127.0.0.1', 1),
+        'server': ('bench', 80),
+    }
+
+
+async def post_visit(payload: bytes) -> tuple[float, int]:
+    response = {'body': b''}
+
+    async def receive() -> dict:
+        return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+    async def send(message) -> None:
+        if message['type'] == 'http.response.start':
+            assert message['status'] == 200, message
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    started = time.perf_counter()
+    await app(make_scope('/visit/'), receive, send)
+    return time.perf_counter() - started, json.loads(response['body'])['id']
+
+
+async def run(customers: list) -> tuple[dict, list]:
+    payloads = [
+        json.dumps({
+            'customer_id': customer.id,
+            'phone_number': customer.phone_number,
+        }).encode()
+        for customer in customers
+    ]
+    latencies, ids = [], []
+
+    async def client(number: int) -> None:
+        for index in range(number, VISITS, CONCURRENCY):
+            elapsed, visit_id = await post_visit(
+                payloads[index % len(payloads)]
+            )
+            latencies.append(elapsed)
+            ids.append(visit_id)
+
+    stats['commits'] = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - started
+    return {
+        'visits': VISITS / elapsed,
+        'commits': stats['commits'] / elapsed,
+        'p50': statistics.median(latencies),
+        'p99': sorted(latencies)[int(len(latencies) * 0.99)],
+    }, ids
+
+
+async def main() -> None:
+    async_engine.echo = False
+    async with async_session() as session:
+        customers = (await session.execute(
+            select(Customer.id, Customer.phone_number).limit(CONCURRENCY)
+        )).all()
+    writer = VisitGroupCommit(
+        max_rows=settings.VISIT_GROUP_COMMIT_ROWS,
+        max_delay=settings.VISIT_GROUP_COMMIT_DELAY_MS / 1000,
+    )
+    created = []
+    print(f'{VISITS} посещений, {CONCURRENCY} клиентов')
+    print(f"{'режим':<18}{'посещений/с':>13}{'коммитов/с':>12}"
+          f"{'p50, мс':>9}{'p99, мс':>9}")
+    for name, mode in (('по одному', None), ('групповой', writer)) * 2:
+        group_commit.visit_group_commit = mode
+        report, ids = await run(customers)
+        created += ids
+        print(f"{name:<18}{report['visits']:>13.0f}"
+              f"{report['commits']:>12.0f}{report['p50'] * 1000:>9.1f}"
+              f"{report['p99'] * 1000:>9.1f}")
+    await writer.close()
+    print(f"строк в пакете в среднем: {writer.stats()['rows_per_batch']:.1f}")
+    async with async_session() as session:
+        await session.execute(delete(Visit).where(Visit.id.in_(created)))
+        await session.commit()
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+"""Проверка через EXPLAIN, что запросы ручек используют индексы.
+
+На маленькой тестовой базе планировщик честно выбирает
+последовательное чтение, поэтому перед EXPLAIN отключаем seqscan:
+так проверяется, что для формы запроса вообще есть подходящий индекс.
+Запуск: python check_indexes.py, при ошибке код возврата 1.
+"""
+import asyncio
+import sys
+from datetime import datetime
+
+from sqlalchemy import exists, select
+
+from app.api.filters import order_filters, visit_filters
+from app.api.pagination import encode_cursor, paginate
+from app.core.database import sync_engine
+from app.crud.membership import worker_order_clauses, worker_outlet_clauses
+from app.models.models import Customer, Order, Status, Visit
+
+start = datetime(2023, 3, 1)
+end = datetime(2023, 4, 1)
+cursor = encode_cursor(start, 1)
+
+order_list = asyncio.run(order_filters(
+    status=None, created_start=start, created_end=end,
+    ended_start=None, ended_end=None
+))
+order_list_status = asyncio.run(order_filters(
+    status=Status.ended, created_start=None, created_end=None,
+    ended_start=None, ended_end=None
+))
+order_list_ended = asyncio.run(order_filters(
+    status=None, created_start=None, created_end=None,
+    ended_start=start, ended_end=end
+))
+visit_list = asyncio.run(visit_filters(created_start=start, created_end=end))
+
+# (ручка, запрос, индекс который должен быть в плане)
+CHECKS = (
+    (
+        'GET /order/',
+        paginate(select(Order), Order, cursor, 50),
+        'ix_order_created_date_id'
+    ),
+    (
+        'GET /order/ created_start/created_end',
+        paginate(select(Order).where(*order_list), Order, None, 50),
+        'ix_order_created_date_id'
+    ),
+    (
+        'GET /order/ status',
+        paginate(select(Order).where(*order_list_status), Order, cursor, 50),
+        'ix_order_status_created_date_id'
+    ),
+    (
+        'GET /order/ ended_start/ended_end',
+        select(Order).where(*order_list_ended),
+        'ix_order_ended_date'
+    ),
+    (
+        'GET /visit/',
+        paginate(select(Visit).where(*visit_list), Visit, cursor, 50),
+        'ix_visit_created_date_id'
+    ),
+    (
+        'PUT /order/change-status (заказы заказчика)',
+        select(Order).where(Order.customer_id == 1),
+        'ix_order_customer_id_id'
+    ),
+    (
+        'visit FK (customer)',
+        select(Visit).where(Visit.customer_id == 1),
+        'ix_visit_customer_id_id'
+    ),
+    (
+        'факты посещения: работник в заказе',
+        select(*worker_order_clauses(1, 1)),
+        'ix_order_worker_id_id'
+    ),
+    (
+        'факты посещения: у заказа есть посещение',
+        select(exists().where(Visit.order_id == 1)),
+        'ix_visit_order_id'
+    ),
+    (
+        'факты заказа: работник на торговой точке',
+        select(*worker_outlet_clauses(1, 1)),
+        'ix_worker_outlet_worker_outlet'
+    ),
+    (
+        'customer FK (outlet)',
+        select(Customer).where(Customer.outlet_id == 1),
+        'ix_customer_outlet_id'
+    ),
+    (
+        'order FK (outlet)',
+        select(Order).where(Order.outlet_id == 1),
+        'ix_order_outlet_id'
+    ),
+    (
+        'visit FK (worker)',
+        select(Visit).where(Visit.worker_id == 1),
+        'ix_visit_worker_id'
+    ),
+    (
+        'GET /sync/changes (order)',
+        select(Order).where(Order.change_seq > 1).order_by(Order.change_seq),
+        'ix_order_change_seq'
+    ),
+    (
+        'GET /sync/changes (visit)',
+        select(Visit).where(Visit.change_seq > 1).order_by(Visit.change_seq),
+        'ix_visit_change_seq'
+    ),
+    (
+        'visit FK (outlet)',
+        select(Visit).where(Visit.outlet_id == 1),
+        'ix_visit_outlet_id'
+    ),
+)
+
+
+def plan_indexes(node: dict) -> set[str]:
+    indexes = set()
+    if 'Index Name' in node:
+        indexes.add(node['Index Name'])
+    for child in node.get('Plans', ()):
+        indexes |= plan_indexes(child)
+    return indexes
+
+
+def main() -> int:
+    failed = 0
+    with sync_engine.connect() as conn:
+        conn.exec_driver_sql('SET enable_seqscan = off')
+        for name, stmt, expected in CHECKS:
+            compiled = stmt.compile(sync_engine)
+            result = conn.exec_driver_sql(
+                'EXPLAIN (FORMAT JSON) ' + compiled.string, compiled.params
+            )
+            used = plan_indexes(result.scalar()[0]['Plan'])
+            ok = expected in used
+            failed += not ok
+            print(
+                f"{'OK  ' if ok else 'FAIL'} {name}: "
+                f"ожидается {expected}, в плане {sorted(used) or '-'}"
+            )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
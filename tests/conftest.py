@@ -1,21 +1,28 @@
 import asyncio
+import os
+from contextlib import contextmanager
 from typing import AsyncGenerator
 
 import pytest
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
+os.environ.setdefault('AUTH_SECRET_KEY', 'test-secret-key')
+
+from app.core.base import Base
 from app.core.database import get_async_session
-from app.core.database import metadata
+from app.core.replicas import get_read_session
 from app.config_pytest import (
     DB_HOST_TEST, DB_NAME_TEST,
     DB_PASS_TEST, DB_PORT_TEST,
     DB_USER_TEST
 )
 from app.main import app
+from app.models.models import Customer, Outlet, Worker
 
 # DATABASE
 DATABASE_URL_TEST = f"postgresql+asyncpg://{DB_USER_TEST}:{DB_PASS_TEST}@{DB_HOST_TEST}:{DB_PORT_TEST}/{DB_NAME_TEST}"
@@ -24,7 +31,6 @@ engine_test = create_async_engine(DATABASE_URL_TEST, poolclass=NullPool)
 async_session_maker = sessionmaker(
     engine_test, class_=AsyncSession, expire_on_commit=False
 )
-metadata.bind = engine_test
 
 
 async def override_get_async_session() -> AsyncGenerator[AsyncSession, None]:
@@ -32,14 +38,15 @@ async def override_get_async_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 app.dependency_overrides[get_async_session] = override_get_async_session
+app.dependency_overrides[get_read_session] = override_get_async_session
 
 @pytest.fixture(autouse=True, scope='session')
 async def prepare_database():
     async with engine_test.begin() as conn:
-        await conn.run_sync(metadata.create_all)
+        await conn.run_sync(Base.metadata.create_all)
     yield
     async with engine_test.begin() as conn:
-        await conn.run_sync(metadata.drop_all)
+        await conn.run_sync(Base.metadata.drop_all)
 
 # SETUP
 @pytest.fixture(scope='session')
@@ -55,3 +62,84 @@ client = TestClient(app)
 async def ac() -> AsyncGenerator[AsyncClient, None]:
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
+
+
+# Сколько SQL-запросов может выполнить ручка за один вызов
+QUERY_BUDGETS = {
+    'POST /auth/login': 1,
+    'POST /order/': 3,
+    'POST /order/bulk': 5,
+    'GET /order/': 1,
+    'GET /order/{order_id}': 1,
+    'PATCH /order/{order_id}': 3,
+    'PUT /order/change-status/{order_id}': 3,
+    'PUT /order/change-status': 2,
+    'DELETE /order/{order_id}': 3,
+    'POST /visit/': 3,
+    'GET /visit/': 1,
+    'GET /visit/{visit_id}': 1,
+    'PATCH /visit/{visit_id}': 3,
+    'DELETE /visit/{visit_id}': 3,
+    'GET /report/orders': 1,
+    'GET /report/visits': 1,
+}
+
+
+@pytest.fixture
+def query_budget():
+    """Проверка числа SQL-запросов ручки по QUERY_BUDGETS.
+
+    with query_budget('POST /order/'):
+        response = await ac.post('/order/', json=...)
+
+    Тест падает, если внутри блока выполнено больше запросов, чем
+    разрешено ручке, в отчете перечисляются все запросы."""
+    @contextmanager
+    def check(endpoint: str):
+        budget = QUERY_BUDGETS[endpoint]
+        statements = []
+
+        def collect(conn, cursor, statement, parameters, context, many):
+            statements.append((statement, parameters))
+
+        event.listen(engine_test.sync_engine, 'before_cursor_execute', collect)
+        try:
+            yield statements
+        finally:
+            event.remove(
+                engine_test.sync_engine, 'before_cursor_execute', collect
+            )
+        if len(statements) > budget:
+            report = '\n'.join(
+                f'{number}. {statement}\n   {parameters}'
+                for number, (statement, parameters)
+                in enumerate(statements, 1)
+            )
+            pytest.fail(
+                f'{endpoint}: {len(statements)} SQL-запросов '
+                f'при бюджете {budget}\n{report}',
+                pytrace=False,
+            )
+
+    return check
+
+
+@pytest.fixture(scope='session')
+async def customer(prepare_database) -> dict:
+    """Торговая точка, работник на ней и заказчик этой точки."""
+    async with async_session_maker() as session:
+        outlet = Outlet(name='Тестовая точка')
+        worker = Worker(
+            name='Работник', phone_number='89000000001', outlets=[outlet]
+        )
+        customer = Customer(
+            name='Заказчик', phone_number='89000000002', outlet=outlet
+        )
+        session.add_all([outlet, worker, customer])
+        await session.commit()
+        return {
+            'customer_id': customer.id,
+            'phone_number': customer.phone_number,
+            'outlet_id': outlet.id,
+            'worker_id': worker.id,
+        }
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.admission import READ, WRITE, AdmissionControl
+
+
+def make_admission(**options) -> AdmissionControl:
+    defaults = dict(
+        capacity=2,
+        write_reserve=1,
+        read_budget=1,
+        write_budget=1,
+        customer_queue=10,
+    )
+    return AdmissionControl(**{**defaults, **options})
+
+
+async def test_round_robin_between_customers():
+    admission = make_admission(capacity=1, write_reserve=0)
+    await admission.acquire(WRITE, 'busy')
+    order = []
+
+    async def request(key: str) -> None:
+        await admission.acquire(WRITE, key)
+        order.append(key)
+        admission.release(WRITE, 0)
+
+    tasks = [
+        asyncio.create_task(request(key))
+        for key in ('a', 'a', 'a', 'b', 'c')
+    ]
+    await asyncio.sleep(0)
+    admission.release(WRITE, 0)
+    await asyncio.gather(*tasks)
+    assert order == ['a', 'b', 'c', 'a', 'a']
+
+
+async def test_reads_shed_before_writes():
+    admission = make_admission()
+    await admission.acquire(READ, 'a')
+    with pytest.raises(HTTPException) as error:
+        await admission.acquire(READ, 'b')
+    assert error.value.status_code == 503
+    assert error.value.headers['Retry-After'] == '1'
+    await admission.acquire(WRITE, 'b')
+    waiting = asyncio.create_task(admission.acquire(WRITE, 'c'))
+    await asyncio.sleep(0)
+    admission.release(READ, 0)
+    await waiting
+    assert admission.metrics()[READ]['rejected_503'] == 1
+    assert admission.metrics()[WRITE]['admitted'] == 2
+
+
+async def test_customer_queue_limit():
+    admission = make_admission(capacity=1, write_reserve=0, customer_queue=1)
+    await admission.acquire(WRITE, 'a')
+    waiting = asyncio.create_task(admission.acquire(WRITE, 'a'))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as error:
+        await admission.acquire(WRITE, 'a')
+    assert error.value.status_code == 429
+    admission.release(WRITE, 0)
+    await waiting
+
+
+async def test_queue_wait_over_budget():
+    admission = make_admission(capacity=1, write_reserve=0, write_budget=0.05)
+    await admission.acquire(WRITE, 'a')
+    with pytest.raises(HTTPException) as error:
+        await admission.acquire(WRITE, 'b')
+    assert error.value.status_code == 503
+    assert admission.metrics()[WRITE]['queued'] == 0
+
+
+async def test_cancelled_waiter_does_not_take_slot():
+    admission = make_admission(capacity=1, write_reserve=0)
+    await admission.acquire(WRITE, 'a')
+    hold = admission.hold
+    cancelled = asyncio.create_task(admission.acquire(WRITE, 'b'))
+    waiting = asyncio.create_task(admission.acquire(WRITE, 'c'))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    # место освобождается раньше, чем отмененный запрос
+    # уберет себя из очереди
+    admission.release(WRITE, hold)
+    await waiting
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    assert admission.metrics()[WRITE]['active'] == 1
+    assert admission.hold == hold
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import DateTime, Integer, String, column, select, values
+
+from app.api import fast_json
+from app.api.export import export_columns
+from app.api.fast_json import json_page
+from app.api.pagination import make_page, paginate
+from app.models.models import Order, Visit
+from app.schemas.order import OrderDB, OrderPage
+from app.schemas.visit import VisitDB, VisitPage
+from tests.conftest import async_session_maker
+
+# Даты с микросекундами и без, граница суток и високосный год
+DATES = [
+    datetime(2026, 10, 18, 12, 30, 15, 123456),
+    datetime(2026, 10, 18, 12, 30, 15),
+    datetime(2026, 10, 18, 0, 0),
+    datetime(2024, 2, 29, 23, 59, 59, 1),
+]
+
+
+def response_model_body(rows, limit: int, page_schema) -> bytes:
+    """Ответ так, как его собирает FastAPI по response_model
+    с response_model_exclude_none=True."""
+    page = page_schema.model_validate(
+        make_page(rows, limit), from_attributes=True
+    )
+    return JSONResponse(jsonable_encoder(page, exclude_none=True)).body
+
+
+async def order_rows() -> list:
+    source = values(
+        column('id', Integer),
+        column('created_date', DateTime),
+        column('ended_date', DateTime),
+        column('status', String),
+        name='source',
+    ).data([
+        (pk, created, DATES[-pk], status)
+        for pk, (created, status) in enumerate(
+            zip(DATES, ['started', 'ended', 'in_process', 'canceled']),
+            start=1,
+        )
+    ])
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(*(source.c[field] for field in OrderDB.model_fields))
+            .order_by(source.c.created_date, source.c.id)
+        )
+        return result.all()
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def encoder(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(fast_json, 'orjson', None)
+    return request.param
+
+
+@pytest.mark.parametrize('limit', [1, 3, 4, 10])
+async def test_json_page_matches_response_model(encoder, limit):
+    rows = await order_rows()
+    body = json_page(rows, limit).body
+    assert body == response_model_body(rows, limit, OrderPage)
+    assert (b'"next_cursor"' in body) == (len(rows) > limit)
+
+
+@pytest.mark.parametrize('path, model, schema, page_schema', [
+    ('/order/', Order, OrderDB, OrderPage),
+    ('/visit/', Visit, VisitDB, VisitPage),
+])
+async def test_json_page_matches_response_model_on_table(
+    ac, customer, encoder, path, model, schema, page_schema
+):
+    for _ in range(2):
+        response = await ac.post(path, json=customer)
+        assert response.status_code == 200, response.text
+    async with async_session_maker() as session:
+        result = await session.execute(paginate(
+            select(*export_columns(model, schema)), model, None, 1
+        ))
+        rows = result.all()
+    assert len(rows) == 2
+    for limit in (1, 2):
+        assert json_page(rows, limit).body == response_model_body(
+            rows, limit, page_schema
+        )
@@ -0,0 +1,732 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import Session, selectinload
+from starlette_admin import RequestAction
+
+from app.admin.admin import OrderView, VisitView
+from app.api import export as export_module
+from app.api.endpoints import order as order_endpoints
+from app.api.idempotency import IdempotentRequests
+from app.core import admission as admission_module
+from app.core.admission import READ, WRITE
+from app.core.config import settings
+from app.core import replicas as replicas_module
+from app.core.notify import ORDER_EVENTS_CHANNEL, NotifyHub, order_events
+from app.core.replicas import (
+    READ_YOUR_WRITES_COOKIE, ReadYourWritesMiddleware, ReplicaRouter,
+    get_read_session
+)
+from app.crud.changes import changes_watermark, update_changed
+from app.crud.customer_cache import customer_identity_cache
+from app.crud.membership import worker_outlet_index
+from app.crud.order import create_order as create_order_row
+from app.main import app
+from app.models.models import Customer, Order, Outlet, Visit, Worker
+from app.schemas.order import OrderCreateByPhone, OrderDB
+from tests.conftest import (
+    DATABASE_URL_TEST, async_session_maker, engine_test
+)
+from tests.test_admission import make_admission
+
+
+async def create_order(ac: AsyncClient, customer: dict) -> dict:
+    response = await ac.post('/order/', json=customer)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def admission_control(monkeypatch):
+    """Допуск к базе с одним местом для чтений. Чтения идут
+    через настоящий get_read_session в тестовую базу."""
+    control = make_admission()
+    monkeypatch.setattr(admission_module, 'admission', control)
+    monkeypatch.setattr(replicas_module, 'replicas', ReplicaRouter(
+        [], max_lag=5, check_interval=1
+    ))
+    monkeypatch.setattr(replicas_module, 'async_session', async_session_maker)
+    monkeypatch.delitem(app.dependency_overrides, get_read_session)
+    return control
+
+
+async def test_create_order(ac: AsyncClient, customer, query_budget):
+    with query_budget('POST /order/'):
+        response = await ac.post('/order/', json=customer)
+    assert response.status_code == 200, response.text
+    assert response.json()['status'] == 'started'
+
+
+async def test_create_orders_bulk(ac: AsyncClient, customer, query_budget):
+    statuses = ['started', 'in_process', None, 'awaiting', 'ended']
+    orders_in = [
+        {**customer, 'status': status} for status in statuses if status
+    ]
+    orders_in.insert(2, {**customer, 'phone_number': '80000000000'})
+    with query_budget('POST /order/bulk'):
+        response = await ac.post('/order/bulk', json=orders_in)
+    assert response.status_code == 200, response.text
+    results = response.json()
+    assert [result['index'] for result in results] == list(range(5))
+    assert [result['status_code'] for result in results] == [
+        200, 200, 403, 200, 200
+    ]
+    assert 'order' not in results[2] and results[2]['detail']
+    created = [result['order'] for result in results if 'order' in result]
+    assert [order['status'] for order in created] == [
+        status for status in statuses if status
+    ]
+    ids = [order['id'] for order in created]
+    assert ids == sorted(ids)
+    async with async_session_maker() as session:
+        orders = await session.scalars(
+            select(Order).where(Order.id.in_(ids)).order_by(Order.id)
+        )
+        assert [
+            (order.id, order.status, order.customer_id) for order in orders
+        ] == [
+            (order['id'], order['status'], customer['customer_id'])
+            for order in created
+        ]
+
+
+async def test_get_orders(ac: AsyncClient, customer, query_budget):
+    await create_order(ac, customer)
+    with query_budget('GET /order/'):
+        response = await ac.get('/order/', params={'limit': 10})
+    assert response.status_code == 200
+    assert response.json()['items']
+
+
+async def test_get_order(ac: AsyncClient, customer, query_budget):
+    order = await create_order(ac, customer)
+    with query_budget('GET /order/{order_id}'):
+        response = await ac.get(f'/order/{order["id"]}')
+    assert response.status_code == 200
+    with query_budget('GET /order/{order_id}'):
+        response = await ac.get(
+            f'/order/{order["id"]}',
+            headers={'If-None-Match': response.headers['ETag']},
+        )
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize('export_format', ['ndjson', 'csv'])
+async def test_export_orders(ac: AsyncClient, customer, export_format):
+    orders = [await create_order(ac, customer) for _ in range(3)]
+    response = await ac.put(
+        f'/order/change-status/{orders[1]["id"]}',
+        json={
+            'customer_id': customer['customer_id'],
+            'phone_number': customer['phone_number'],
+            'status': 'in_process',
+        },
+    )
+    assert response.status_code == 200, response.text
+    params = {
+        'format': export_format,
+        'status': 'started',
+        'created_start': orders[0]['created_date'],
+        'created_end': orders[-1]['created_date'],
+    }
+    response = await ac.get('/order/export', params=params)
+    assert response.status_code == 200, response.text
+    assert response.headers['content-disposition'] == (
+        f'attachment; filename="orders.{export_format}"'
+    )
+    if export_format == 'csv':
+        header, *rows = csv.reader(io.StringIO(response.text))
+        assert header == list(OrderDB.model_fields)
+        exported = [dict(zip(header, row)) for row in rows]
+    else:
+        exported = [json.loads(line) for line in response.text.splitlines()]
+    async with async_session_maker() as session:
+        expected = await session.scalars(
+            select(Order.id)
+            .where(
+                Order.status == 'started',
+                Order.created_date.between(
+                    datetime.fromisoformat(params['created_start']),
+                    datetime.fromisoformat(params['created_end']),
+                ),
+            )
+            .order_by(Order.created_date, Order.id)
+        )
+        expected = list(expected)
+    assert orders[1]['id'] not in expected
+    assert [int(row['id']) for row in exported] == expected
+    assert {row['status'] for row in exported} == {'started'}
+
+
+async def test_update_order(ac: AsyncClient, customer, query_budget):
+    order = await create_order(ac, customer)
+    with query_budget('PATCH /order/{order_id}'):
+        response = await ac.patch(
+            f'/order/{order["id"]}',
+            json={
+                'customer_id': customer['customer_id'],
+                'phone_number': customer['phone_number'],
+                'worker_id': customer['worker_id'],
+            },
+        )
+    assert response.status_code == 200, response.text
+
+
+async def test_change_order_status(ac: AsyncClient, customer, query_budget):
+    order = await create_order(ac, customer)
+    with query_budget('PUT /order/change-status/{order_id}'):
+        response = await ac.put(
+            f'/order/change-status/{order["id"]}',
+            json={
+                'customer_id': customer['customer_id'],
+                'phone_number': customer['phone_number'],
+                'status': 'in_process',
+            },
+        )
+    assert response.status_code == 200, response.text
+    assert response.json()['status'] == 'in_process'
+    response = await ac.put(
+        f'/order/change-status/{order["id"]}',
+        json={
+            'customer_id': customer['customer_id'],
+            'phone_number': customer['phone_number'],
+            'status': 'started',
+        },
+    )
+    assert response.status_code == 422
+
+
+async def test_change_order_status_concurrently(ac: AsyncClient, customer):
+    order = await create_order(ac, {**customer, 'status': 'in_process'})
+    auth = {
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+    }
+    responses = await asyncio.gather(*(
+        ac.put(
+            f'/order/change-status/{order["id"]}',
+            json={**auth, 'status': status},
+        )
+        for status in ('ended', 'awaiting')
+    ))
+    # второй перевод видит статус после первого и отклоняется
+    assert sorted(
+        response.status_code for response in responses
+    ) == [200, 422]
+
+
+async def test_change_orders_status_requires_selector(
+    ac: AsyncClient, customer
+):
+    response = await ac.put('/order/change-status', json={
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+        'status': 'canceled',
+    })
+    assert response.status_code == 422
+    response = await ac.put('/order/change-status', json={
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+        'status': 'canceled',
+        'order_ids': [],
+    })
+    assert response.status_code == 422
+
+
+async def test_change_orders_status_bulk(
+    ac: AsyncClient, customer, query_budget
+):
+    started = await create_order(ac, customer)
+    in_process = await create_order(
+        ac, {**customer, 'status': 'in_process'}
+    )
+    ended = await create_order(ac, {**customer, 'status': 'ended'})
+    ids = [started['id'], in_process['id'], ended['id'], 10 ** 9]
+    with query_budget('PUT /order/change-status'):
+        response = await ac.put('/order/change-status', json={
+            'customer_id': customer['customer_id'],
+            'phone_number': customer['phone_number'],
+            'status': 'ended',
+            'order_ids': ids,
+        })
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert [order['id'] for order in result['updated']] == [in_process['id']]
+    assert result['updated'][0]['status'] == 'ended'
+    rejected = {
+        order['id']: order.get('status') for order in result['rejected']
+    }
+    assert rejected == {
+        started['id']: 'started', ended['id']: 'ended', 10 ** 9: None
+    }
+
+
+async def test_delete_order(ac: AsyncClient, customer, query_budget):
+    order = await create_order(ac, customer)
+    params = {
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+    }
+    with query_budget('DELETE /order/{order_id}'):
+        response = await ac.delete(f'/order/{order["id"]}', params=params)
+    assert response.status_code == 200, response.text
+    response = await ac.get(f'/order/{order["id"]}')
+    assert response.status_code == 404
+
+
+async def test_query_budget_lists_statements(
+    ac: AsyncClient, customer, query_budget
+):
+    order = await create_order(ac, customer)
+    with pytest.raises(pytest.fail.Exception) as failure:
+        with query_budget('GET /order/{order_id}'):
+            await ac.get(f'/order/{order["id"]}')
+            await ac.get(f'/order/{order["id"]}')
+    message = str(failure.value)
+    assert 'GET /order/{order_id}: 2 SQL-запросов при бюджете 1' in message
+    assert '2. SELECT' in message
+
+
+async def test_order_with_token(ac: AsyncClient, customer, query_budget):
+    with query_budget('POST /auth/login'):
+        response = await ac.post('/auth/login', json={
+            'customer_id': customer['customer_id'],
+            'phone_number': customer['phone_number'],
+        })
+    assert response.status_code == 200, response.text
+    headers = {
+        'Authorization': f'Bearer {response.json()["access_token"]}'
+    }
+    with query_budget('POST /order/') as statements:
+        response = await ac.post(
+            '/order/', json={'worker_id': customer['worker_id']},
+            headers=headers,
+        )
+    assert response.status_code == 200, response.text
+    assert not any(
+        'FROM customer' in statement for statement, _ in statements
+    )
+    order_id = response.json()['id']
+    with query_budget('DELETE /order/{order_id}'):
+        response = await ac.delete(f'/order/{order_id}', headers=headers)
+    assert response.status_code == 200, response.text
+
+
+async def test_order_token_rejected(ac: AsyncClient, customer):
+    response = await ac.post('/auth/login', json={
+        'customer_id': customer['customer_id'],
+        'phone_number': '80000000000',
+    })
+    assert response.status_code == 403
+    response = await ac.post('/auth/login', json={
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+    })
+    token = response.json()['access_token']
+    response = await ac.post(
+        '/order/', json={}, headers={'Authorization': f'Bearer {token}x'}
+    )
+    assert response.status_code == 401
+    response = await ac.post(
+        '/order/',
+        json={'customer_id': customer['customer_id'] + 1000},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    assert response.status_code == 403
+    response = await ac.post('/order/', json={})
+    assert response.status_code == 401
+    response = await ac.post(
+        '/order/', json={'customer_id': customer['customer_id']}
+    )
+    assert response.status_code == 401
+    # не ASCII в подписи
+    response = await ac.post(
+        '/order/', json={}, headers={'Authorization': b'Bearer x.\xe9'}
+    )
+    assert response.status_code == 401
+    response = await ac.post('/order/bulk', json=[
+        {'outlet_id': customer['outlet_id'],
+         'worker_id': customer['worker_id']},
+    ])
+    assert response.status_code == 422
+
+
+async def test_membership_index_updates_per_link(
+    ac: AsyncClient, customer, monkeypatch
+):
+    monkeypatch.setattr(settings, 'MEMBERSHIP_INDEX', True)
+    async with async_session_maker() as session:
+        worker = Worker(
+            name='Работник другой точки',
+            phone_number='89000000101',
+            outlets=[Outlet(name='Другая точка')],
+        )
+        session.add(worker)
+        await session.commit()
+        worker_id = worker.id
+    order_in = {**customer, 'worker_id': worker_id}
+    response = await ac.post('/order/', json=order_in)
+    assert response.status_code == 404
+    loaded_at = worker_outlet_index._outlets[worker_id][0]
+
+    async with async_session_maker() as session:
+        worker = await session.scalar(
+            select(Worker)
+            .options(selectinload(Worker.outlets))
+            .where(Worker.id == worker_id)
+        )
+        worker.outlets.append(
+            await session.get(Outlet, customer['outlet_id'])
+        )
+        await session.commit()
+    # запись работника дополнена, а не перечитана
+    assert worker_outlet_index._outlets[worker_id][0] == loaded_at
+    response = await ac.post('/order/', json=order_in)
+    assert response.status_code == 200, response.text
+
+
+async def test_changes_watermark_skips_open_writer(
+    ac: AsyncClient, customer
+):
+    order = await create_order(ac, customer)
+    async with async_session_maker() as writer:
+        changed = (await writer.execute(
+            update_changed(Order, order['id'], {})
+        )).one()
+        async with async_session_maker() as reader:
+            # чтение не ждет незакоммиченную запись
+            watermark = await asyncio.wait_for(
+                changes_watermark(reader), timeout=1
+            )
+            assert watermark < changed.change_seq
+            await writer.commit()
+            assert await changes_watermark(reader) >= changed.change_seq
+
+
+async def test_customer_change_invalidates_cache(ac: AsyncClient, customer):
+    await create_order(ac, customer)
+    customer_id = customer['customer_id']
+    assert await customer_identity_cache.get(customer_id) is not None
+    async with async_session_maker() as session:
+        db_customer = await session.get(Customer, customer_id)
+        db_customer.name = 'Заказчик с новым именем'
+        await session.commit()
+    assert await customer_identity_cache.get(customer_id) is None
+
+
+async def test_customer_change_in_sync_session(
+    ac: AsyncClient, customer, monkeypatch
+):
+    await create_order(ac, customer)
+    customer_id = customer['customer_id']
+    assert await customer_identity_cache.get(customer_id) is not None
+    monkeypatch.setattr(customer_identity_cache, 'redis_url', None)
+    engine = create_engine(DATABASE_URL_TEST.replace('asyncpg', 'psycopg'))
+    with Session(engine) as session:
+        session.get(Customer, customer_id).name = 'Заказчик из sync'
+        session.commit()
+    engine.dispose()
+    assert await customer_identity_cache.get(customer_id) is None
+
+
+async def test_idempotency_key_is_per_customer(ac: AsyncClient, customer):
+    async with async_session_maker() as session:
+        other = Customer(
+            name='Другой заказчик',
+            phone_number='89000000103',
+            outlet_id=customer['outlet_id'],
+        )
+        session.add(other)
+        await session.commit()
+    other_customer = {
+        **customer,
+        'customer_id': other.id,
+        'phone_number': other.phone_number,
+    }
+    headers = {'Idempotency-Key': 'one-key-for-both'}
+    first = await ac.post('/order/', json=customer, headers=headers)
+    second = await ac.post('/order/', json=other_customer, headers=headers)
+    assert first.status_code == 200, first.text
+    assert second.status_code == 200, second.text
+    assert first.json()['id'] != second.json()['id']
+    replay = await ac.post('/order/', json=customer, headers=headers)
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert replay.json() == first.json()
+
+
+async def test_idempotency_retry_waits_in_other_process(customer):
+    """Повтор в другом процессе (свой IdempotentRequests) ждет
+    ответ первого запроса, а не получает 409."""
+    first_process = IdempotentRequests(ttl=60, lock_timeout=5)
+    second_process = IdempotentRequests(ttl=60, lock_timeout=5)
+    order_in = OrderCreateByPhone(**customer)
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_create(session):
+        started.set()
+        await release.wait()
+        return await create_order_row(order_in, session, commit=False)
+
+    async def second_create():
+        raise AssertionError('повтор не должен создавать заказ')
+
+    async with async_session_maker() as first, \
+            async_session_maker() as second:
+        original = asyncio.create_task(first_process.run(
+            first, 'POST /order/', customer['customer_id'], 'slow-key',
+            order_in, lambda: slow_create(first), OrderDB,
+        ))
+        await started.wait()
+        retry = asyncio.create_task(second_process.run(
+            second, 'POST /order/', customer['customer_id'], 'slow-key',
+            order_in, second_create, OrderDB,
+        ))
+        await asyncio.sleep(0.2)
+        assert not retry.done()
+        release.set()
+        body = await original
+        replay = await asyncio.wait_for(retry, timeout=5)
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert json.loads(replay.body) == body
+
+
+async def test_idempotency_response_commits_with_order(customer):
+    """Если ответ не сохранился, заказ тоже не сохраняется,
+    и повтор с тем же ключом не создает дубликат."""
+    requests = IdempotentRequests(ttl=60, lock_timeout=5)
+    order_in = OrderCreateByPhone(**customer)
+
+    class BrokenResponse(OrderDB):
+        @classmethod
+        def model_validate(cls, obj, **kwargs):
+            raise RuntimeError('ответ не собран')
+
+    async def count_orders() -> int:
+        async with async_session_maker() as session:
+            return await session.scalar(
+                select(func.count()).select_from(Order)
+                .where(Order.customer_id == customer['customer_id'])
+            )
+
+    async def run(response_model):
+        async with async_session_maker() as session:
+            return await requests.run(
+                session, 'POST /order/', customer['customer_id'],
+                'atomic-key', order_in,
+                lambda: create_order_row(order_in, session, commit=False),
+                response_model,
+            )
+
+    before = await count_orders()
+    with pytest.raises(RuntimeError):
+        await run(BrokenResponse)
+    assert await count_orders() == before
+    body = await run(OrderDB)
+    assert await count_orders() == before + 1
+    replay = await run(OrderDB)
+    assert json.loads(replay.body) == body
+
+
+async def open_stream(path: str, params: dict, queue_size: int = 0):
+    """Запрос к приложению напрямую через ASGI: httpx отдает ответ
+    только целиком, а поток событий не заканчивается. Возвращает
+    задачу запроса, очередь сообщений ответа и событие отключения.
+    С queue_size ответ останавливается, пока очередь полна."""
+    messages = asyncio.Queue(queue_size)
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': urlencode(params).encode(),
+        'headers': [(b'host', b'test')],
+        'client': ('127.0.0.1', 50000),
+        'server': ('test', 80),
+    }
+    task = asyncio.create_task(app(scope, receive, messages.put))
+    return task, messages, disconnected
+
+
+async def next_event(messages: asyncio.Queue) -> dict:
+    while True:
+        message = await asyncio.wait_for(messages.get(), timeout=5)
+        body = message.get('body', b'').decode()
+        for line in body.splitlines():
+            if line.startswith('data: '):
+                return json.loads(line[len('data: '):])
+
+
+async def test_order_events_stream(
+    ac: AsyncClient, customer, monkeypatch, admission_control
+):
+    hub = NotifyHub(
+        dsn=DATABASE_URL_TEST.replace('postgresql+asyncpg', 'postgresql'),
+        channel=ORDER_EVENTS_CHANNEL,
+        keys_of=order_events.keys_of,
+        queue_size=10,
+        reconnect_delay=0.1,
+    )
+    monkeypatch.setattr(order_endpoints, 'order_events', hub)
+    task, messages, disconnected = await open_stream('/order/events', {
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+    })
+    start = await asyncio.wait_for(messages.get(), timeout=5)
+    assert start['status'] == 200
+    # подписка проверяется как чтение, и место отдается до потока
+    metrics = admission_control.metrics()
+    assert (metrics[READ]['admitted'], metrics[WRITE]['admitted']) == (1, 0)
+    assert metrics[READ]['active'] == 0
+    for _ in range(100):
+        if hub.connected:
+            break
+        await asyncio.sleep(0.05)
+    assert hub.connected
+
+    order = await create_order(ac, customer)
+    event = await next_event(messages)
+    assert event['event'] == 'created'
+    assert (event['id'], event['status']) == (order['id'], order['status'])
+    response = await ac.put(f'/order/change-status/{order["id"]}', json={
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+        'status': 'in_process',
+    })
+    assert response.status_code == 200, response.text
+    event = await next_event(messages)
+    assert event['event'] == 'updated'
+    assert (event['id'], event['status']) == (order['id'], 'in_process')
+
+    disconnected.set()
+    await asyncio.wait_for(task, timeout=5)
+    for _ in range(100):
+        if not hub.connected:
+            break
+        await asyncio.sleep(0.05)
+    # последний подписчик ушел - LISTEN-соединение закрыто
+    assert not hub.connected
+    assert hub.subscribers == 0
+    await hub.close()
+
+
+async def test_export_releases_admission_slot(
+    ac: AsyncClient, customer, monkeypatch, admission_control
+):
+    await create_order(ac, customer)
+    monkeypatch.setattr(export_module, 'export_slots', asyncio.Semaphore(1))
+    # очередь на одно сообщение: выгрузка встает посреди потока
+    task, messages, _ = await open_stream(
+        '/order/export', {'format': 'csv'}, queue_size=1
+    )
+    start = await asyncio.wait_for(messages.get(), timeout=5)
+    assert start['status'] == 200
+    for _ in range(100):
+        if messages.full():
+            break
+        await asyncio.sleep(0.01)
+    assert export_module.export_slots.locked()
+    assert admission_control.metrics()[READ]['active'] == 0
+    # единственное место чтения свободно, а вторая выгрузка - нет
+    response = await ac.get('/order/', params={'limit': 1})
+    assert response.status_code == 200, response.text
+    response = await ac.get('/order/export')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+    while (await asyncio.wait_for(messages.get(), timeout=5)).get(
+        'more_body'
+    ):
+        pass
+    await asyncio.wait_for(task, timeout=5)
+    assert not export_module.export_slots.locked()
+    response = await ac.get('/order/export')
+    assert response.status_code == 200
+
+
+async def test_read_replica_routing(customer, monkeypatch):
+    router = ReplicaRouter(
+        [DATABASE_URL_TEST], max_lag=5, check_interval=0.05
+    )
+    monkeypatch.setattr(replicas_module, 'replicas', router)
+    monkeypatch.setattr(replicas_module, 'async_session', async_session_maker)
+    monkeypatch.delitem(app.dependency_overrides, get_read_session)
+    # реплика - та же тестовая база через свой движок, фоновые
+    # проверки отставания не считаются
+    statements = {'replica': 0, 'primary': 0}
+
+    def count(name):
+        def listener(conn, cursor, statement, *args) -> None:
+            if 'pg_is_in_recovery' not in statement:
+                statements[name] += 1
+        return listener
+
+    event.listen(
+        router.replicas[0].engine.sync_engine,
+        'before_cursor_execute', count('replica'),
+    )
+    primary_listener = count('primary')
+    event.listen(
+        engine_test.sync_engine, 'before_cursor_execute', primary_listener
+    )
+    router.start()
+    try:
+        for _ in range(100):
+            if router.replicas[0].lag is not None:
+                break
+            await asyncio.sleep(0.01)
+        async with AsyncClient(
+            app=ReadYourWritesMiddleware(app, sticky=10),
+            base_url='http://test',
+        ) as client:
+            response = await client.get('/order/')
+            assert response.status_code == 200
+            assert statements == {'replica': 1, 'primary': 0}
+
+            # отставание 0 больше допустимого - чтение из основной базы
+            router.max_lag = -1
+            response = await client.get('/order/')
+            assert response.status_code == 200
+            assert statements == {'replica': 1, 'primary': 1}
+            router.max_lag = 5
+
+            # после записи клиент читает свои данные из основной базы
+            response = await client.post('/order/', json=customer)
+            assert response.status_code == 200, response.text
+            assert READ_YOUR_WRITES_COOKIE in response.cookies
+            statements.update(replica=0, primary=0)
+            response = await client.get('/order/')
+            assert response.status_code == 200
+            assert statements == {'replica': 0, 'primary': 1}
+    finally:
+        event.remove(
+            engine_test.sync_engine, 'before_cursor_execute', primary_listener
+        )
+        await router.close()
+
+
+@pytest.mark.parametrize('view', [OrderView(Order), VisitView(Visit)])
+def test_admin_forms_skip_server_fields(view):
+    def fields(action):
+        return {field.name for field in view.get_fields_list(None, action)}
+
+    for action in (RequestAction.LIST, RequestAction.DETAIL):
+        assert {'version', 'change_seq'} <= fields(action)
+    for action in (RequestAction.CREATE, RequestAction.EDIT):
+        assert not {'version', 'change_seq'} & fields(action)
@@ -0,0 +1,86 @@
+import asyncio
+from typing import Optional
+
+from httpx import AsyncClient
+from sqlalchemy import Date, cast, func, select
+
+from app.crud.report import RollupRefresher
+from app.models.models import Order
+from app.models.report import OrderRollup
+from tests.conftest import async_session_maker
+
+
+async def rollup_matches_orders(
+    refresher: Optional[RollupRefresher] = None
+) -> bool:
+    async with async_session_maker() as session:
+        if refresher is not None:
+            await refresher.refresh(session)
+        rollup = await session.execute(
+            select(
+                OrderRollup.day, OrderRollup.outlet_id,
+                OrderRollup.worker_id, OrderRollup.status,
+                OrderRollup.orders,
+            )
+        )
+        key = (
+            cast(Order.created_date, Date),
+            func.coalesce(Order.outlet_id, 0),
+            func.coalesce(Order.worker_id, 0),
+            Order.status,
+        )
+        orders = await session.execute(
+            select(*key, func.count()).group_by(*key)
+        )
+        return set(rollup.all()) == set(orders.all())
+
+
+async def test_order_rollup(ac: AsyncClient, customer, query_budget):
+    refresher = RollupRefresher(interval=0, batch=2)
+    auth = {
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+    }
+    ids = []
+    for _ in range(3):
+        response = await ac.post('/order/', json=customer)
+        ids.append(response.json()['id'])
+    assert await rollup_matches_orders(refresher)
+
+    response = await ac.put(
+        f'/order/change-status/{ids[0]}',
+        json={**auth, 'status': 'in_process'},
+    )
+    assert response.status_code == 200, response.text
+    response = await ac.delete(f'/order/{ids[1]}', params=auth)
+    assert response.status_code == 200, response.text
+    assert await rollup_matches_orders(refresher)
+
+    # отчет только читает сводку, обновленную выше
+    with query_budget('GET /report/orders'):
+        response = await ac.get(
+            '/report/orders', params={'outlet_id': customer['outlet_id']}
+        )
+    assert response.status_code == 200
+    counts = {row['status']: row['orders'] for row in response.json()}
+    assert counts['in_process'] >= 1
+    with query_budget('GET /report/visits'):
+        response = await ac.get('/report/visits')
+    assert response.status_code == 200
+
+
+async def test_rollup_refresher_runs_in_background(ac: AsyncClient, customer):
+    refresher = RollupRefresher(
+        interval=0.01, batch=100, session_maker=async_session_maker
+    )
+    await ac.post('/order/', json=customer)
+    refresher.start()
+    try:
+        for _ in range(100):
+            if await rollup_matches_orders():
+                break
+            await asyncio.sleep(0.01)
+        else:
+            raise AssertionError('сводка не обновлена фоновой задачей')
+    finally:
+        await refresher.close()
@@ -0,0 +1,89 @@
+from httpx import AsyncClient
+
+
+async def changes_since(ac: AsyncClient, since: int, limit: int) -> list:
+    """Все порции GET /sync/changes, начиная с since."""
+    pages = []
+    while True:
+        response = await ac.get(
+            '/sync/changes', params={'since': since, 'limit': limit}
+        )
+        assert response.status_code == 200, response.text
+        page = response.json()
+        pages.append(page)
+        assert page['next_since'] >= since
+        since = page['next_since']
+        if not page['has_more']:
+            return pages
+
+
+def collect(pages: list) -> tuple[list, list, list]:
+    orders, visits, deleted = [], [], []
+    for page in pages:
+        orders.extend(page['orders'])
+        visits.extend(page['visits'])
+        deleted.extend(
+            (obj['entity'], obj['id']) for obj in page['deleted']
+        )
+    return orders, visits, deleted
+
+
+async def test_sync_changes(ac: AsyncClient, customer):
+    since = (await changes_since(ac, 0, 500))[-1]['next_since']
+    auth = {
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+    }
+    orders = []
+    for _ in range(3):
+        response = await ac.post('/order/', json=customer)
+        assert response.status_code == 200, response.text
+        orders.append(response.json())
+    visits = []
+    for order in orders[:2]:
+        response = await ac.post(
+            '/visit/', json={**customer, 'order_id': order['id']}
+        )
+        assert response.status_code == 200, response.text
+        visits.append(response.json())
+    response = await ac.put(
+        f'/order/change-status/{orders[1]["id"]}',
+        json={**auth, 'status': 'in_process'},
+    )
+    assert response.status_code == 200, response.text
+    response = await ac.patch(
+        f'/visit/{visits[1]["id"]}',
+        json={**auth, 'created_date': '2024-01-01T00:00:00'},
+    )
+    assert response.status_code == 200, response.text
+    # заказ удаляется вместе со своим посещением
+    response = await ac.delete(f'/order/{orders[0]["id"]}', params=auth)
+    assert response.status_code == 200, response.text
+
+    for limit in (1, 2, 500):
+        pages = await changes_since(ac, since, limit)
+        assert all(
+            len(page['orders']) + len(page['visits']) + len(page['deleted'])
+            <= limit
+            for page in pages
+        )
+        changed_orders, changed_visits, deleted = collect(pages)
+        # каждый объект приходит один раз, в последнем состоянии
+        assert sorted(order['id'] for order in changed_orders) == [
+            orders[1]['id'], orders[2]['id']
+        ]
+        assert {order['id']: order['status'] for order in changed_orders}[
+            orders[1]['id']
+        ] == 'in_process'
+        assert changed_visits == [
+            {'id': visits[1]['id'], 'created_date': '2024-01-01T00:00:00'}
+        ]
+        assert sorted(deleted) == [
+            ('order', orders[0]['id']), ('visit', visits[0]['id'])
+        ]
+
+    last = pages[-1]['next_since']
+    assert await changes_since(ac, last, 500) == [{
+        'orders': [], 'visits': [], 'deleted': [],
+        'next_since': last, 'has_more': False,
+    }]
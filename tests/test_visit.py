@@ -0,0 +1,257 @@
+import asyncio
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from app.api.validators import SYNC_REJECTED_BY_DB
+from app.core.metrics import _request_db, track_engine, untrack_engine
+from app.crud.group_commit import VisitGroupCommit
+from app.models.models import Order, Visit
+from app.schemas.visit import VisitDB
+from tests.conftest import async_session_maker, engine_test
+
+
+async def create_visit(ac: AsyncClient, customer: dict) -> dict:
+    response = await ac.post('/order/', json=customer)
+    assert response.status_code == 200, response.text
+    response = await ac.post(
+        '/visit/', json={**customer, 'order_id': response.json()['id']}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_create_visit(ac: AsyncClient, customer, query_budget):
+    response = await ac.post('/order/', json=customer)
+    order_id = response.json()['id']
+    with query_budget('POST /visit/'):
+        response = await ac.post(
+            '/visit/', json={**customer, 'order_id': order_id}
+        )
+    assert response.status_code == 200, response.text
+
+
+async def test_get_visits(ac: AsyncClient, customer, query_budget):
+    await create_visit(ac, customer)
+    with query_budget('GET /visit/'):
+        response = await ac.get('/visit/', params={'limit': 10})
+    assert response.status_code == 200
+    assert response.json()['items']
+
+
+async def test_get_visit(ac: AsyncClient, customer, query_budget):
+    visit = await create_visit(ac, customer)
+    with query_budget('GET /visit/{visit_id}'):
+        response = await ac.get(f'/visit/{visit["id"]}')
+    assert response.status_code == 200
+    with query_budget('GET /visit/{visit_id}'):
+        response = await ac.get(
+            f'/visit/{visit["id"]}',
+            headers={'If-None-Match': response.headers['ETag']},
+        )
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize('export_format', ['ndjson', 'csv'])
+async def test_export_visits(ac: AsyncClient, customer, export_format):
+    visits = [await create_visit(ac, customer) for _ in range(4)]
+    params = {
+        'format': export_format,
+        'created_start': visits[0]['created_date'],
+        'created_end': visits[2]['created_date'],
+    }
+    response = await ac.get('/visit/export', params=params)
+    assert response.status_code == 200, response.text
+    assert response.headers['content-disposition'] == (
+        f'attachment; filename="visits.{export_format}"'
+    )
+    if export_format == 'csv':
+        header, *rows = csv.reader(io.StringIO(response.text))
+        assert header == list(VisitDB.model_fields)
+        exported = [dict(zip(header, row)) for row in rows]
+    else:
+        exported = [json.loads(line) for line in response.text.splitlines()]
+    async with async_session_maker() as session:
+        expected = await session.scalars(
+            select(Visit.id)
+            .where(Visit.created_date.between(
+                datetime.fromisoformat(params['created_start']),
+                datetime.fromisoformat(params['created_end']),
+            ))
+            .order_by(Visit.created_date, Visit.id)
+        )
+        expected = list(expected)
+    assert visits[3]['id'] not in expected
+    assert [int(row['id']) for row in exported] == expected
+    assert [row['created_date'] for row in exported[:3]] == [
+        visit['created_date'] for visit in visits[:3]
+    ]
+
+
+async def test_order_expiry_in_utc(ac: AsyncClient, customer, monkeypatch):
+    """Срок заказа сравнивается с текущим временем UTC, а не с местным
+    временем сервера (здесь UTC+5)."""
+    orders = []
+    for _ in range(2):
+        response = await ac.post('/order/', json=customer)
+        assert response.status_code == 200, response.text
+        orders.append(response.json())
+    async with async_session_maker() as session:
+        for order, shift in zip(orders, ('1 hour', '-1 hour')):
+            await session.execute(
+                update(Order)
+                .where(Order.id == order['id'])
+                .values(ended_date=text(
+                    f"TIMEZONE('utc', now()) + INTERVAL '{shift}'"
+                ))
+            )
+        await session.commit()
+    monkeypatch.setenv('TZ', 'Etc/GMT-5')
+    time.tzset()
+    try:
+        statuses = []
+        for order in orders:
+            response = await ac.post(
+                '/visit/', json={**customer, 'order_id': order['id']}
+            )
+            statuses.append(response.status_code)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    assert statuses == [200, 422]
+
+
+async def test_update_visit(ac: AsyncClient, customer, query_budget):
+    visit = await create_visit(ac, customer)
+    with query_budget('PATCH /visit/{visit_id}'):
+        response = await ac.patch(
+            f'/visit/{visit["id"]}',
+            json={
+                'customer_id': customer['customer_id'],
+                'phone_number': customer['phone_number'],
+                'created_date': '2024-01-01T00:00:00',
+            },
+        )
+    assert response.status_code == 200, response.text
+    assert response.json()['created_date'] == '2024-01-01T00:00:00'
+
+
+async def test_sync_visits(ac: AsyncClient, customer):
+    orders = []
+    for _ in range(2):
+        response = await ac.post('/order/', json=customer)
+        assert response.status_code == 200, response.text
+        orders.append(response.json())
+    visit = await create_visit(ac, customer)
+    auth = {
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+    }
+    items = [
+        {'op': 'create', 'visit': {**customer, 'order_id': orders[0]['id']}},
+        {
+            'op': 'update',
+            'visit_id': visit['id'],
+            'visit': {**auth, 'created_date': '2024-01-01T00:00:00'},
+        },
+        {
+            'op': 'create',
+            'visit': {
+                **customer,
+                'order_id': orders[1]['id'],
+                'phone_number': '80000000000',
+            },
+        },
+        # проходит проверки, но работника нет в базе: запись
+        # отвергает внешний ключ, и пакет повторяется в SAVEPOINT
+        {'op': 'create', 'visit': {**customer, 'worker_id': 10 ** 9}},
+        {'op': 'create', 'visit': {**customer, 'order_id': orders[1]['id']}},
+        {'op': 'update', 'visit_id': 10 ** 9, 'visit': auth},
+    ]
+    response = await ac.post(
+        '/visit/sync', json={'device_id': 'test', 'items': items}
+    )
+    assert response.status_code == 200, response.text
+    results = response.json()
+    assert [result['index'] for result in results] == list(range(6))
+    assert [result['status_code'] for result in results] == [
+        200, 200, 403, 409, 200, 404
+    ]
+    assert results[3]['detail'] == SYNC_REJECTED_BY_DB
+    assert all('id' not in results[index] for index in (2, 3, 5))
+    assert results[1]['id'] == visit['id']
+    async with async_session_maker() as session:
+        synced = {
+            visit.id: visit for visit in await session.scalars(
+                select(Visit).where(Visit.id.in_(
+                    results[index]['id'] for index in (0, 1, 4)
+                ))
+            )
+        }
+    assert synced[results[0]['id']].order_id == orders[0]['id']
+    assert synced[results[4]['id']].order_id == orders[1]['id']
+    assert synced[visit['id']].created_date == datetime(2024, 1, 1)
+
+
+async def test_delete_visit(ac: AsyncClient, customer, query_budget):
+    visit = await create_visit(ac, customer)
+    params = {
+        'customer_id': customer['customer_id'],
+        'phone_number': customer['phone_number'],
+    }
+    with query_budget('DELETE /visit/{visit_id}'):
+        response = await ac.delete(f'/visit/{visit["id"]}', params=params)
+    assert response.status_code == 200, response.text
+    response = await ac.get(f'/visit/{visit["id"]}')
+    assert response.status_code == 404
+
+
+async def test_visit_group_commit(customer):
+    writer = VisitGroupCommit(
+        max_rows=10, max_delay=0.01, session_maker=async_session_maker
+    )
+    values = {
+        'outlet_id': customer['outlet_id'],
+        'customer_id': customer['customer_id'],
+        'worker_id': customer['worker_id'],
+        'order_id': None,
+    }
+    results = await asyncio.gather(
+        *(writer.create(values) for _ in range(5)),
+        writer.create({**values, 'worker_id': 10 ** 6}),
+        return_exceptions=True,
+    )
+    await writer.close()
+    assert isinstance(results.pop(), IntegrityError)
+    assert len({row.id for row in results}) == 5
+    assert writer.stats()['batches'] == 1
+
+
+async def test_visit_group_commit_outside_request_context(customer):
+    writer = VisitGroupCommit(
+        max_rows=10, max_delay=0.01, session_maker=async_session_maker
+    )
+    values = {
+        'outlet_id': customer['outlet_id'],
+        'customer_id': customer['customer_id'],
+        'worker_id': customer['worker_id'],
+        'order_id': None,
+    }
+    request_db = [0, 0.0, 0.0]
+    track_engine(engine_test)
+    token = _request_db.set(request_db)
+    try:
+        await writer.create(values)
+    finally:
+        _request_db.reset(token)
+        untrack_engine(engine_test)
+    await writer.close()
+    # пакет пишет фоновая задача, не запрос, который ее запустил
+    assert request_db[0] == 0